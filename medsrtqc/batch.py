@@ -0,0 +1,284 @@
+"""
+QC operations are written against a single :class:`medsrtqc.core.Profile`;
+however, many of the underlying computations can be done for a whole
+day's worth of profiles at once. A :class:`ProfileBatch` stores each
+parameter of many profiles as one concatenated :class:`medsrtqc.core.Trace`
+and an array of offsets (a ragged or "CSR" layout) so that vectorized
+code can operate on all profiles at once, while per-profile
+:class:`medsrtqc.core.Profile` views of the same memory let existing
+QC operations run unchanged.
+"""
+
+from typing import Iterable
+import numpy as np
+from numpy.ma import MaskedArray
+from .core import Trace, Profile
+
+# profile attributes set by VMSProfile.prepare() and NetCDFProfile.prepare()
+# that are carried along with each profile in a batch
+_META_ATTRS = ('wmo', 'cycle_number', 'direction', 'parking_pres', 'latitude', 'longitude')
+
+_TRACE_ATTRS = ('value', 'qc', 'adjusted', 'adjusted_error', 'adjusted_qc', 'pres', 'mtime')
+
+
+class BatchProfile(Profile):
+    """
+    A :class:`medsrtqc.core.Profile` view of one profile within a
+    :class:`ProfileBatch`. Extracted :class:`medsrtqc.core.Trace` objects
+    are read-only slices of the batch's arrays and assigning a
+    :class:`medsrtqc.core.Trace` writes into those arrays. These objects
+    are normally created by indexing a :class:`ProfileBatch`.
+    """
+
+    def __init__(self, batch, i):
+        super().__init__()
+        self._batch = batch
+        self._i = i
+
+        for attr in _META_ATTRS:
+            value = batch.meta[attr][i]
+            if value is not None:
+                setattr(self, attr, value)
+
+        if batch.qc_tests is not None and batch.has_qc_tests[i]:
+            # a view so that QCx.update_safely() writes into the batch
+            self.qc_tests = batch.qc_tests[i]
+
+    def keys(self) -> Iterable[str]:
+        return self._batch._keys[self._i]
+
+    def __getitem__(self, k) -> Trace:
+        if k not in self.keys():
+            raise KeyError(k)
+        return self._batch._slice(k, self._i).readonly_view()
+
+    def __setitem__(self, k, v):
+        if k not in self.keys():
+            raise KeyError(f"Can't add new parameter '{k}' to a BatchProfile")
+
+        column = self._batch._columns[k]
+        s = self._batch._levels(k, self._i)
+        if len(v) != s.stop - s.start:
+            msg = f"Expected trace for '{k}' with size {s.stop - s.start} but got {len(v)}"
+            raise ValueError(msg)
+
+        for attr in _TRACE_ATTRS:
+            new = v.masked(attr)
+            # avoid allocating a column that is missing for all profiles
+            if _is_absent(column, attr) and np.all(np.ma.getmaskarray(new)):
+                continue
+            getattr(column, attr)[s] = new
+
+        self._batch._modified.add((self._i, k))
+
+    def update_qcx(self):
+        # qc_tests is a view into the batch and is written to
+        # the source profile by ProfileBatch.write_back()
+        pass
+
+
+class ProfileBatch:
+    """
+    A columnar container for many :class:`medsrtqc.core.Profile` objects.
+    For every parameter, the :class:`medsrtqc.core.Trace` attributes of all
+    profiles are concatenated into one array and ``offsets(k)[i]:offsets(k)[i + 1]``
+    gives the levels belonging to profile ``i``. Profiles that do not
+    contain a parameter have zero levels for it. These objects are
+    normally created using :meth:`from_profiles`.
+
+    >>> from medsrtqc.batch import ProfileBatch
+    >>> from medsrtqc.vms import read_vms_profiles
+    >>> from medsrtqc.resources import resource_path
+    >>> profiles = read_vms_profiles(resource_path('BINARY_VMS.DAT'))
+    >>> batch = ProfileBatch.from_profiles(profiles)
+    >>> batch.column('TEMP').value.shape
+    >>> batch[1]['TEMP']
+    """
+
+    def __init__(self, columns, offsets, keys, meta=None, qc_tests=None,
+                 has_qc_tests=None, profiles=None):
+        """
+        :param columns: A ``dict`` of concatenated :class:`medsrtqc.core.Trace`
+            objects.
+        :param offsets: A ``dict`` with the same keys as ``columns`` of
+            integer arrays with one more element than there are profiles.
+        :param keys: A ``list()`` with the parameter names for each profile.
+        :param meta: A ``dict`` of per-profile lists of profile attributes
+            (e.g., ``wmo``, ``cycle_number``).
+        :param qc_tests: An optional array of QCP/QCF test arrays with one
+            row per profile.
+        :param has_qc_tests: A boolean array indicating which profiles
+            have ``qc_tests``.
+        :param profiles: The source profiles (if any) used by :meth:`write_back`.
+        """
+
+        self._columns = dict(columns)
+        self._offsets = {k: np.asarray(v, dtype=np.int64) for k, v in offsets.items()}
+        self._keys = [tuple(k) for k in keys]
+        self._n = len(self._keys)
+
+        for k, off in self._offsets.items():
+            if len(off) != self._n + 1 or off[-1] != len(self._columns[k]):
+                raise ValueError(f"Offsets for '{k}' do not match the number of profiles or levels")
+
+        meta = {} if meta is None else dict(meta)
+        self.meta = {attr: list(meta.get(attr, [None] * self._n)) for attr in _META_ATTRS}
+
+        self.qc_tests = qc_tests
+        if has_qc_tests is None:
+            has_qc_tests = np.repeat(qc_tests is not None, self._n)
+        self.has_qc_tests = np.asarray(has_qc_tests, dtype=bool)
+
+        self._profiles = profiles
+        self._modified = set()
+
+    @classmethod
+    def from_profiles(cls, profiles, keys=None):
+        """
+        Create a :class:`ProfileBatch` from an iterable of
+        :class:`medsrtqc.core.Profile` objects (e.g., those returned by
+        :func:`medsrtqc.vms.read_vms_profiles` or :func:`medsrtqc.nc.read_nc_profile`).
+        Profile attributes set by ``prepare()`` (``wmo``, ``cycle_number``,
+        ``direction``, ``parking_pres``, and ``qc_tests``) are
+        included if present.
+
+        :param profiles: An iterable of :class:`medsrtqc.core.Profile` objects.
+        :param keys: An optional subset of parameters to include.
+        """
+
+        profiles = list(profiles)
+        profile_keys = []
+        all_keys = {}
+        for profile in profiles:
+            k_profile = tuple(k for k in profile.keys() if keys is None or k in keys)
+            profile_keys.append(k_profile)
+            for k in k_profile:
+                all_keys[k] = None
+
+        columns = {}
+        offsets = {}
+        for k in all_keys:
+            traces = [profile[k] if k in k_profile else None for profile, k_profile in zip(profiles, profile_keys)]
+            lengths = [0 if trace is None else len(trace) for trace in traces]
+            offsets[k] = np.concatenate([[0], np.cumsum(lengths)])
+            columns[k] = _concatenate_traces([trace for trace in traces if trace is not None])
+
+        meta = {attr: [getattr(profile, attr, None) for profile in profiles] for attr in _META_ATTRS}
+
+        has_qc_tests = np.array([hasattr(profile, 'qc_tests') for profile in profiles], dtype=bool)
+        qc_tests = None
+        if np.any(has_qc_tests):
+            qc_tests = np.zeros((len(profiles), 2, 32), dtype=int)
+            for i, profile in enumerate(profiles):
+                if has_qc_tests[i]:
+                    qc_tests[i] = profile.qc_tests
+
+        return cls(columns, offsets, profile_keys, meta=meta,
+                   qc_tests=qc_tests, has_qc_tests=has_qc_tests, profiles=profiles)
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i) -> BatchProfile:
+        if i < 0:
+            i += self._n
+        if i < 0 or i >= self._n:
+            raise IndexError(f'Profile index out of range for ProfileBatch of length {self._n}')
+        return BatchProfile(self, i)
+
+    def __iter__(self) -> Iterable[BatchProfile]:
+        for i in range(self._n):
+            yield BatchProfile(self, i)
+
+    def keys(self) -> Iterable[str]:
+        """The parameters present in any profile of the batch"""
+        return tuple(self._columns.keys())
+
+    def column(self, k, readonly=False) -> Trace:
+        """
+        The concatenated :class:`medsrtqc.core.Trace` for parameter ``k``
+        across all profiles. Modifying its arrays in place modifies the
+        batch, so every profile that contains ``k`` is written by
+        :meth:`write_back`.
+
+        :param k: The parameter name.
+        :param readonly: Use ``True`` to get a read-only view that
+            does not mark profiles as modified.
+        """
+
+        column = self._columns[k]
+        if readonly:
+            return column.readonly_view()
+
+        self._modified.update((i, k) for i, keys in enumerate(self._keys) if k in keys)
+        return column
+
+    def offsets(self, k):
+        """The offsets of each profile's levels within :meth:`column`"""
+        return self._offsets[k]
+
+    def lengths(self, k):
+        """The number of levels of ``k`` in each profile"""
+        return np.diff(self._offsets[k])
+
+    def profile_index(self, k):
+        """The index of the profile that each level of :meth:`column` belongs to"""
+        return np.repeat(np.arange(self._n), self.lengths(k))
+
+    def write_back(self, profiles=None, modified_only=True):
+        """
+        Write the data in this batch back to the source profiles
+        using ``profile[k] = trace`` and update their ``qc_tests``.
+
+        :param profiles: The profiles to update. Defaults to those
+            used to create the batch using :meth:`from_profiles`.
+        :param modified_only: Use ``False`` to assign every parameter rather
+            than only those that were assigned through a :class:`BatchProfile`
+            or may have been modified using :meth:`column`.
+        """
+
+        profiles = self._profiles if profiles is None else list(profiles)
+        if profiles is None or len(profiles) != self._n:
+            raise ValueError('`profiles` must contain one Profile for each profile in the batch')
+
+        for i, profile in enumerate(profiles):
+            for k in self._keys[i]:
+                if modified_only and (i, k) not in self._modified:
+                    continue
+                profile[k] = self._slice(k, i).copy()
+
+            if self.has_qc_tests[i]:
+                profile.qc_tests = self.qc_tests[i].copy()
+                if hasattr(profile, 'update_qcx'):
+                    profile.update_qcx()
+
+        self._modified.clear()
+
+    def _levels(self, k, i):
+        offsets = self._offsets[k]
+        return slice(int(offsets[i]), int(offsets[i + 1]))
+
+    def _slice(self, k, i):
+        column = self._columns[k]
+        s = self._levels(k, i)
+
+        attrs = {}
+        for attr in _TRACE_ATTRS:
+            if attr == 'value' or not _is_absent(column, attr):
+                attrs[attr] = getattr(column, attr)[s]
+        return Trace(**attrs)
+
+
+def _is_absent(trace, attr):
+    return getattr(trace, '_' + attr) is None
+
+
+def _concatenate_traces(traces):
+    attrs = {}
+    for attr in _TRACE_ATTRS:
+        if attr != 'value' and all(_is_absent(trace, attr) for trace in traces):
+            continue
+        attrs[attr] = np.ma.concatenate([trace.masked(attr) for trace in traces])
+        if not isinstance(attrs[attr], MaskedArray):  # pragma: no cover
+            attrs[attr] = MaskedArray(attrs[attr])
+    return Trace(**attrs)
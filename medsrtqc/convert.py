@@ -0,0 +1,516 @@
+"""
+Bulk conversion between Argo NetCDF files and the binary VMS format.
+:func:`nc_to_vms` writes NetCDF profiles (e.g., from the Argo GDAC)
+using the same encoding as :func:`medsrtqc.vms.write_vms_profiles` so
+that they can be run through the production QC path, and :func:`vms_to_nc`
+exports :class:`medsrtqc.vms.VMSProfile` objects (e.g., after QC) as
+NetCDF. Parameter names are translated using the VMS codes in
+:data:`medsrtqc.parameters.parameters`; parameters without a NetCDF
+name in the catalog are not exported. Both functions convert and write
+one profile at a time and write many profiles to each output file,
+so memory use does not depend on the number of inputs.
+
+>>> from medsrtqc.convert import nc_to_vms, vms_to_nc
+>>> from medsrtqc.resources import resource_path
+>>> nc_to_vms([resource_path('BD6903197_026.nc')], 'profiles.dat')
+['profiles.dat']
+>>> vms_to_nc([resource_path('bgc_vms.dat')], 'profiles_{:04d}.nc', max_profiles=1000)
+['profiles_0000.nc']
+"""
+
+import numpy as np
+from netCDF4 import Dataset, stringtochar
+
+from .nc import NetCDFProfile, iter_nc_profiles, read_nc_profile, read_ncstr
+from .vms import VMSProfile, read_vms_profiles
+from .vms.enc import LineEnding
+from .vms.profiles_enc import PrStnAndPrProfilesEncoding
+from .parameters import parameters
+from .qc.history import hex_to_bitmask, bitmask_to_hex
+
+
+#: The maximum number of levels in one VMS ``PR_PROFILE`` segment
+MAX_SEGMENT_LENGTH = 1500
+
+_FIRST_KEY = 100
+_HISTORY_ACTIONS = ('QCP$', 'QCF$')
+_FILL_FLOAT = 99999.0
+_FILL_JULD = 999999.0
+_JULD_ORIGIN = np.datetime64('1950-01-01T00:00', 'm')
+
+# VMS values used for a missing position
+_VMS_MISSING_LATITUDE = 99.9999
+_VMS_MISSING_LONGITUDE = 999.9999
+
+
+def nc_to_vms(src, dest, ver='vms', max_profiles=None, cache=None):
+    """
+    Convert NetCDF profiles to binary VMS files and return the ``list()``
+    of files that were written. Levels without a valid pressure or value
+    are omitted and parameters with more than
+    :data:`MAX_SEGMENT_LENGTH` levels are split into several
+    ``PR_PROFILE`` segments.
+
+    :param src: An iterable whose items are :class:`medsrtqc.nc.NetCDFProfile`
+        objects, sources accepted by :func:`medsrtqc.nc.load`, or
+        ``tuple()``s of sources (e.g., a core and a BGC file) that describe
+        one profile. The ``N_PROF`` of other files are split into
+        profiles by cycle (see the ``by_cycle`` argument of
+        :func:`medsrtqc.nc.iter_nc_profiles`), so that multi-profile
+        ``_prof.nc`` files and files written by :func:`vms_to_nc` contain
+        several profiles and single-cycle files contain one.
+    :param dest: The output filename. If ``max_profiles`` is set, this
+        must contain a ``str.format()`` field for the file number
+        (e.g., ``'profiles_{:04d}.dat'``).
+    :param ver: The VMS encoding (``'vms'`` or ``'win'``).
+    :param max_profiles: The maximum number of profiles per output file
+        or ``None`` to write all profiles to ``dest``.
+    :param cache: Passed to :func:`medsrtqc.nc.load` for sources that are URLs.
+    """
+
+    encoding = PrStnAndPrProfilesEncoding(ver)
+    outputs = _Outputs(dest, max_profiles, lambda path: open(path, 'wb'), lambda f, path: _close_vms(f, path, ver))
+    key = _FIRST_KEY
+    try:
+        for profile in _iter_nc_sources(src, cache):
+            f = outputs.next()
+            if outputs.count == 1:
+                key = _FIRST_KEY
+            data = _vms_data(profile, key)
+            encoding.encode(f, data)
+            key = _next_key(data)
+    finally:
+        outputs.close()
+
+    return outputs.paths
+
+
+def vms_to_nc(src, dest, ver='vms', max_profiles=None):
+    """
+    Convert VMS profiles to NetCDF files and return the ``list()`` of files
+    that were written. Profiles are written along ``N_PROF`` in the layout
+    of an Argo multi-profile file: parameters of a profile that share the
+    same pressure levels are written to the same ``N_PROF`` (the one with
+    ``TEMP`` first, as primary sampling) and the ``QCP$`` and ``QCF$``
+    surface codes are written as ``HISTORY_QCTEST``. Use
+    :func:`medsrtqc.nc.iter_nc_profiles` with ``by_cycle=True`` to read
+    the profiles of these files.
+
+    :param src: An iterable whose items are :class:`medsrtqc.vms.VMSProfile`
+        objects or VMS filenames.
+    :param dest: The output filename. If ``max_profiles`` is set, this
+        must contain a ``str.format()`` field for the file number
+        (e.g., ``'profiles_{:04d}.nc'``).
+    :param ver: The VMS encoding of filenames in ``src``.
+    :param max_profiles: The maximum number of profiles per output file
+        or ``None`` to write all profiles to ``dest``.
+    """
+
+    outputs = _Outputs(dest, max_profiles, _NetCDFOutput, lambda output, path: output.close())
+    try:
+        for profile in _iter_vms_sources(src, ver):
+            outputs.next().write(profile)
+    finally:
+        outputs.close()
+
+    return outputs.paths
+
+
+def profile_to_vms(profile) -> VMSProfile:
+    """
+    Convert a :class:`medsrtqc.nc.NetCDFProfile` to a
+    :class:`medsrtqc.vms.VMSProfile` (see :func:`nc_to_vms`).
+    """
+    return VMSProfile(_vms_data(profile, _FIRST_KEY))
+
+
+def _vms_code(k):
+    # the VMS code for NetCDF variable k or None
+    return parameters.nc_to_vms.get(k)
+
+
+def _nc_name(k):
+    # the NetCDF variable name for VMS code k or None
+    return parameters.vms_to_nc.get(k)
+
+
+class _Outputs:
+    """Opens a new output file every ``max_profiles`` profiles."""
+
+    def __init__(self, dest, max_profiles, open_file, close_file):
+        if max_profiles is not None and dest.format(0) == dest.format(1):
+            raise ValueError('`dest` must contain a format field for the file number when `max_profiles` is set')
+
+        self._dest = dest
+        self._max_profiles = max_profiles
+        self._open = open_file
+        self._close = close_file
+        self._file = None
+        self.paths = []
+        self.count = 0
+
+        # an empty source still creates an (empty) output file
+        self._open_next()
+
+    def next(self):
+        """The file for the next profile."""
+        if self._max_profiles is not None and self.count >= self._max_profiles:
+            self._close_current()
+            self._open_next()
+        self.count += 1
+        return self._file
+
+    def close(self):
+        self._close_current()
+
+    def _open_next(self):
+        path = self._dest if self._max_profiles is None else self._dest.format(len(self.paths))
+        self._file = self._open(path)
+        self.paths.append(path)
+        self.count = 0
+
+    def _close_current(self):
+        if self._file is not None:
+            f, self._file = self._file, None
+            self._close(f, self.paths[-1])
+
+
+def _close_vms(f, path, ver):
+    f.close()
+    if ver == 'win':
+        # as for write_vms_profiles(), files end with a line ending
+        with open(path, 'rb+') as f:
+            f.seek(0, 2)
+            if f.tell() >= 2:
+                f.seek(-2, 2)
+                if f.read() == b'\r\n':
+                    return
+            LineEnding().encode(f)
+
+
+def _iter_nc_sources(src, cache):
+    for item in src:
+        if isinstance(item, NetCDFProfile):
+            yield item
+        elif isinstance(item, tuple):
+            profile = read_nc_profile(*item, cache=cache)
+            try:
+                yield profile
+            finally:
+                profile.close()
+        else:
+            yield from iter_nc_profiles(item, cache=cache, by_cycle=True)
+
+
+def _iter_vms_sources(src, ver):
+    for item in src:
+        if isinstance(item, VMSProfile):
+            yield item
+        else:
+            yield from read_vms_profiles(item, ver=ver)
+
+
+def _next_key(data):
+    # MKEYs of a station are followed by its PR_PROFILE keys (e.g., 00000100,
+    # 00000101, ...) and the next station starts at the next hundred
+    last = int(data['PR_PROFILE'][-1]['FXD']['MKEY']) if data['PR_PROFILE'] else int(data['PR_STN']['FXD']['MKEY'])
+    return (last // 100 + 1) * 100
+
+
+def _vms_data(profile, key):
+    meta = _nc_meta(profile)
+
+    obs = {'OBS_YEAR': '', 'OBS_MONTH': '', 'OBS_DAY': '', 'OBS_TIME': ''}
+    if meta['juld'] is not None:
+        time = str(_JULD_ORIGIN + np.timedelta64(int(round(meta['juld'] * 1440)), 'm'))
+        obs = {'OBS_YEAR': time[0:4], 'OBS_MONTH': time[5:7], 'OBS_DAY': time[8:10], 'OBS_TIME': time[11:13] + time[14:16]}
+
+    latitude = _VMS_MISSING_LATITUDE if meta['latitude'] is None else meta['latitude']
+    # MEDS longitudes are positive west
+    longitude = _VMS_MISSING_LONGITUDE if meta['longitude'] is None else (-meta['longitude']) % 360.0
+
+    fxd = {'MKEY': '', 'ONE_DEG_SQ': 0, 'CR_NUMBER': 'Q' + meta['wmo']}
+    fxd.update(obs)
+    fxd['DATA_TYPE'] = 'TE'
+    fxd['IUMSGNO'] = 0
+
+    stn_prof = []
+    pr_profile = []
+    for k in profile.keys():
+        code = _vms_code(k)
+        if code is None:
+            continue
+        levels = _nc_levels(profile, k)
+        if levels is None:
+            continue
+
+        pres, dp_flag, value, q_parm = levels
+        n_seg = (len(pres) + MAX_SEGMENT_LENGTH - 1) // MAX_SEGMENT_LENGTH
+        stn_prof.append({
+            'NO_SEG': n_seg,
+            'PROF_TYPE': code,
+            'DUP_FLAG': 'N',
+            'DIGIT_CODE': '7',
+            'STANDARD': '1',
+            'DEEP_DEPTH': float(pres.max())
+        })
+
+        for seg in range(n_seg):
+            seg_slice = slice(seg * MAX_SEGMENT_LENGTH, (seg + 1) * MAX_SEGMENT_LENGTH)
+            seg_fxd = dict(fxd)
+            seg_fxd['MKEY'] = f'{key + len(pr_profile) + 1:08d}'
+            seg_fxd['PROF_TYPE'] = code
+            seg_fxd['PROFILE_SEG'] = f'{seg + 1:02d}'
+            seg_fxd['NO_DEPTHS'] = len(pres[seg_slice])
+            seg_fxd['D_P_CODE'] = 'P'
+            pr_profile.append({
+                'FXD': seg_fxd,
+                'PROF': [
+                    {'DEPTH_PRESS': float(p), 'DP_FLAG': dp, 'PARM': float(v), 'Q_PARM': q}
+                    for p, dp, v, q in zip(pres[seg_slice], dp_flag[seg_slice], value[seg_slice], q_parm[seg_slice])
+                ]
+            })
+
+    surface = []
+    if meta['cycle_number'] is not None:
+        surface.append({'PCODE': 'PFN$', 'PARM': float(meta['cycle_number']), 'Q_PARM': '0'})
+
+    surf_codes = []
+    if meta['direction']:
+        surf_codes.append({'PCODE': 'PDR$', 'CPARM': meta['direction'], 'Q_PARM': '0'})
+    for action in ('QCP$', 'QCF$'):
+        if meta[action]:
+            # e.g., '0000000000000000' in NetCDF and '  00000000' in VMS
+            cparm = bitmask_to_hex(hex_to_bitmask(meta[action]), width=8).rjust(10)
+            surf_codes.append({'PCODE': action, 'CPARM': cparm, 'Q_PARM': '0'})
+
+    stn_fxd = dict(fxd)
+    stn_fxd['MKEY'] = f'{key:08d}'
+    stn_fxd.update({
+        'STREAM_SOURCE': 'I',
+        'U_FLAG': '',
+        'STN_NUMBER': 0,
+        'LATITUDE': float(latitude),
+        'LONGITUDE': float(longitude),
+        'Q_POS': '0',
+        'Q_DATE_TIME': '0',
+        'Q_RECORD': '0',
+        'UP_DATE': '',
+        'BUL_TIME': '',
+        'BUL_HEADER': '',
+        'SOURCE_ID': 'MEDS',
+        'STREAM_IDENT': 'MEPF',
+        'QC_VERSION': '',
+        'AVAIL': 'A',
+        'NO_PROF': len(stn_prof),
+        'NPARMS': len(surface),
+        'SPARMS': len(surf_codes),
+        'NUM_HISTS': 0
+    })
+
+    return {
+        'PR_STN': {'FXD': stn_fxd, 'PROF': stn_prof, 'SURFACE': surface, 'SURF_CODES': surf_codes, 'HISTORY': []},
+        'PR_PROFILE': pr_profile
+    }
+
+
+def _nc_meta(profile):
+    cache = profile._cache
+    i_prof = 0 if profile._prof_rows is None else profile._prof_rows.start
+
+    def scalar(var):
+        if not cache.has_variable(0, var):
+            return None
+        value = cache.read(0, var)[i_prof]
+        return None if np.ma.is_masked(value) else value.item()
+
+    direction = read_ncstr(cache.read(0, 'DIRECTION')[i_prof:(i_prof + 1)]) if cache.has_variable(0, 'DIRECTION') else ''
+    meta = {
+        'wmo': profile.read_platform_number()[0],
+        'cycle_number': scalar('CYCLE_NUMBER'),
+        'direction': direction,
+        'juld': scalar('JULD'),
+        'latitude': scalar('LATITUDE'),
+        'longitude': scalar('LONGITUDE'),
+    }
+
+    for action in ('QCP$', 'QCF$'):
+        meta[action] = profile.read_history_qc(action) if cache.has_variable(0, 'HISTORY_ACTION') else None
+
+    return meta
+
+
+def _nc_levels(profile, k):
+    # levels are read from the full N_PROF rather than profile[k] so that
+    # every level with a valid pressure and value is kept
+    dataset_id, i_prof = profile._variables[k]
+    cache = profile._cache
+
+    value = cache.read(dataset_id, k)[i_prof]
+    if value.ndim != 1:
+        # e.g., UV_INTENSITY_NITRATE
+        return None
+
+    pres = cache.read(dataset_id, 'PRES')[i_prof]
+    valid = ~np.ma.getmaskarray(pres) & ~np.ma.getmaskarray(value)
+    valid &= np.isfinite(np.ma.getdata(pres)) & np.isfinite(np.ma.getdata(value))
+    if not np.any(valid):
+        return None
+
+    flags = []
+    for var in ('PRES_QC', k + '_QC'):
+        if cache.has_variable(dataset_id, var):
+            flag = np.ma.getdata(cache.read(dataset_id, var)[i_prof])[valid]
+            flags.append([item.decode().strip() or '0' for item in flag])
+        else:
+            flags.append(['0'] * int(valid.sum()))
+
+    return np.ma.getdata(pres)[valid], flags[0], np.ma.getdata(value)[valid], flags[1]
+
+
+def _vms_levels(profile):
+    # PROF_TYPE: (pres, dp_flag, value, q_parm) from every segment
+    levels = {}
+    for pr_profile in profile._data['PR_PROFILE']:
+        levels.setdefault(pr_profile['FXD']['PROF_TYPE'], []).extend(pr_profile['PROF'])
+
+    for k, meas in levels.items():
+        levels[k] = (
+            np.array([m['DEPTH_PRESS'] for m in meas], dtype=np.float32),
+            np.array([m['DP_FLAG'] or ' ' for m in meas], dtype='S1'),
+            np.array([m['PARM'] for m in meas], dtype=np.float32),
+            np.array([m['Q_PARM'] or ' ' for m in meas], dtype='S1')
+        )
+
+    return levels
+
+
+class _NetCDFOutput:
+    """
+    A multi-profile NetCDF file that VMS profiles are appended to
+    along ``N_PROF`` (see :func:`vms_to_nc`).
+    """
+
+    def __init__(self, path):
+        # N_PROF and N_LEVELS grow as profiles are appended
+        self.dataset = dataset = Dataset(path, 'w', format='NETCDF4')
+        dataset.title = 'Argo float vertical profiles'
+        dataset.source = 'medsrtqc.convert.vms_to_nc'
+
+        dataset.createDimension('N_PROF', None)
+        dataset.createDimension('N_LEVELS', None)
+        dataset.createDimension('N_PARAM', len(parameters.vms_to_nc))
+        dataset.createDimension('N_CALIB', 1)
+        dataset.createDimension('N_HISTORY', len(_HISTORY_ACTIONS))
+        for length in (4, 8, 16, 64, 256):
+            dataset.createDimension(f'STRING{length}', length)
+
+        dataset.createVariable('PLATFORM_NUMBER', 'S1', ('N_PROF', 'STRING8'), fill_value=b' ')
+        dataset.createVariable('CYCLE_NUMBER', 'i4', ('N_PROF', ), fill_value=99999)
+        dataset.createVariable('DIRECTION', 'S1', ('N_PROF', ), fill_value=b' ')
+        dataset.createVariable('VERTICAL_SAMPLING_SCHEME', 'S1', ('N_PROF', 'STRING256'), fill_value=b' ')
+        juld = dataset.createVariable('JULD', 'f8', ('N_PROF', ), fill_value=_FILL_JULD)
+        juld.units = 'days since 1950-01-01 00:00:00 UTC'
+        dataset.createVariable('LATITUDE', 'f8', ('N_PROF', ), fill_value=_FILL_FLOAT)
+        dataset.createVariable('LONGITUDE', 'f8', ('N_PROF', ), fill_value=_FILL_FLOAT)
+        dataset.createVariable('STATION_PARAMETERS', 'S1', ('N_PROF', 'N_PARAM', 'STRING64'), fill_value=b' ')
+        dataset.createVariable('PARAMETER', 'S1', ('N_PROF', 'N_CALIB', 'N_PARAM', 'STRING64'), fill_value=b' ')
+        dataset.createVariable('HISTORY_ACTION', 'S1', ('N_HISTORY', 'N_PROF', 'STRING4'))
+        dataset.createVariable('HISTORY_QCTEST', 'S1', ('N_HISTORY', 'N_PROF', 'STRING16'))
+
+        # the (N_PROF, N_LEVELS) extent written to each level variable
+        self._extents = {}
+
+    def write(self, profile):
+        dataset = self.dataset
+        fxd = profile._data['PR_STN']['FXD']
+        wmo = fxd['CR_NUMBER'].replace('Q', '')
+        wmo = wmo if len(wmo) == 7 else wmo[:-2]
+        cycle_number = profile.get_surface(['PFN$', 'PARM_SURFACE.PFN$'])
+        direction = profile.get_surf_code(['PDR$', 'PARM_SURF.PDR$'])
+        history = [(action, profile.get_surf_code(action)) for action in _HISTORY_ACTIONS]
+        history = [(action, bitmask_to_hex(hex_to_bitmask(value), width=16)) for action, value in history if value is not None]
+
+        # parameters sharing the same pressure levels share an N_PROF
+        levels = _vms_levels(profile)
+        rows = {}
+        for k in (item['PROF_TYPE'] for item in profile._data['PR_STN']['PROF']):
+            name = _nc_name(k)
+            if name is None or k not in levels:
+                continue
+            rows.setdefault(levels[k][0].tobytes(), []).append((k, name))
+
+        # the CTD levels are the primary sampling and a profile without
+        # parameters still has an N_PROF for its metadata
+        rows = sorted(rows.values(), key=lambda row: 'TEMP' not in [name for _, name in row]) or [[]]
+        n_prof = len(rows)
+        start = len(dataset.dimensions['N_PROF'])
+        index = slice(start, start + n_prof)
+
+        schemes = ['Primary sampling'] + ['Secondary sampling'] * (n_prof - 1)
+        _write_nc_strings(dataset, 'PLATFORM_NUMBER', index, [wmo] * n_prof)
+        _write_nc_strings(dataset, 'DIRECTION', index, [direction if direction in ('A', 'D') else ''] * n_prof)
+        _write_nc_strings(dataset, 'VERTICAL_SAMPLING_SCHEME', index, schemes)
+
+        if cycle_number is not None:
+            dataset['CYCLE_NUMBER'][index] = cycle_number
+
+        try:
+            time = np.datetime64(f"{fxd['OBS_YEAR']}-{fxd['OBS_MONTH']}-{fxd['OBS_DAY']}T{fxd['OBS_TIME'][:2]}:{fxd['OBS_TIME'][2:4]}", 'm')
+            dataset['JULD'][index] = (time - _JULD_ORIGIN).astype(np.float64) / 1440.0
+        except ValueError:
+            pass
+
+        if abs(fxd['LATITUDE']) <= 90 and 0 <= fxd['LONGITUDE'] <= 360:
+            dataset['LATITUDE'][index] = fxd['LATITUDE']
+            # MEDS longitudes are positive west
+            dataset['LONGITUDE'][index] = (180.0 - fxd['LONGITUDE']) % 360.0 - 180.0
+
+        for i_prof, row in enumerate(rows, start):
+            if not row:
+                continue
+
+            names = stringtochar(np.array([name for _, name in row], dtype='S64'))
+            dataset['STATION_PARAMETERS'][i_prof, :len(row), :] = names
+            dataset['PARAMETER'][i_prof, 0, :len(row), :] = names
+
+            row_pres, dp_flag, _, _ = levels[row[0][0]]
+            self._write_levels('PRES', i_prof, row_pres, dp_flag)
+            for k, name in row:
+                _, _, value, q_parm = levels[k]
+                self._write_levels(name, i_prof, value, q_parm)
+
+        for i, (action, value) in enumerate(history):
+            dataset['HISTORY_ACTION'][i, index, :] = stringtochar(np.array([action] * n_prof, dtype='S4'))
+            dataset['HISTORY_QCTEST'][i, index, :] = stringtochar(np.array([value] * n_prof, dtype='S16'))
+
+    def close(self):
+        # netCDF-C reads uninitialized values (rather than the fill value)
+        # outside of the written extent of a variable with more than one
+        # unlimited dimension, so a fill value is written to the last
+        # item of variables that don't extend to the last N_PROF or N_LEVELS
+        shape = (len(self.dataset.dimensions['N_PROF']), len(self.dataset.dimensions['N_LEVELS']))
+        for name, extent in self._extents.items():
+            if extent != shape:
+                for var in (name, name + '_QC'):
+                    self.dataset[var][shape[0] - 1, shape[1] - 1] = np.ma.masked
+
+        self.dataset.close()
+
+    def _write_levels(self, name, i_prof, value, qc):
+        if name not in self.dataset.variables:
+            for var, dtype, fill_value in ((name, 'f4', np.float32(_FILL_FLOAT)), (name + '_QC', 'S1', b' ')):
+                self.dataset.createVariable(var, dtype, ('N_PROF', 'N_LEVELS'), fill_value=fill_value, chunksizes=(1, 1024))
+
+        self.dataset[name][i_prof, :len(value)] = value
+        self.dataset[name + '_QC'][i_prof, :len(qc)] = qc
+        rows, n = self._extents.get(name, (0, 0))
+        self._extents[name] = (max(rows, i_prof + 1), max(n, len(value)))
+
+
+def _write_nc_strings(dataset, name, index, values):
+    var = dataset[name]
+    if var.dimensions[-1].startswith('STRING'):
+        var[index] = stringtochar(np.array(values, dtype=f'S{len(dataset.dimensions[var.dimensions[-1]])}'))
+    else:
+        var[index] = np.array([item or ' ' for item in values], dtype='S1')
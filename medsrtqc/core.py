@@ -9,22 +9,161 @@ that are contained by :class:`Profile` objects.
 """
 
 from typing import Iterable, Tuple
-from copy import deepcopy
+import functools
+import numpy as np
 from numpy.ma import MaskedArray
 from numpy import zeros, float32, dtype
 
 
+# the attributes of a Trace and the dtype each is stored as
+_TRACE_DTYPES = {
+    'value': dtype(float32),
+    'qc': dtype('S1'),
+    'adjusted': dtype(float32),
+    'adjusted_error': dtype(float32),
+    'adjusted_qc': dtype('S1'),
+    'pres': dtype(float32),
+    'mtime': dtype(float32)
+}
+
+# the value used for missing levels when a Trace uses 'plain' storage
+_PLAIN_FILL = {
+    dtype(float32): np.float32(np.nan),
+    dtype('S1'): np.bytes_(b'')
+}
+
+# zero-dimensional buffers shared by every absent Trace attribute
+_ABSENT_DATA = {dt: zeros((), dtype=dt) for dt in _PLAIN_FILL}
+_ABSENT_PLAIN_DATA = {dt: np.full((), fill, dtype=dt) for dt, fill in _PLAIN_FILL.items()}
+_ABSENT_MASK = np.ones((), dtype=bool)
+
+
+class _AbsentMixin:
+    """
+    The placeholder returned for a :class:`Trace` attribute
+    that was never supplied. Its data (and mask) are zero-stride views of
+    a single shared element so no per-level memory is allocated. The
+    first write through it materializes a real array on the owning
+    :class:`Trace`; copies and views of it behave like any other
+    read-only array.
+    """
+
+    _trace = None
+    _attr = None
+
+    def __setitem__(self, indx, value):
+        if self._trace is None:
+            return super().__setitem__(indx, value)
+        self._trace._materialize(self._attr)[indx] = value
+
+
+class _AbsentArray(_AbsentMixin, MaskedArray):
+
+    def __setmask__(self, mask, copy=False):
+        if self._trace is None:
+            return super().__setmask__(mask, copy=copy)
+        self._trace._materialize(self._attr).__setmask__(mask, copy=copy)
+
+
+class _AbsentPlainArray(_AbsentMixin, np.ndarray):
+    pass
+
+
+def _readonly_view(v):
+    out = v.view()
+    if isinstance(out, MaskedArray) and out._mask is not np.ma.nomask:
+        out._mask = out._mask.view()
+        out._mask.flags.writeable = False
+    out.flags.writeable = False
+    return out
+
+
+class _PresIndex:
+    """
+    The sort order of a :class:`Trace`'s ``pres``, computed the first time
+    it is needed and shared between a :class:`Trace` and its read-only views.
+    Missing pressures are sorted last and excluded from ``n_valid``. A copy
+    of the pressures is kept so that the order is computed again if
+    ``pres`` is modified in place.
+    """
+
+    __slots__ = ('_pres', '_order', '_sorted', '_n_valid', '_increasing')
+
+    def __init__(self):
+        self._pres = None
+        self._order = None
+
+    def update(self, pres):
+        """Recompute the sort order if ``pres`` changed since it was last computed"""
+        pres = np.ma.filled(pres, np.nan)
+        if self._pres is None or not np.array_equal(pres, self._pres, equal_nan=True):
+            self._compute(np.array(pres, copy=True))
+        return self
+
+    def _compute(self, pres):
+        if pres.ndim != 1:
+            raise ValueError('Pressure indexing requires a one-dimensional Trace.pres')
+        self._order = np.argsort(pres, kind='stable')
+        self._sorted = pres[self._order]
+        self._n_valid = int(np.count_nonzero(~np.isnan(pres)))
+        self._increasing = self._n_valid == len(pres) and bool(np.all(pres[1:] >= pres[:-1]))
+        self._pres = pres
+
+    @property
+    def order(self):
+        """Indices that sort the non-missing pressures in increasing order"""
+        return self._order[:self._n_valid]
+
+    @property
+    def sorted(self):
+        """The non-missing pressures in increasing order"""
+        return self._sorted[:self._n_valid]
+
+    @property
+    def increasing(self):
+        """``True`` if no pressures are missing and they are already sorted"""
+        return self._increasing
+
+
+def _trace_attr(attr):
+    slot = '_' + attr
+
+    def fget(self):
+        v = getattr(self, slot)
+        return self._absent(attr) if v is None else v
+
+    def fset(self, v):
+        setattr(self, slot, self._sanitize(v, attr))
+        if attr == 'pres':
+            self._pres_index = None
+
+    return property(fget, fset)
+
+
 class Trace:
     """
     Trace objects are a simple representation of a value series.
-    All attributes of a :class:`Trace` are ``numpy``
+    By default all attributes of a :class:`Trace` are ``numpy``
     ``MaskedArray`` objects like those that might be read from an Argo
     NetCDF file. The ``value`` attribute is guaranteed
-    to not be ``None``; other attributes are optional and should be
-    checked in code that uses these objects. QC operations can be
+    to not be ``None``; other attributes are optional and are fully
+    masked when they were not supplied. QC operations can be
     written as functions of :class:`Trace` objects and the result of
     QC operations is often a modified :class:`Trace`.
 
+    Inputs that already have the storage dtype (``float32`` for
+    values or ``'S1'`` for flags) are used without copying. Attributes
+    that were not supplied share a single read-only buffer until
+    they are first written to. Flags use one byte per level and
+    :meth:`medsrtqc.qc.flag.Flag.codes` gives a ``uint8`` view of them
+    for integer comparisons.
+
+    With ``storage='plain'`` attributes are regular ``numpy`` arrays
+    instead, with missing values stored as ``NaN`` (values) or
+    ``Flag.FILL_VALUE`` (flags). This avoids the overhead of
+    ``numpy.ma`` in numeric code; use :meth:`masked` where a
+    ``MaskedArray`` is required.
+
     :param value: The parameter value. This should be the same units
         as would be written to the Argo NetCDF file.
     :param qc: The parameter QC value.
@@ -34,34 +173,221 @@ class Trace:
     :param pres: The pressure measurement (in dbar) corresponding to
         the ``value``.
     :param mtime: The measurement time
+    :param storage: One of ``'masked'`` or ``'plain'``.
     """
 
+    __slots__ = ('_shape', '_n', '_storage', '_readonly', '_pres_index') + tuple('_' + attr for attr in _TRACE_DTYPES)
+
     def __init__(self, value: MaskedArray,
                  qc=None, adjusted=None, adjusted_error=None,
-                 adjusted_qc=None, pres=None, mtime=None) -> None:
-        value = MaskedArray(value)
+                 adjusted_qc=None, pres=None, mtime=None, storage='masked') -> None:
+        if storage not in ('masked', 'plain'):
+            raise ValueError(f"Trace storage must be 'masked' or 'plain' but got {repr(storage)}")
+        self._storage = storage
+        self._readonly = False
+        self._pres_index = None
+
+        if not isinstance(value, np.ndarray):
+            value = MaskedArray(value)
         self._shape = value.shape
         self._n = len(value)
 
-        self.value = self._sanitize(value, float32, 'value')
-        self.qc = self._sanitize(qc, dtype('S1'), 'qc')
-        self.adjusted = self._sanitize(adjusted, float32, 'adjusted')
-        self.adjusted_error = self._sanitize(adjusted_error, float32, 'adjusted_error')
-        self.adjusted_qc = self._sanitize(adjusted_qc, dtype('S1'), 'adjusted_qc')
-        self.pres = self._sanitize(pres, float32, 'pres')
-        self.mtime = self._sanitize(mtime, float32, 'mtime')
+        self._value = self._sanitize(value, 'value')
+        self._qc = self._sanitize(qc, 'qc')
+        self._adjusted = self._sanitize(adjusted, 'adjusted')
+        self._adjusted_error = self._sanitize(adjusted_error, 'adjusted_error')
+        self._adjusted_qc = self._sanitize(adjusted_qc, 'adjusted_qc')
+        self._pres = self._sanitize(pres, 'pres')
+        self._mtime = self._sanitize(mtime, 'mtime')
+
+    value = _trace_attr('value')
+    qc = _trace_attr('qc')
+    adjusted = _trace_attr('adjusted')
+    adjusted_error = _trace_attr('adjusted_error')
+    adjusted_qc = _trace_attr('adjusted_qc')
+    pres = _trace_attr('pres')
+    mtime = _trace_attr('mtime')
+
+    @property
+    def storage(self):
+        """The storage mode of this Trace (``'masked'`` or ``'plain'``)"""
+        return self._storage
+
+    @property
+    def readonly(self):
+        """``True`` if the arrays of this Trace can't be modified in place"""
+        return self._readonly
+
+    def copy(self):
+        """Return a writable copy of this Trace that shares no memory with it"""
+        attrs = {}
+        for attr in _TRACE_DTYPES:
+            v = getattr(self, '_' + attr)
+            if v is not None:
+                attrs[attr] = v.copy()
+        return Trace(storage=self._storage, **attrs)
+
+    def readonly_view(self):
+        """
+        Return a :class:`Trace` backed by the same memory as this one
+        whose arrays are not writeable. Use :meth:`copy` to get a
+        version that can be modified.
+        """
+
+        view = Trace.__new__(Trace)
+        view._shape = self._shape
+        view._n = self._n
+        view._storage = self._storage
+        view._readonly = True
+        if self._pres_index is None:
+            self._pres_index = _PresIndex()
+        view._pres_index = self._pres_index
+        for attr in _TRACE_DTYPES:
+            v = getattr(self, '_' + attr)
+            setattr(view, '_' + attr, None if v is None else _readonly_view(v))
+        return view
+
+    def _get_pres_index(self):
+        # pres is sorted lazily and again if it was modified in place
+        if self._pres_index is None:
+            self._pres_index = _PresIndex()
+        return self._pres_index.update(self.pres)
+
+    def masked(self, attr='value') -> MaskedArray:
+        """
+        Return an attribute as a ``MaskedArray`` regardless of the storage
+        mode. For ``'plain'`` storage the result shares memory with the
+        attribute and missing values (``NaN`` or ``Flag.FILL_VALUE``) are
+        masked.
+
+        :param attr: The name of the attribute.
+        """
+
+        v = getattr(self, attr)
+        if self._storage == 'masked':
+            return v
+        elif getattr(self, '_' + attr) is None:
+            dt = _TRACE_DTYPES[attr]
+            return MaskedArray(
+                np.broadcast_to(_ABSENT_PLAIN_DATA[dt], self._shape),
+                mask=np.broadcast_to(_ABSENT_MASK, self._shape)
+            )
+        elif v.dtype.kind == 'f':
+            return MaskedArray(v, mask=np.isnan(v))
+        else:
+            return MaskedArray(v, mask=v == _PLAIN_FILL[v.dtype])
+
+    def with_storage(self, storage):
+        """
+        Return a :class:`Trace` with the same content using the given storage
+        mode (or this Trace if it already uses that mode). Arrays are shared
+        with this Trace where no conversion is needed.
+
+        :param storage: One of ``'masked'`` or ``'plain'``.
+        """
+
+        if storage == self._storage:
+            return self
+
+        attrs = {}
+        for attr in _TRACE_DTYPES:
+            if getattr(self, '_' + attr) is not None:
+                attrs[attr] = self.masked(attr)
+        return Trace(storage=storage, **attrs)
 
-    def _sanitize(self, v, dtype_if_none, attr):
+    def window(self, pmin=None, pmax=None, inclusive=False):
+        """
+        Select the levels of this Trace whose ``pres`` is between ``pmin``
+        and ``pmax`` using a binary search on the sort order of ``pres``,
+        which is computed once per Trace (and again if ``pres`` was
+        modified in place). Levels with missing pressure are never selected.
+
+        >>> from medsrtqc.core import Trace
+        >>> trace = Trace([1, 2, 3, 4], pres=[0, 10, 20, 30])
+        >>> trace.window(5, 20, inclusive=True)
+        slice(1, 3, None)
+
+        :param pmin: The lower pressure limit or ``None`` for no lower limit.
+        :param pmax: The upper pressure limit or ``None`` for no upper limit.
+        :param inclusive: Use ``True`` to also select levels whose pressure
+            is equal to ``pmin`` or ``pmax``.
+        :return: A ``slice`` if ``pres`` is increasing or an increasing array
+            of indices otherwise. Either can be used to index any attribute
+            or as the ``where`` argument of :meth:`medsrtqc.qc.flag.Flag.update_safely`.
+        """
+
+        index = self._get_pres_index()
+        pres = index.sorted
+        lo = 0 if pmin is None else int(np.searchsorted(pres, pmin, side='left' if inclusive else 'right'))
+        hi = len(pres) if pmax is None else int(np.searchsorted(pres, pmax, side='right' if inclusive else 'left'))
+        hi = max(lo, hi)
+
+        if index.increasing:
+            return slice(lo, hi)
+        else:
+            return np.sort(index.order[lo:hi])
+
+    def pres_range(self):
+        """
+        The minimum and maximum non-missing ``pres`` of this Trace as a
+        ``tuple()`` (``(nan, nan)`` if all pressures are missing).
+        """
+
+        pres = self._get_pres_index().sorted
+        if len(pres) == 0:
+            return np.nan, np.nan
+        return pres[0], pres[-1]
+
+    def _sanitize(self, v, attr):
         if v is None:
-            v = zeros(self._shape, dtype=dtype_if_none)
-            return MaskedArray(v, mask=True)
+            if attr == 'value':
+                raise ValueError("Trace attribute 'value' can't be None")
+            return None
+        # another Trace's placeholder is still just "absent" here
+        if isinstance(v, _AbsentMixin) and v._trace is not None and v.shape == self._shape:
+            return None
+
+        dt = _TRACE_DTYPES[attr]
+        if self._storage == 'plain':
+            if isinstance(v, MaskedArray):
+                v = v.astype(dt, copy=False).filled(_PLAIN_FILL[dt])
+            else:
+                v = np.asarray(v).astype(dt, copy=False)
         else:
-            v = MaskedArray(v).astype(dtype_if_none)
-            if len(v) != self._n:
-                gen_msg = f'len() of Trace attributes must match len(value) ({self._n}).'
-                spec_msg = f"Attribute '{attr}' has shape {repr(v.shape)}"
-                raise ValueError(gen_msg + '\n' + spec_msg)
-            return v
+            if not isinstance(v, MaskedArray):
+                v = MaskedArray(v)
+            v = v.astype(dt, copy=False)
+
+        if len(v) != self._n:
+            gen_msg = f'len() of Trace attributes must match len(value) ({self._n}).'
+            spec_msg = f"Attribute '{attr}' has shape {repr(v.shape)}"
+            raise ValueError(gen_msg + '\n' + spec_msg)
+        return v
+
+    def _absent(self, attr):
+        dt = _TRACE_DTYPES[attr]
+        if self._storage == 'plain':
+            v = np.broadcast_to(_ABSENT_PLAIN_DATA[dt], self._shape).view(_AbsentPlainArray)
+        else:
+            data = np.broadcast_to(_ABSENT_DATA[dt], self._shape)
+            mask = np.broadcast_to(_ABSENT_MASK, self._shape)
+            v = MaskedArray(data, mask=mask).view(_AbsentArray)
+        v._trace = self
+        v._attr = attr
+        return v
+
+    def _materialize(self, attr):
+        v = getattr(self, '_' + attr)
+        if v is None and self._readonly:
+            raise ValueError(f"Can't write to '{attr}' of a read-only Trace; use Trace.copy() to modify it")
+        elif v is None:
+            dt = _TRACE_DTYPES[attr]
+            if self._storage == 'plain':
+                v = np.full(self._shape, _PLAIN_FILL[dt], dtype=dt)
+            else:
+                v = MaskedArray(zeros(self._shape, dtype=dt), mask=True)
+            setattr(self, '_' + attr, v)
+        return v
 
     def __len__(self):
         return self._n
@@ -87,6 +413,134 @@ class Trace:
         return f"Trace(\n    {all_summaries}\n)"
 
 
+class Alignment:
+    """
+    A mapping from the levels of one :class:`Trace` (the target) to the levels
+    of another (the source) as returned by :func:`align`. The same
+    :class:`Alignment` can be used to map values or flags from the source
+    onto the target's levels.
+
+    :param method: The method used to create the alignment.
+    :param index: For each target level, the index of the matching (or
+        nearest) source level or ``-1`` if there is no match.
+    :param lower: For ``method='linear'``, the index of the source level
+        at or above each target level (or ``-1``).
+    :param upper: For ``method='linear'``, the index of the source level
+        at or below each target level (or ``-1``).
+    :param weight: For ``method='linear'``, the interpolation weight
+        given to ``upper``.
+    """
+
+    def __init__(self, method, index, lower=None, upper=None, weight=None):
+        self.method = method
+        self.index = index
+        self.lower = lower
+        self.upper = upper
+        self.weight = weight
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def matched(self):
+        """A boolean array indicating which target levels have a match"""
+        return self.index >= 0
+
+    def take(self, x) -> MaskedArray:
+        """
+        Map ``x``, an array along the source levels (e.g., values or flags),
+        onto the target levels. Target levels without a match are masked.
+        """
+
+        matched = self.matched
+        out = np.ma.asarray(x)[np.where(matched, self.index, 0)]
+        out = MaskedArray(out, mask=np.ma.getmaskarray(out) | ~matched)
+        return out
+
+    def interp(self, x) -> MaskedArray:
+        """
+        Linearly interpolate ``x``, an array of values along the source levels,
+        onto the target levels. Requires ``method='linear'``.
+        """
+
+        if self.method != 'linear':
+            raise ValueError("Alignment.interp() requires method='linear'")
+        matched = self.matched
+        lower = np.where(matched, self.lower, 0)
+        upper = np.where(matched, self.upper, 0)
+        x = np.ma.asarray(x)
+        out = x[lower] * (1 - self.weight) + x[upper] * self.weight
+        return MaskedArray(out, mask=np.ma.getmaskarray(out) | ~matched)
+
+
+def align(target, source, method='nearest') -> Alignment:
+    """
+    Match the levels of ``target`` to those of ``source`` by pressure
+    using a binary search on the (cached) sorted pressures of ``source``.
+    Levels with missing pressure are never matched.
+
+    :param target: The :class:`Trace` whose levels should be matched.
+    :param source: The :class:`Trace` to look up levels in.
+    :param method: One of ``'nearest'`` (the closest source pressure; the
+        shallower level wins a tie), ``'exact'`` (identical pressures only), or
+        ``'linear'`` (the source levels above and below for interpolation
+        within the range of source pressures).
+
+    >>> from medsrtqc.core import Trace, align
+    >>> temp = Trace([10, 8, 4], pres=[0, 10, 20])
+    >>> ph = Trace([7.5, 7.6], pres=[4, 18])
+    >>> align(ph, temp).index
+    >>> align(ph, temp, method='linear').interp(temp.value)
+    """
+
+    if method not in ('nearest', 'exact', 'linear'):
+        raise ValueError(f"Unknown alignment method: {repr(method)}")
+
+    pres = np.ma.filled(target.pres, np.nan)
+    index = source._get_pres_index()
+    order = index.order
+    sorted_pres = index.sorted
+    n = len(sorted_pres)
+    valid = ~np.isnan(pres)
+
+    if n == 0:
+        missing = np.full(pres.shape, -1, dtype=np.intp)
+        if method == 'linear':
+            return Alignment(method, missing, missing, missing, np.zeros(pres.shape))
+        return Alignment(method, missing)
+
+    pos = np.searchsorted(sorted_pres, pres, side='left')
+    pos_clip = np.minimum(pos, n - 1)
+
+    if method == 'exact':
+        matched = valid & (pos < n) & (sorted_pres[pos_clip] == pres)
+        return Alignment(method, np.where(matched, order[pos_clip], -1))
+
+    above = np.maximum(pos - 1, 0)
+    if method == 'nearest':
+        use_above = (pos > 0) & ((pos == n) | (pres - sorted_pres[above] <= sorted_pres[pos_clip] - pres))
+        nearest = np.where(use_above, above, pos_clip)
+        return Alignment(method, np.where(valid, order[nearest], -1))
+
+    # linear: an exact match interpolates with zero weight
+    exact = (pos < n) & (sorted_pres[pos_clip] == pres)
+    inside = valid & (exact | ((pos > 0) & (pos < n)))
+    lower = np.where(exact, pos_clip, above)
+    upper = pos_clip
+    dp = sorted_pres[upper] - sorted_pres[lower]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(dp > 0, (pres - sorted_pres[lower]) / dp, 0.0)
+    weight = np.where(inside, weight, 0.0)
+    nearest = np.where(weight > 0.5, upper, lower)
+    return Alignment(
+        method,
+        np.where(inside, order[nearest], -1),
+        np.where(inside, order[lower], -1),
+        np.where(inside, order[upper], -1),
+        weight
+    )
+
+
 class Profile:
     """
     A base class for the concept of a "Profile".
@@ -95,13 +549,24 @@ class Profile:
     that can be QCed). The interface is dict-like with elements as
     :class:`Trace` objects that can be extracted by name or iterated
     over using :meth:`keys` or :meth:`items`. The base class can wrap
-    a ``dict`` of :class:`Trace` objects.
+    a ``dict`` of :class:`Trace` objects, in which case extracted
+    :class:`Trace` objects are read-only views of the stored data; use
+    :meth:`copy` to get a :class:`Trace` that can be modified.
+    Quantities calculated from several traces (e.g., density) are
+    available from :meth:`derived`.
     """
 
     def __init__(self, data=None, meta=None):
         self.__data = dict(data) if data is not None else None
         self.__meta = dict(meta) if meta is not None else None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # count assignments made using subclass implementations of
+        # __setitem__() so that derived quantities are recalculated
+        if '__setitem__' in cls.__dict__:
+            cls.__setitem__ = _counts_versions(cls.__dict__['__setitem__'])
+
     def keys(self) -> Iterable[str]:
         if self.__data is None:
             raise NotImplementedError()
@@ -110,12 +575,47 @@ class Profile:
     def __getitem__(self, k) -> Trace:
         if self.__data is None:
             raise NotImplementedError()
-        return deepcopy(self.__data[k])
+        return self.__data[k].readonly_view()
+
+    def copy(self, k) -> Trace:
+        """
+        Return a writable :class:`Trace` for ``k`` that does not share
+        memory with this Profile. Modifications can be applied using
+        ``profile[k] = trace``.
+        """
+        return self[k].copy()
 
     def __setitem__(self, k, v):
         if self.__data is None:
             raise NotImplementedError()
         self.__data[k] = v
+        self._increment_version(k)
+
+    def version(self, k) -> int:
+        """
+        The number of times ``k`` has been assigned using ``profile[k] = trace``.
+        Modifications to the arrays of a :class:`Trace` that are not
+        assigned back to the profile are not counted.
+        """
+        versions = getattr(self, '_versions', None)
+        return 0 if versions is None else versions.get(k, 0)
+
+    def derived(self, name):
+        """
+        Return a quantity derived from one or more traces of this profile
+        (e.g., ``'sigma0'`` or ``'mixed_layer_depth'``). Values are
+        cached until one of the traces they are calculated from is assigned.
+        See :mod:`medsrtqc.derived` for the available quantities.
+
+        :param name: The name of a registered quantity.
+        """
+        from .derived import derived
+        return derived(self, name)
+
+    def _increment_version(self, k):
+        if getattr(self, '_versions', None) is None:
+            self._versions = {}
+        self._versions[k] = self._versions.get(k, 0) + 1
 
     def __iter__(self) -> Iterable[str]:
         return iter(self.keys())
@@ -141,3 +641,16 @@ class Profile:
         if self.__meta is None:
             raise NotImplementedError()
         self.__meta[k] = v
+
+
+def _counts_versions(setitem):
+    if getattr(setitem, '_counts_versions', False):
+        return setitem
+
+    @functools.wraps(setitem)
+    def wrapper(self, k, v):
+        setitem(self, k, v)
+        self._increment_version(k)
+
+    wrapper._counts_versions = True
+    return wrapper
@@ -0,0 +1,305 @@
+"""
+Some quantities are calculated from several traces of a
+:class:`medsrtqc.core.Profile` and are needed by more than one QC
+operation (e.g., potential density and the mixed layer depth).
+:meth:`medsrtqc.core.Profile.derived` calculates these once per profile
+and caches the result until one of the traces it depends on is assigned
+using ``profile[k] = trace`` (see :meth:`medsrtqc.core.Profile.version`).
+New quantities can be added using :func:`register`.
+
+:func:`derived_table` calculates the same quantities for every profile
+of a :class:`medsrtqc.batch.ProfileBatch` at once (e.g., a day of
+profiles) using the position of each profile. :func:`ctd_batch` and
+:func:`mixed_layer_depth_batch` do the same for concatenated arrays.
+
+>>> from medsrtqc.vms import read_vms_profiles
+>>> from medsrtqc.resources import resource_path
+>>> profile = read_vms_profiles(resource_path('bgc_vms.dat'))[0]
+>>> profile.derived('mixed_layer_depth')
+"""
+
+from typing import Iterable
+import numpy as np
+import gsw
+
+
+_registry = {}
+
+
+def register(name, inputs):
+    """
+    Register a function that calculates a derived quantity. The function
+    is called with the :class:`medsrtqc.core.Profile` as its only argument
+    and should raise ``ValueError`` if the quantity can't be calculated.
+    Array results are made read-only because they are shared by every
+    caller.
+
+    :param name: The name passed to :meth:`medsrtqc.core.Profile.derived`.
+    :param inputs: The names of the traces the quantity is calculated
+        from, including those used by other derived quantities it uses.
+
+    >>> import numpy as np
+    >>> from medsrtqc.derived import register
+    >>> @register('max_temp', inputs=('TEMP', ))
+    ... def max_temp(profile):
+    ...     return np.nanmax(profile['TEMP'].value)
+    """
+
+    def decorator(fun):
+        _registry[name] = (tuple(inputs), fun)
+        return fun
+
+    return decorator
+
+
+def derived_names() -> Iterable[str]:
+    """The names of all registered derived quantities"""
+    return tuple(_registry.keys())
+
+
+def derived(profile, name):
+    """
+    Calculate (or return the cached value of) the derived quantity ``name``
+    for ``profile``. This is usually called as ``profile.derived(name)``.
+    """
+
+    try:
+        inputs, fun = _registry[name]
+    except KeyError:
+        raise KeyError(f"'{name}' is not a registered derived quantity")
+
+    key = tuple(profile.version(k) for k in inputs)
+    cache = getattr(profile, '_derived_cache', None)
+    if cache is None:
+        cache = profile._derived_cache = {}
+    elif name in cache and cache[name][0] == key:
+        return cache[name][1]
+
+    value = fun(profile)
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    cache[name] = (key, value)
+    return value
+
+
+def _aligned_ctd(profile):
+    pres = profile['PRES']
+    temp = profile['TEMP']
+    psal = profile['PSAL']
+    if np.any(pres.value != temp.pres) or np.any(pres.value != psal.pres):
+        raise ValueError('PRES, TEMP, and PSAL are not aligned along the same pressure axis')
+    return pres, temp, psal
+
+
+@register('max_pres', inputs=('PRES', ))
+def _max_pres(profile):
+    return np.nanmax(profile['PRES'].value)
+
+
+@register('absolute_salinity', inputs=('PRES', 'TEMP', 'PSAL'))
+def _absolute_salinity(profile):
+    pres, _, psal = _aligned_ctd(profile)
+    # the longitude isn't actually important here because this is used
+    # to calculate relative density in the same location
+    longitude = 0
+    latitude = 0
+    return gsw.SA_from_SP(psal.value, pres.value, longitude, latitude)
+
+
+@register('conservative_temperature', inputs=('PRES', 'TEMP', 'PSAL'))
+def _conservative_temperature(profile):
+    pres, temp, _ = _aligned_ctd(profile)
+    return gsw.CT_from_t(profile.derived('absolute_salinity'), temp.value, pres.value)
+
+
+@register('sigma0', inputs=('PRES', 'TEMP', 'PSAL'))
+def _sigma0(profile):
+    return gsw.sigma0(profile.derived('absolute_salinity'), profile.derived('conservative_temperature'))
+
+
+@register('mixed_layer_depth', inputs=('PRES', 'TEMP', 'PSAL'))
+def _mixed_layer_depth(profile):
+    pres = profile['PRES']
+    density = profile.derived('sigma0')
+    mixed_layer_start = (np.abs(np.diff(density)) > 0.03) & (pres.value[1:] > 10)
+    if not np.any(mixed_layer_start):
+        raise ValueError("Can't determine mixed layer depth (no density changes > 0.03 below 10 dbar)")
+
+    return np.nanmin(pres.value[1:][mixed_layer_start])
+
+
+def ctd_batch(pres, temp, psal, offsets, longitude=0, latitude=0):
+    """
+    Calculate absolute salinity, conservative temperature, and potential
+    density for many profiles stored as one concatenated array per
+    parameter where ``pres[offsets[i]:offsets[i + 1]]`` are the levels
+    of profile ``i``. Each function from ``gsw`` is called once for
+    all profiles. Masked values are NaN in the result.
+
+    :param pres: Concatenated pressure values.
+    :param temp: Concatenated temperature values on the same levels.
+    :param psal: Concatenated practical salinity values on the same levels.
+    :param offsets: An integer array with one more element than there
+        are profiles.
+    :param longitude: The longitude of each profile (or one longitude for
+        all profiles).
+    :param latitude: The latitude of each profile (or one latitude for
+        all profiles).
+    :return: A ``dict()`` with the keys ``'absolute_salinity'``,
+        ``'conservative_temperature'``, and ``'sigma0'`` whose values
+        have the same length and offsets as ``pres``.
+    """
+
+    pres, temp, psal = (_filled(x) for x in (pres, temp, psal))
+    if len(temp) != len(pres) or len(psal) != len(pres):
+        raise ValueError('`pres`, `temp`, and `psal` must have the same length')
+
+    lengths = np.diff(_check_offsets(offsets, len(pres)))
+    longitude = np.repeat(np.broadcast_to(np.asarray(longitude, dtype=np.float64), lengths.shape), lengths)
+    latitude = np.repeat(np.broadcast_to(np.asarray(latitude, dtype=np.float64), lengths.shape), lengths)
+
+    abs_salinity = gsw.SA_from_SP(psal, pres, longitude, latitude)
+    cons_temp = gsw.CT_from_t(abs_salinity, temp, pres)
+    return {
+        'absolute_salinity': abs_salinity,
+        'conservative_temperature': cons_temp,
+        'sigma0': gsw.sigma0(abs_salinity, cons_temp)
+    }
+
+
+def mixed_layer_depth_batch(pres, sigma0, offsets) -> np.ndarray:
+    """
+    Calculate the mixed layer depth of many profiles stored as
+    concatenated arrays (see :func:`ctd_batch`) in one pass. The result
+    has one value per profile and is NaN for profiles whose mixed layer
+    depth can't be determined (no density changes > 0.03 below 10 dbar).
+    For other profiles the value is identical to that of
+    ``profile.derived('mixed_layer_depth')`` given the same density.
+
+    :param pres: Concatenated pressure values.
+    :param sigma0: Concatenated potential density values on the same levels.
+    :param offsets: An integer array with one more element than there
+        are profiles.
+    """
+
+    pres, sigma0 = _filled(pres), _filled(sigma0)
+    if len(sigma0) != len(pres):
+        raise ValueError('`pres` and `sigma0` must have the same length')
+    offsets = _check_offsets(offsets, len(pres))
+    starts = offsets[:-1]
+
+    # a level starts the mixed layer if the density changed since the
+    # previous level of the same profile
+    mixed_layer_start = np.zeros(len(pres), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        mixed_layer_start[1:] = (np.abs(np.diff(sigma0)) > 0.03) & (pres[1:] > 10)
+    mixed_layer_start[starts[starts < len(pres)]] = False
+
+    # the minimum of each profile's segment; empty profiles are skipped
+    # so that each segment ends where the next non-empty profile starts
+    candidates = np.where(mixed_layer_start, pres, np.inf)
+    non_empty = offsets[1:] > starts
+    mld = np.full(len(starts), np.inf)
+    if np.any(non_empty):
+        mld[non_empty] = np.minimum.reduceat(candidates, starts[non_empty])
+    mld[np.isinf(mld)] = np.nan
+    return mld
+
+
+def derived_table(batch, longitude=None, latitude=None):
+    """
+    Calculate the maximum pressure and mixed layer depth of every profile
+    in a :class:`medsrtqc.batch.ProfileBatch` using :func:`ctd_batch`
+    and :func:`mixed_layer_depth_batch`. Unlike
+    ``profile.derived()``, density is calculated using each
+    profile's ``longitude`` and ``latitude`` (set by
+    ``profile.prepare()``) or 0 if the position is missing.
+    Profiles whose ``TEMP`` and ``PSAL`` are not aligned along the
+    ``PRES`` axis have a NaN mixed layer depth.
+
+    :param batch: A :class:`medsrtqc.batch.ProfileBatch` containing
+        ``PRES``, ``TEMP``, and ``PSAL``.
+    :param longitude: The longitude of each profile. Defaults to the
+        ``longitude`` of each profile in the batch.
+    :param latitude: The latitude of each profile. Defaults to the
+        ``latitude`` of each profile in the batch.
+    :return: A ``dict()`` of column names to arrays with one row per
+        profile (i.e., row ``i`` is ``batch[i]``). The columns are
+        ``wmo``, ``cycle_number``, ``direction``, ``longitude``,
+        ``latitude`` (NaN if missing), ``max_pres``, and
+        ``mixed_layer_depth`` (NaN if it can't be determined).
+    """
+
+    missing = [k for k in ('PRES', 'TEMP', 'PSAL') if k not in batch.keys()]
+    if missing:
+        raise ValueError(f"Batch does not contain {', '.join(missing)}")
+
+    n = len(batch)
+    longitude = _position(batch.meta['longitude'] if longitude is None else longitude, n)
+    latitude = _position(batch.meta['latitude'] if latitude is None else latitude, n)
+
+    # only profiles with the same number of PRES, TEMP, and PSAL levels
+    # can be calculated at once
+    lengths = batch.lengths('PRES')
+    aligned = (batch.lengths('TEMP') == lengths) & (batch.lengths('PSAL') == lengths)
+    lengths = np.where(aligned, lengths, 0)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    pres = batch.column('PRES', readonly=True)
+    temp = batch.column('TEMP', readonly=True)
+    psal = batch.column('PSAL', readonly=True)
+    i_pres = _level_index(batch.offsets('PRES'), offsets)
+    i_temp = _level_index(batch.offsets('TEMP'), offsets)
+    i_psal = _level_index(batch.offsets('PSAL'), offsets)
+    pres_value = pres.value[i_pres]
+
+    # ...and whose TEMP and PSAL levels are at the same pressures
+    level_profile = np.repeat(np.arange(n), lengths)
+    for trace, i in ((temp, i_temp), (psal, i_psal)):
+        different = np.ma.filled(trace.pres[i] != pres_value, False)
+        aligned[level_profile[different]] = False
+
+    density = ctd_batch(pres_value, temp.value[i_temp], psal.value[i_psal], offsets,
+                        np.nan_to_num(longitude), np.nan_to_num(latitude))
+    mld = mixed_layer_depth_batch(pres_value, density['sigma0'], offsets)
+    mld[~aligned] = np.nan
+
+    max_pres = np.full(n, np.nan)
+    pres_offsets = batch.offsets('PRES')
+    non_empty = np.diff(pres_offsets) > 0
+    if np.any(non_empty):
+        with np.errstate(invalid='ignore'):
+            max_pres[non_empty] = np.fmax.reduceat(_filled(pres.value), pres_offsets[:-1][non_empty])
+
+    return {
+        'wmo': np.array(batch.meta['wmo'], dtype=object),
+        'cycle_number': np.array(batch.meta['cycle_number'], dtype=object),
+        'direction': np.array(batch.meta['direction'], dtype=object),
+        'longitude': longitude,
+        'latitude': latitude,
+        'max_pres': max_pres,
+        'mixed_layer_depth': mld
+    }
+
+
+def _filled(x):
+    return np.ma.filled(np.ma.asarray(x).astype(np.float64), np.nan)
+
+
+def _check_offsets(offsets, n):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != n or np.any(np.diff(offsets) < 0):
+        raise ValueError('`offsets` must increase from 0 to the number of levels')
+    return offsets
+
+
+def _position(values, n):
+    values = np.broadcast_to(np.asarray(values, dtype=object), (n, ))
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _level_index(source_offsets, offsets):
+    # the index within a column of each level selected by `offsets`,
+    # which has the same number of profiles but possibly fewer levels
+    lengths = np.diff(offsets)
+    return np.repeat(source_offsets[:-1] - offsets[:-1], lengths) + np.arange(offsets[-1])
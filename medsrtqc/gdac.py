@@ -0,0 +1,448 @@
+"""
+The Argo GDAC publishes index files listing every profile file with
+its date, position, ocean, institution, and (for BGC and synthetic
+profiles) the parameters it contains. This module parses these files
+into a columnar :class:`ProfileIndex` that can be saved as a directory
+of ``.npy`` files and memory-mapped with :func:`load_index`, so that
+profiles can be selected from millions of rows using vectorized
+queries before any NetCDF files are opened.
+
+>>> from medsrtqc.gdac import read_index, load_index
+>>> from medsrtqc.remote import prefetch
+>>> from medsrtqc.nc import read_nc_profile
+>>> index = read_index('bgc', cache=True)
+>>> index.save('bgc-index')
+>>> index = load_index('bgc-index')
+>>> selected = index.query(
+...     parameters='BBP700',
+...     date_min='2022-01-01',
+...     bbox=(-70, 40, -40, 60)
+... )
+>>> urls = selected.urls()
+>>> prefetch(urls, workers=8)
+>>> profiles = [read_nc_profile(url, cache=True) for url in urls]
+"""
+
+import os
+import io
+import gzip
+import json
+import numpy as np
+from . import remote
+
+
+#: The base URL of profile files listed in GDAC index files.
+GDAC_URL = 'https://data-argo.ifremer.fr/dac/'
+
+#: The URLs of the GDAC index files that can be passed to
+#: :func:`read_index` by name.
+INDEX_URLS = {
+    'core': 'https://data-argo.ifremer.fr/ar_index_global_prof.txt.gz',
+    'bgc': 'https://data-argo.ifremer.fr/argo_bio-profile_index.txt.gz',
+    'synthetic': 'https://data-argo.ifremer.fr/argo_synthetic-profile_index.txt.gz'
+}
+
+
+class ProfileIndex:
+    """
+    A columnar representation of a GDAC profile index. Columns are
+    ``numpy`` arrays that can be accessed using ``index['latitude']``;
+    ``index[mask]`` returns a new :class:`ProfileIndex` containing the
+    rows selected by a boolean mask or integer indices. These objects
+    are usually created by :func:`read_index` or :func:`load_index`.
+
+    The columns are ``file``, ``date``, ``date_update`` (``datetime64[s]``),
+    ``latitude``, ``longitude`` (``float64``), ``ocean``, ``institution``
+    (bytes), ``profiler_type``, ``wmo``, and ``cycle_number`` (integers;
+    ``-1`` if missing). For BGC and synthetic indexes, the
+    ``parameters`` column is a bit-packed ``uint8`` array with one bit
+    per item of :attr:`parameters`.
+    """
+
+    def __init__(self, columns, parameters=(), header=()):
+        """
+        :param columns: A ``dict()`` of column names to arrays.
+        :param parameters: The parameter names encoded by the
+            ``parameters`` column.
+        :param header: The comment lines from the top of the index file.
+        """
+        self._columns = dict(columns)
+        self._parameters = tuple(parameters)
+        self._header = tuple(header)
+
+        lengths = set(len(v) for v in self._columns.values())
+        if len(lengths) > 1:
+            raise ValueError('All columns of a ProfileIndex must have the same length')
+
+    @property
+    def columns(self):
+        """The column names"""
+        return tuple(self._columns.keys())
+
+    @property
+    def parameters(self):
+        """The parameter names that can be used to query the ``parameters`` column"""
+        return self._parameters
+
+    @property
+    def header(self):
+        """The comment lines from the top of the index file"""
+        return self._header
+
+    def has_parameter(self, parameter):
+        """
+        A boolean mask of rows whose files contain ``parameter``.
+        """
+
+        if parameter not in self._parameters:
+            return np.zeros(len(self), dtype=bool)
+
+        j = self._parameters.index(parameter)
+        packed = self._columns['parameters']
+        return (packed[:, j // 8] & (0x80 >> (j % 8))) != 0
+
+    def row_parameters(self, i):
+        """The ``tuple()`` of parameter names for row ``i``."""
+        if 'parameters' not in self._columns:
+            return ()
+
+        bits = np.unpackbits(self._columns['parameters'][i], count=len(self._parameters))
+        return tuple(p for p, bit in zip(self._parameters, bits) if bit)
+
+    def mask(self, wmo=None, cycle_number=None, date_min=None, date_max=None,
+             bbox=None, ocean=None, institution=None, parameters=None):
+        """
+        A boolean mask of rows that match all of the (non-``None``)
+        criteria.
+
+        :param wmo: One or more float WMO numbers.
+        :param cycle_number: One or more cycle numbers.
+        :param date_min: The earliest profile date (inclusive) as
+            a ``numpy.datetime64`` or ISO 8601 string.
+        :param date_max: The latest profile date (exclusive).
+        :param bbox: A ``tuple()`` of ``(lon_min, lat_min, lon_max, lat_max)``.
+            Use ``lon_min > lon_max`` for a box that crosses the antimeridian.
+        :param ocean: One or more ocean codes (e.g., ``'A'``).
+        :param institution: One or more institution codes (e.g., ``'ME'``).
+        :param parameters: One or more parameter names that must all be
+            present.
+        """
+
+        mask = np.ones(len(self), dtype=bool)
+        if wmo is not None:
+            mask &= np.isin(self._columns['wmo'], np.atleast_1d(wmo))
+        if cycle_number is not None:
+            mask &= np.isin(self._columns['cycle_number'], np.atleast_1d(cycle_number))
+        if date_min is not None:
+            mask &= self._columns['date'] >= np.datetime64(date_min, 's')
+        if date_max is not None:
+            mask &= self._columns['date'] < np.datetime64(date_max, 's')
+        if bbox is not None:
+            lon_min, lat_min, lon_max, lat_max = bbox
+            lon = self._columns['longitude']
+            lat = self._columns['latitude']
+            mask &= (lat >= lat_min) & (lat <= lat_max)
+            if lon_min <= lon_max:
+                mask &= (lon >= lon_min) & (lon <= lon_max)
+            else:
+                mask &= (lon >= lon_min) | (lon <= lon_max)
+        if ocean is not None:
+            mask &= np.isin(self._columns['ocean'], _as_bytes(ocean))
+        if institution is not None:
+            mask &= np.isin(self._columns['institution'], _as_bytes(institution))
+        if parameters is not None:
+            for parameter in ([parameters] if isinstance(parameters, str) else parameters):
+                mask &= self.has_parameter(parameter)
+
+        return mask
+
+    def query(self, **kwargs):
+        """
+        A new :class:`ProfileIndex` with the rows that match the criteria.
+        See :meth:`mask` for arguments.
+        """
+        return self[self.mask(**kwargs)]
+
+    def files(self):
+        """The ``list()`` of file paths relative to the ``dac/`` directory."""
+        return [f.decode('utf-8') for f in self._columns['file'].tolist()]
+
+    def urls(self, base=GDAC_URL):
+        """
+        The ``list()`` of URLs for each row, which can be passed to
+        :func:`medsrtqc.nc.read_nc_profile` or :func:`medsrtqc.remote.prefetch`.
+
+        :param base: The URL or directory of the GDAC ``dac/`` directory.
+        """
+        base = base if base.endswith('/') else base + '/'
+        return [base + f for f in self.files()]
+
+    def save(self, path):
+        """
+        Write this index to a directory with one ``.npy`` file per column
+        that can be memory-mapped using :func:`load_index`.
+
+        :param path: The directory, which is created if it does not exist.
+        """
+
+        os.makedirs(path, exist_ok=True)
+        for name, values in self._columns.items():
+            np.save(os.path.join(path, name + '.npy'), values)
+
+        meta = {
+            'columns': list(self._columns.keys()),
+            'parameters': list(self._parameters),
+            'header': list(self._header)
+        }
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def __getitem__(self, k):
+        if isinstance(k, str):
+            return self._columns[k]
+
+        return ProfileIndex(
+            {name: values[k] for name, values in self._columns.items()},
+            self._parameters,
+            self._header
+        )
+
+    def __len__(self):
+        return len(self._columns['file'])
+
+    def __repr__(self):
+        return f'ProfileIndex({len(self)} profiles)'
+
+
+def read_index(src, cache=None) -> ProfileIndex:
+    """
+    Parse a GDAC profile index file (e.g., ``ar_index_global_prof.txt``,
+    ``argo_bio-profile_index.txt``, or ``argo_synthetic-profile_index.txt``).
+    Gzipped files are decompressed automatically.
+
+    :param src: One of ``'core'``, ``'bgc'``, or ``'synthetic'`` (see
+        :data:`INDEX_URLS`), a URL, a filename, or the ``bytes`` content
+        of an index file.
+    :param cache: Passed to :func:`medsrtqc.remote.fetch` when ``src``
+        is a URL.
+    """
+
+    if isinstance(src, str) and src in INDEX_URLS:
+        src = INDEX_URLS[src]
+
+    if isinstance(src, bytes):
+        content = src
+    elif isinstance(src, str) and src.startswith(('http://', 'https://', 'ftp://')):
+        content = remote.fetch(src, cache=cache)
+    elif isinstance(src, str):
+        with open(src, 'rb') as f:
+            content = f.read()
+    else:
+        raise TypeError('`src` must be an index name, url, filename, or bytes')
+
+    if content[:2] == b'\x1f\x8b':
+        content = gzip.decompress(content)
+
+    return _parse_index(content)
+
+
+def load_index(path, mmap=True) -> ProfileIndex:
+    """
+    Load a :class:`ProfileIndex` written by :meth:`ProfileIndex.save`.
+
+    :param path: The directory containing the index.
+    :param mmap: Use ``False`` to read columns into memory rather than
+        memory-mapping them.
+    """
+
+    with open(os.path.join(path, 'index.json')) as f:
+        meta = json.load(f)
+
+    mmap_mode = 'r' if mmap else None
+    columns = {
+        name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+        for name in meta['columns']
+    }
+    return ProfileIndex(columns, meta['parameters'], meta['header'])
+
+
+def _parse_index(content):
+    # comment lines and the column names
+    header = []
+    pos = 0
+    while content.startswith(b'#', pos):
+        end = _line_end(content, pos)
+        header.append(content[pos:end].decode('utf-8').rstrip())
+        pos = end + 1
+
+    end = _line_end(content, pos)
+    names = [item.strip() for item in content[pos:end].decode('utf-8').split(',')]
+    if not names[0]:
+        raise ValueError('Index file has no column header')
+    pos = end + 1
+
+    columns = {name: [] for name in _COLUMN_NAMES}
+    parameters = _ParameterEncoder() if 'parameters' in names else None
+    while pos < len(content):
+        # parse in chunks of complete lines to limit the size of
+        # the intermediate table of strings
+        end = _line_end(content, min(pos + _CHUNK_SIZE, len(content)))
+        table = np.loadtxt(
+            io.BytesIO(content[pos:end]), delimiter=',', dtype='S',
+            comments=None, ndmin=2, encoding=None
+        )
+        pos = end + 1
+        if table.shape[0] == 0:
+            continue
+        if table.shape[1] != len(names):  # pragma: no cover
+            raise ValueError(f'Expected {len(names)} columns but found {table.shape[1]}')
+
+        chunk = dict(zip(names, table.T))
+        empty = np.zeros(table.shape[0], dtype='S1')
+        for name, values in _parse_chunk(chunk, empty).items():
+            columns[name].append(values)
+        if parameters is not None:
+            parameters.add(chunk['parameters'])
+
+    columns = {
+        name: np.concatenate(chunks) if chunks else _empty_column(name)
+        for name, chunks in columns.items()
+    }
+    columns['file'] = columns['file'].astype(_fit_bytes(columns['file']))
+
+    if parameters is None:
+        return ProfileIndex(columns, (), header)
+
+    parameter_names, columns['parameters'] = parameters.encode()
+    return ProfileIndex(columns, parameter_names, header)
+
+
+_COLUMN_NAMES = (
+    'file', 'date', 'latitude', 'longitude', 'ocean', 'profiler_type',
+    'institution', 'date_update', 'wmo', 'cycle_number'
+)
+
+_CHUNK_SIZE = 2 ** 21
+
+
+def _parse_chunk(chunk, empty):
+    files = chunk['file']
+    files = files.astype(_fit_bytes(files))
+    wmo, cycle_number = _path_numbers(files)
+    return {
+        'file': files,
+        'date': _parse_dates(chunk.get('date', empty)),
+        'latitude': _parse_float(chunk.get('latitude', empty)),
+        'longitude': _parse_float(chunk.get('longitude', empty)),
+        'ocean': chunk.get('ocean', empty).astype('S1'),
+        'profiler_type': _parse_int(chunk.get('profiler_type', empty)),
+        'institution': chunk.get('institution', empty).astype('S2'),
+        'date_update': _parse_dates(chunk.get('date_update', empty)),
+        'wmo': wmo,
+        'cycle_number': cycle_number
+    }
+
+
+def _empty_column(name):
+    return _parse_chunk({'file': np.zeros(0, dtype='S1')}, np.zeros(0, dtype='S1'))[name]
+
+
+class _ParameterEncoder:
+    # the same combinations of parameters are repeated for every
+    # profile from a float, so each unique string is only split once
+
+    def __init__(self):
+        self._ids = {}
+        self._chunks = []
+
+    def add(self, values):
+        unique, inverse = np.unique(values, return_inverse=True)
+        ids = np.array([self._ids.setdefault(item, len(self._ids)) for item in unique.tolist()], dtype=np.int64)
+        self._chunks.append(ids[inverse.reshape(-1)])
+
+    def encode(self):
+        unique_split = [item.decode('utf-8').split() for item in self._ids.keys()]
+        parameters = sorted(set(p for item in unique_split for p in item))
+        lookup = {p: j for j, p in enumerate(parameters)}
+
+        unique_bits = np.zeros((len(unique_split), len(parameters)), dtype=bool)
+        for i, item in enumerate(unique_split):
+            unique_bits[i, [lookup[p] for p in item]] = True
+
+        packed = np.packbits(unique_bits, axis=1)
+        ids = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.int64)
+        return tuple(parameters), packed[ids]
+
+
+def _line_end(content, pos):
+    end = content.find(b'\n', pos)
+    return len(content) if end == -1 else end
+
+
+def _fit_bytes(values):
+    width = int(np.char.str_len(values).max()) if len(values) else 1
+    return f'S{max(width, 1)}'
+
+
+def _parse_dates(values):
+    values = np.char.strip(values).astype('S14')
+    out = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[s]')
+    if len(values) == 0:
+        return out
+
+    digits = values.view(np.uint8).reshape((len(values), 14)).astype(np.int64) - ord('0')
+    valid = np.all((digits >= 0) & (digits <= 9), axis=1)
+    digits = digits[valid]
+
+    def number(start, end):
+        return digits[:, start:end] @ (10 ** np.arange(end - start - 1, -1, -1))
+
+    months = (number(0, 4) - 1970) * 12 + number(4, 6) - 1
+    days = months.astype('datetime64[M]').astype('datetime64[D]') + (number(6, 8) - 1)
+    seconds = number(8, 10) * 3600 + number(10, 12) * 60 + number(12, 14)
+    out[valid] = days.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+    return out
+
+
+def _parse_float(values):
+    values = np.char.strip(values)
+    values[values == b''] = b'nan'
+    return values.astype(np.float64)
+
+
+def _parse_int(values):
+    values = np.char.strip(values)
+    valid = np.char.isdigit(values)
+    out = np.full(len(values), -1, dtype=np.int64)
+    out[valid] = values[valid].astype(np.int64)
+    return out
+
+
+def _path_numbers(files):
+    # the WMO number is the second component of the path (e.g.,
+    # meds/4902480/profiles/BR4902480_001.nc) and the cycle number
+    # follows the '_' in the file name
+    n = len(files)
+    width = files.dtype.itemsize
+    chars = files.view(np.uint8).reshape((n, width))
+    slash = chars == ord('/')
+    part = np.cumsum(slash, axis=1)
+    digit = (chars >= ord('0')) & (chars <= ord('9'))
+
+    in_name = part == part[:, -1:]
+    after_underscore = np.cumsum((chars == ord('_')) & in_name, axis=1) > 0
+    return _digits_to_int(chars, digit & (part == 1)), _digits_to_int(chars, digit & in_name & after_underscore)
+
+
+def _digits_to_int(chars, mask):
+    value = np.zeros(len(chars), dtype=np.int64)
+    for j in range(chars.shape[1]):
+        m = mask[:, j]
+        value[m] = value[m] * 10 + (chars[m, j] - ord('0'))
+    value[~np.any(mask, axis=1)] = -1
+    return value
+
+
+def _as_bytes(values):
+    values = [values] if isinstance(values, (str, bytes)) else values
+    return [v.encode('utf-8') if isinstance(v, str) else v for v in values]
@@ -8,17 +8,18 @@ will only ever use :func:`read_nc_profile`.
 """
 
 from typing import Iterable
-import urllib.request
-import io
 import os
 import shutil
+import tempfile
+import warnings
 import reprlib
 import numpy as np
-from netCDF4 import Dataset, chartostring
-from .core import Profile, Trace
+from netCDF4 import Dataset, chartostring, default_fillvals
+from .core import Profile, Trace, Alignment
 from .vms.read import check_vms, translate_vms
-from .qc.history import QCx
+from .qc.history import QCx, bitmask_to_hex
 from .resources import resource_path
+from . import remote
 
 
 class NetCDFProfile(Profile):
@@ -30,82 +31,156 @@ class NetCDFProfile(Profile):
     a core and a BGC file). When this is the case, the variables
     from the first file mask those of subsequent files. These objects
     are normally created from :func:`read_nc_profile`.
+
+    Multi-profile files can be restricted to a single ``N_PROF`` (or
+    consecutive ``N_PROF`` of one cycle) using ``i_prof``. Use
+    :func:`iter_nc_profiles` to create one object per ``N_PROF`` (or
+    cycle) that all share the same open ``Dataset`` objects.
     """
 
-    def __init__(self, *dataset):
+    def __init__(self, *dataset, i_prof=None, raw=False, _cache=None):
         """
         :param dataset: One or more existing ``netCDF4.Dataset``s.
+        :param i_prof: The index along the ``N_PROF`` dimension of each
+            ``Dataset`` to use, a ``range()`` of consecutive indices, or
+            ``None`` to use all of them. When more than one ``N_PROF`` is
+            used, each parameter is read from the first that contains it
+            and metadata are read from the first.
+        :param raw: Use ``True`` to read variables without netCDF4's
+            automatic masking and compute masks from ``_FillValue`` and
+            valid range attributes in a single pass. The resulting
+            :class:`medsrtqc.core.Trace` objects are identical.
         """
         super().__init__()
         self._datasets = list(dataset)
+        self._i_prof = i_prof
+        if i_prof is None or isinstance(i_prof, range):
+            self._prof_rows = i_prof
+        else:
+            self._prof_rows = range(i_prof, i_prof + 1)
+        # a cache passed from iter_nc_profiles() is shared among profiles
+        # and the datasets are closed when iteration completes
+        self._shared = _cache is not None
+        self._cache = _VariableCache(self._datasets, raw=raw) if _cache is None else _cache
+        self._trace_attrs = {}
         self._variables = None
         for dataset_id in range(len(self._datasets)):
             self._variables = self._locate_variables(dataset_id, self._variables)
 
     def prepare(self, tests=[]):
 
-        self.direction = None
-        self.direction = [d['DIRECTION'][:][0].decode() for d in self._datasets] if len(self._datasets) > 1 else self._datasets[0]['DIRECTION'][:][0].decode()
+        i_prof = 0 if self._prof_rows is None else self._prof_rows.start
+        direction = [np.ma.getdata(self._cache.read(i, 'DIRECTION'))[i_prof].decode() for i in range(len(self._datasets))]
+        self.direction = direction if len(direction) > 1 else direction[0]
         self.wmo = self.read_platform_number()
-        self.cycle_number = [d['CYCLE_NUMBER'][:][0] for d in self._datasets]
+        self.cycle_number = [self._cache.read(i, 'CYCLE_NUMBER')[i_prof] for i in range(len(self._datasets))]
         self.parking_pres = self.get_park_depth()
         self.wmo = self.wmo[0] if len(self.wmo) == 1 else self.wmo
         self.cycle_number = self.cycle_number[0] if len(self.cycle_number) == 1 else self.cycle_number
         self.parking_pres = self.parking_pres[0] if len(self.parking_pres) == 1 else self.parking_pres
 
+        # the position is the same in each file so use the first
+        position = []
+        for var in ('LATITUDE', 'LONGITUDE'):
+            value = self._cache.read(0, var)[i_prof] if self._cache.has_variable(0, var) else np.ma.masked
+            position.append(None if np.ma.is_masked(value) else float(value))
+        self.latitude, self.longitude = position
+
         # don't add QCP/QCF if we are not going to perform any tests
         if len(tests) > 0:
             self.qc_tests = QCx.qc_tests(self.read_history_qc('QCP$'), self.read_history_qc('QCF$'))
 
+    def flush(self):
+        """
+        Write traces that were assigned since the last call to
+        :meth:`flush` to the underlying ``Dataset`` objects.
+        Requires that ``Dataset`` objects were opened with ``mode='r+'``;
+        otherwise, a warning is issued and changes are kept so that
+        they can be written to a new file using :meth:`save`.
+        """
+        self._cache.flush()
+
+    def save(self, dest, dataset_id=0):
+        """
+        Write a copy of one of the underlying ``Dataset`` objects that
+        includes the traces that were assigned since the last call to
+        :meth:`flush` or :meth:`save`. The source is never modified, so it
+        can be opened with ``mode='r'``. Files on disk are copied as bytes
+        and only modified variables are rewritten. The copy is written to a
+        temporary file in the same directory and moved to ``dest`` when
+        complete so that ``dest`` is never a partially-written file.
+
+        :param dest: The filename of the new NetCDF file.
+        :param dataset_id: The index of the ``Dataset`` to write if more
+            than one was passed when this object was created.
+
+        >>> from medsrtqc.nc import read_nc_profile
+        >>> from medsrtqc.resources import resource_path
+        >>> profile = read_nc_profile(resource_path('BD6903197_026.nc'))
+        >>> bbp = profile['BBP700']
+        >>> bbp.qc[:] = b'3'
+        >>> profile['BBP700'] = bbp
+        >>> profile.save('BD6903197_026_qc.nc')
+        """
+        self._cache.save(dataset_id, dest)
+
     def close(self):
         """
-        Write changes to underlying data (if any) to disk. Requires
-        that ``Dataset`` objects were opened with ``mode='r+'``.
+        Write changes to underlying data (if any) to disk (see :meth:`flush`)
+        and close the underlying ``Dataset`` objects. Objects
+        created by :func:`iter_nc_profiles` only write changes because the
+        ``Dataset`` objects are shared with other profiles.
         """
-        for dataset in self._datasets:
-            dataset.close()
+        self.flush()
+        if not self._shared:
+            for dataset in self._datasets:
+                dataset.close()
 
     def read_history_qc(self, v):
-        data = self._datasets
-        for d in data:
+        for dataset_id, d in enumerate(self._datasets):
             # find qcp
-            for i, hist in enumerate(d['HISTORY_ACTION'][:]):
-                for p, h in enumerate(hist):
-                    if read_ncstr(h) == v:
-                        return read_ncstr(d['HISTORY_QCTEST'][:][i,p,:])
-    
+            locations = self._history_locations(dataset_id, v)
+            if locations:
+                i, p = locations[0]
+                return read_ncstr(self._cache.read(dataset_id, 'HISTORY_QCTEST')[i, p, :])
+
     def update_qcx(self):
 
         if not hasattr(self, 'qc_tests'): # pragma: no cover
             raise LookupError('Profile has no attribute qc_tests, call NetCDFProfile().prepare() to add it')
-        
-        dataset = self._datasets[0]
-        for i, hist in enumerate(dataset['HISTORY_ACTION'][:]):
-            for p, h in enumerate(hist):
-                if read_ncstr(h) == 'QCP$':
-                    try:
-                        dataset['HISTORY_QCTEST'][i, p, :] = QCx.array_to_hex(self.qc_tests[0,:])
-                    except RuntimeError:
-                        Warning('netCDF will not be edited - opened in read-only mode - open using read_nc_profile(fn, mode="r+" to edit nc file')
-                elif read_ncstr(h) == 'QCF$':
-                    try:
-                        dataset['HISTORY_QCTEST'][i, p, :] = QCx.array_to_hex(self.qc_tests[1,:])
-                    except RuntimeError:
-                        Warning('netCDF will not be edited - opened in read-only mode - open using read_nc_profile(fn, mode="r+" to edit nc file')
-        
+
+        qcp, qcf = QCx.bitmask(self.qc_tests)
+        for action, bitmask in (('QCP$', qcp), ('QCF$', qcf)):
+            # HISTORY_QCTEST is 16 upper-case hex digits (STRING16)
+            code = bitmask_to_hex(bitmask, width=16).encode('ascii')
+            for i, p in self._history_locations(0, action):
+                self._cache.write(0, 'HISTORY_QCTEST', (i, p), np.frombuffer(code, dtype='S1'))
+
+    def _history_locations(self, dataset_id, action):
+        locations = self._cache.history_index(dataset_id).get(action, [])
+        if self._prof_rows is None:
+            return locations
+        else:
+            return [(i, p) for i, p in locations if p in self._prof_rows]
+
     def _locate_variables(self, dataset_id, all_params=None):
-        dataset = self._datasets[dataset_id]
-        param_array = chartostring(dataset['PARAMETER'][:])
-        n_prof = len(dataset.dimensions['N_PROF'])
+        param_array = read_ncstr_array(self._cache.read(dataset_id, 'PARAMETER'))
+        offset = 0
+        if self._prof_rows is not None:
+            param_array = param_array[self._prof_rows.start:self._prof_rows.stop]
+            offset = self._prof_rows.start
+        n_per_prof = max(int(np.prod(param_array.shape[1:])), 1)
 
         if all_params is None:
             all_params = {}
 
-        for i_prof in range(n_prof):
-            for item in np.nditer(param_array[i_prof]):
-                item_trim = str(item).strip()
-                if item_trim and item_trim not in all_params:
-                    all_params[item_trim] = (dataset_id, i_prof)
+        # the first profile listing each parameter (in order of appearance)
+        names, first = np.unique(param_array.reshape(-1), return_index=True)
+        order = np.argsort(first)
+        for item, i_prof in zip(names[order], first[order] // n_per_prof + offset):
+            item = str(item)
+            if item and item not in all_params:
+                all_params[item] = (dataset_id, int(i_prof))
 
         return all_params
 
@@ -119,71 +194,91 @@ class NetCDFProfile(Profile):
         k = translate_vms(k) if check_vms(k) else k
 
         dataset_id, i_prof = self._variables[k]
-        var_names = self._var_names(k)
-        var_values = self._calculate_trace_attrs(self._datasets[dataset_id], i_prof, var_names)
+        var_values = self._cached_trace_attrs(k, dataset_id, i_prof)
 
         try:
-            return Trace(**var_values)
+            # copy so that the cached variables are not modified
+            return Trace(**{attr: v.copy() for attr, v in var_values.items()})
         except Exception as e:  # pragma: no cover
             raise ValueError(f"Error creating Trace for '{k}'") from e
 
+    def copy(self, k) -> Trace:
+        # __getitem__ already returns a new Trace on every call
+        return self[k]
+
     def __setitem__(self, k, v):
+        self._assign(k, v)
+
+    def _assign(self, k, v, attrs=None):
+        # attrs limits the attributes of v that are written (e.g., to the
+        # ones that changed); shapes are checked for all of them
         k = translate_vms(k) if check_vms(k) else k
         
         var_names = self._var_names(k)
+        dataset_id, i_prof = self._variables[k]
 
-        # check shapes against current
-        current_value = self[k]
+        # check shapes against current (attributes that are omitted
+        # from the Trace have the shape of its value)
+        current = self._cached_trace_attrs(k, dataset_id, i_prof)
         for attr in var_names.keys():
-            if getattr(v, attr).shape != getattr(current_value, attr).shape:
+            current_shape = current[attr].shape if attr in current else current['value'].shape
+            if getattr(v, attr).shape != current_shape:
                 raise ValueError("Shape mismatch between new and current")
 
         # (should also check values against current)
 
-        dataset_id, i_prof = self._variables[k]
-        dataset = self._datasets[dataset_id]
         for attr, var in var_names.items():
-            if var not in dataset.variables:
-                continue
-            try:
-                dataset[var][i_prof, range(len(v))] = getattr(v, attr)
-            except RuntimeError:
-                Warning('netCDF will not be edited - opened in read-only mode - open using read_nc_profile(fn, mode="r+" to edit nc file')
+            if (attrs is None or attr in attrs) and self._cache.has_variable(dataset_id, var):
+                self._cache.write(dataset_id, var, (i_prof, ), getattr(v, attr))
 
-    def _calculate_trace_attrs(self, dataset, i_prof, var_names):
+        # PRES and MTIME are shared with other parameters, so trimmed lengths
+        # for every parameter of this profile may have changed
+        for key in [key for key in self._trace_attrs if key[1:] == (dataset_id, i_prof)]:
+            del self._trace_attrs[key]
+
+    def _cached_trace_attrs(self, k, dataset_id, i_prof):
+        key = (k, dataset_id, i_prof)
+        if key not in self._trace_attrs:
+            self._trace_attrs[key] = self._calculate_trace_attrs(dataset_id, i_prof, self._var_names(k))
+        return self._trace_attrs[key]
+
+    def _calculate_trace_attrs(self, dataset_id, i_prof, var_names):
         """
         Trims trailing values that are masked for all attrs and omits
         those that are all mask.
         """
 
         var_values = {}
+        var_stats = {}
         for trace_name, nc_key in var_names.items():
-            if nc_key in dataset.variables:
-                var_values[trace_name] = dataset[nc_key][i_prof]
+            if self._cache.has_variable(dataset_id, nc_key):
+                var_values[trace_name] = self._cache.read(dataset_id, nc_key)[i_prof]
+                var_stats[trace_name] = self._cache.mask_stats(dataset_id, nc_key)[i_prof]
 
         # don't include non value variables that are 100% mask
         for var in list(var_values.keys()):
-            if var != 'value' and np.all(var_values[var].mask):
+            if var != 'value' and var_stats[var]['all_masked']:
                 del var_values[var]
 
         # don't include trailing fill values when all variables have a trailing fill
         if len(var_values['value']):
-            last_finite = self._calc_finite_length(var_values)
+            last_finite = self._calc_finite_length(var_values, var_stats)
             if last_finite:
                 for var in list(var_values.keys()):
                     var_values[var] = var_values[var][:max(last_finite)]
 
         return var_values
 
-    def _calc_finite_length(self, var_values):
+    def _calc_finite_length(self, var_values, var_stats):
         last_finite = []
         n_values = len(var_values['value'])
 
-        for v in var_values.values():
-            if not np.any(v.mask):
+        for var in var_values.keys():
+            stats = var_stats[var]
+            if not stats['any_masked']:
                 last_finite.append(n_values)
-            elif not np.all(v.mask):
-                last_finite.append(np.where(~v.mask)[0].max())
+            elif not stats['all_masked']:
+                last_finite.append(int(stats['last_unmasked']))
         return last_finite
 
     def _var_names(self, k):
@@ -211,17 +306,439 @@ class NetCDFProfile(Profile):
         return parking_depth
     
     def read_platform_number(self):
-        wmo = len(self._datasets)*[None]
-        for i,d in enumerate(self._datasets):
-            arr = d['PLATFORM_NUMBER'][:][0,:]
-            arr = arr.data if hasattr(arr, 'mask') else arr
-            decode_str = np.array([f.decode('utf-8') for f in arr])
-            out = ''.join(decode_str).strip()
-            wmo[i] = out
+        i_prof = 0 if self._prof_rows is None else self._prof_rows.start
+        return [read_ncstr(self._cache.read(i, 'PLATFORM_NUMBER')[i_prof]) for i in range(len(self._datasets))]
+
+
+class SyntheticProfile(Profile):
+    """
+    A view of a :class:`NetCDFProfile` with every parameter on a single,
+    increasing pressure axis like the Argo synthetic ("S") profile files.
+    The axis is the union of the ``PRES`` levels of every ``N_PROF`` that
+    contributes a parameter (e.g., the core profile and each BGC sampling
+    scheme). Levels where a parameter was not sampled are masked and the
+    ``pres`` of every :class:`medsrtqc.core.Trace` is the merged axis.
+    Source levels without a valid pressure are omitted and the last of
+    repeated pressures within one ``N_PROF`` is used.
+
+    Assigning a :class:`medsrtqc.core.Trace` maps it back to the source
+    level used for each merged level and assigns the attributes that
+    changed to the :class:`NetCDFProfile`, so flags set by QC tests on the
+    merged profile are written using :meth:`NetCDFProfile.flush` or
+    :meth:`NetCDFProfile.save` as usual.
+
+    >>> from medsrtqc.nc import read_nc_profile, SyntheticProfile
+    >>> from medsrtqc.resources import resource_path
+    >>> profile = read_nc_profile(
+    ...     resource_path('R6904117_085.nc'),
+    ...     resource_path('BD6903197_026.nc')
+    ... )
+    >>> synthetic = SyntheticProfile(profile)
+    >>> temp, chla = synthetic['TEMP'], synthetic['CHLA']
+    >>> both = ~temp.value.mask & ~chla.value.mask
+    """
+
+    def __init__(self, profile, keys=None):
+        """
+        :param profile: A :class:`NetCDFProfile`.
+        :param keys: The parameters to include. Defaults to all
+            parameters of ``profile``.
+        """
+        super().__init__()
+        self._profile = profile
+        self._keys = tuple(profile.keys() if keys is None else keys)
+        self._rows = {k: profile._variables[k] for k in self._keys}
+
+        # only levels within the (trimmed) traces of some parameter are merged
+        sizes = {}
+        for k, row in self._rows.items():
+            size = len(profile._cached_trace_attrs(k, *row)['value'])
+            sizes[row] = max(sizes.get(row, 0), size)
+        self._pres, self._row_levels = self._merge(sizes)
+
+    @property
+    def profile(self):
+        """The source :class:`NetCDFProfile`"""
+        return self._profile
+
+    @property
+    def pres(self):
+        """The merged pressure axis"""
+        return self._pres
+
+    def prepare(self, tests=[]):
+        self._profile.prepare(tests)
+        for attr in ('direction', 'wmo', 'cycle_number', 'parking_pres', 'latitude', 'longitude', 'qc_tests'):
+            if hasattr(self._profile, attr):
+                setattr(self, attr, getattr(self._profile, attr))
+
+    def update_qcx(self):
+        self._profile.qc_tests = self.qc_tests
+        self._profile.update_qcx()
+
+    def levels(self, k):
+        """
+        The index along :attr:`pres` of each level of the source
+        :class:`medsrtqc.core.Trace` for ``k`` (i.e., ``profile[k]``)
+        or ``-1`` for levels without a valid pressure.
+        """
+        k = translate_vms(k) if check_vms(k) else k
+        row = self._rows[k]
+        size = len(self._profile._cached_trace_attrs(k, *row)['value'])
+        return self._row_levels[row][:size]
+
+    def alignment(self, k) -> Alignment:
+        """
+        An exact :class:`medsrtqc.core.Alignment` from the merged levels
+        to the levels of the source :class:`medsrtqc.core.Trace` for ``k``
+        that can be used to map other arrays along the source levels onto
+        :attr:`pres`.
+        """
+        levels = self.levels(k)
+        valid = levels >= 0
+        index = np.full(len(self._pres), -1)
+        index[levels[valid]] = np.arange(len(levels))[valid]
+        return Alignment('exact', index)
+
+    def keys(self) -> Iterable[str]:
+        return self._keys
+
+    def __getitem__(self, k) -> Trace:
+        k = translate_vms(k) if check_vms(k) else k
+        source = self._profile[k]
+        levels = self.levels(k)
+        valid = levels >= 0
+
+        attrs = {}
+        for attr in ('value', 'qc', 'adjusted', 'adjusted_qc', 'adjusted_error', 'mtime'):
+            if attr != 'value' and getattr(source, '_' + attr) is None:
+                continue
+            x = getattr(source, attr)
+            merged = np.ma.masked_all((len(self._pres), ) + x.shape[1:], dtype=x.dtype)
+            merged[levels[valid]] = x[valid]
+            attrs[attr] = merged
 
-        return wmo
+        return Trace(pres=self._pres.copy(), **attrs)
 
-def load(src, mode='r'):
+    def copy(self, k) -> Trace:
+        # __getitem__ already returns a new Trace on every call
+        return self[k]
+
+    def __setitem__(self, k, v):
+        k = translate_vms(k) if check_vms(k) else k
+        if k not in self._rows:
+            raise KeyError(f"Can't add new parameter '{k}' to a SyntheticProfile")
+        if len(v) != len(self._pres):
+            raise ValueError(f"Expected trace for '{k}' with size {len(self._pres)} but got {len(v)}")
+
+        # only the source level used for each merged level is updated (other
+        # levels with the same pressure are not part of the merged profile)
+        source = self._profile[k]
+        index = self.alignment(k).index
+        merged = np.flatnonzero(index >= 0)
+        levels = index[merged]
+
+        changed = []
+        for attr in ('value', 'qc', 'adjusted', 'adjusted_qc', 'adjusted_error', 'mtime'):
+            if attr == 'value' or getattr(v, '_' + attr) is not None:
+                x = getattr(source, attr)
+                new = getattr(v, attr)[merged]
+                if _differs(x[levels], new):
+                    x[levels] = new
+                    changed.append(attr)
+
+        if changed:
+            self._profile._assign(k, source, changed)
+
+    def _merge(self, sizes):
+        # the PRES of each N_PROF is searched in a single call
+        rows = list(sizes.keys())
+        pres = [self._profile._cache.read(dataset_id, 'PRES')[i_prof][:sizes[(dataset_id, i_prof)]] for dataset_id, i_prof in rows]
+        pres = np.ma.concatenate(pres) if pres else np.ma.zeros(0)
+        valid = ~np.ma.getmaskarray(pres) & np.isfinite(np.ma.getdata(pres))
+
+        axis = np.unique(np.ma.getdata(pres)[valid])
+        levels = np.where(valid, np.searchsorted(axis, np.ma.getdata(pres)), -1)
+        splits = np.cumsum([sizes[row] for row in rows])[:-1]
+        return axis, dict(zip(rows, np.split(levels, splits)))
+
+
+def _differs(a, b):
+    # compares masks and the unmasked values (NaN is equal to NaN)
+    mask_a, mask_b = np.ma.getmaskarray(a), np.ma.getmaskarray(b)
+    if not np.array_equal(mask_a, mask_b):
+        return True
+    a, b = np.ma.getdata(a)[~mask_a], np.ma.getdata(b)[~mask_b]
+    equal_nan = a.dtype.kind in 'fc' and b.dtype.kind in 'fc'
+    return not np.array_equal(a, b, equal_nan=equal_nan)
+
+
+class _VariableCache:
+    """
+    Reads each variable of one or more ``netCDF4.Dataset``s once (all
+    profiles at a time) and buffers writes until :meth:`flush`. With
+    ``raw=True``, variables are read without netCDF4's automatic
+    masking and the mask is computed by :func:`_read_raw`.
+    """
+
+    def __init__(self, datasets, raw=False):
+        self._datasets = datasets
+        self._raw = raw
+        self._values = {}
+        self._stats = {}
+        self._dirty = {}
+        self._history = {}
+
+    def has_variable(self, dataset_id, var):
+        return var in self._datasets[dataset_id].variables
+
+    def read(self, dataset_id, var):
+        key = (dataset_id, var)
+        if key not in self._values:
+            variable = self._datasets[dataset_id][var]
+            self._values[key] = _read_raw(variable) if self._raw else variable[:]
+        return self._values[key]
+
+    def mask_stats(self, dataset_id, var):
+        """
+        Per-profile (i.e., first dimension) mask summaries of ``var`` as a
+        structured array with fields ``any_masked``, ``all_masked``, and
+        ``last_unmasked`` (the last index along the second dimension
+        with any unmasked values).
+        """
+
+        key = (dataset_id, var)
+        if key not in self._stats:
+            values = self.read(dataset_id, var)
+            mask = np.ma.getmaskarray(values)
+            n_prof = mask.shape[0]
+            n_levels = mask.shape[1] if mask.ndim > 1 else 1
+            level_valid = ~mask.reshape((n_prof, n_levels, -1)).all(axis=2)
+
+            stats = np.zeros(n_prof, dtype=[('any_masked', bool), ('all_masked', bool), ('last_unmasked', np.int64)])
+            stats['any_masked'] = mask.reshape((n_prof, -1)).any(axis=1)
+            stats['all_masked'] = ~level_valid.any(axis=1)
+            stats['last_unmasked'] = n_levels - 1 - np.argmax(level_valid[:, ::-1], axis=1)
+            self._stats[key] = stats
+
+        return self._stats[key]
+
+    def history_index(self, dataset_id):
+        """
+        The ``(N_HISTORY, N_PROF)`` locations of each HISTORY_ACTION
+        as ``{action: [(i, p), ...]}``, in the order they appear in
+        the file.
+        """
+
+        if dataset_id not in self._history:
+            actions = read_ncstr_array(self.read(dataset_id, 'HISTORY_ACTION'))
+            index = {}
+            for i, p in np.argwhere(actions != ''):
+                index.setdefault(str(actions[i, p]), []).append((int(i), int(p)))
+            self._history[dataset_id] = index
+
+        return self._history[dataset_id]
+
+    def write(self, dataset_id, var, index, value):
+        """
+        Assign ``value`` to the first ``len(value)`` items of
+        ``var[index]``, where ``index`` is a ``tuple()`` of integers.
+        Scalar values are assigned to all items of ``var[index]``.
+        """
+
+        values = self.read(dataset_id, var)
+        if not isinstance(values, np.ma.MaskedArray):  # pragma: no cover
+            values = self._values[(dataset_id, var)] = np.ma.MaskedArray(values)
+
+        n = len(value) if np.ndim(value) else values.shape[len(index)]
+        values[index + (slice(0, n), )] = value
+        self._stats.pop((dataset_id, var), None)
+        dirty = self._dirty.setdefault((dataset_id, var), {})
+        dirty[index] = max(n, dirty.get(index, 0))
+
+    def flush(self):
+        read_only = []
+        for (dataset_id, var) in list(self._dirty.keys()):
+            try:
+                self._write_dirty(dataset_id, var, self._datasets[dataset_id])
+                del self._dirty[(dataset_id, var)]
+            except RuntimeError:
+                read_only.append(var)
+
+        if read_only:
+            warnings.warn(
+                f"netCDF will not be edited - opened in read-only mode - {len(read_only)} modified variable(s) "
+                "were not written. Open using read_nc_profile(fn, mode='r+') to edit the nc file "
+                "or use NetCDFProfile.save() to write a copy."
+            )
+
+    def save(self, dataset_id, dest):
+        src = self._datasets[dataset_id]
+        src_path = _dataset_path(src)
+        dest = os.path.abspath(dest)
+        if src_path is not None and os.path.exists(dest) and os.path.samefile(src_path, dest):
+            raise ValueError(f"Can't save to '{dest}' because it is the source file")
+
+        fd, tmp = tempfile.mkstemp(suffix='.nc', dir=os.path.dirname(dest))
+        os.close(fd)
+        try:
+            if src_path is None:
+                _copy_dataset(src, tmp)
+            else:
+                shutil.copyfile(src_path, tmp)
+
+            with Dataset(tmp, mode='r+') as dst:
+                for (dirty_id, var) in self._dirty.keys():
+                    if dirty_id == dataset_id:
+                        self._write_dirty(dataset_id, var, dst)
+
+            os.replace(tmp, dest)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        # the source is not modified, so these changes don't need to be flushed
+        for key in [key for key in self._dirty if key[0] == dataset_id]:
+            del self._dirty[key]
+
+    def _write_dirty(self, dataset_id, var, dataset):
+        values = self._values[(dataset_id, var)]
+        for index, n in self._dirty[(dataset_id, var)].items():
+            key = index + (slice(0, n), )
+            dataset[var][key] = values[key]
+
+
+def _dataset_path(dataset):
+    # the path to a dataset that can be copied byte-for-byte or None
+    # for in-memory or remote datasets
+    try:
+        path = dataset.filepath()
+    except ValueError:  # pragma: no cover
+        return None
+
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        # ensure changes written directly to the Dataset are on disk
+        dataset.sync()
+    except RuntimeError:  # pragma: no cover
+        pass
+    return path
+
+
+def _read_raw(var):
+    # read a variable with netCDF4's automatic masking disabled and apply the
+    # same rules (_FillValue or the default fill value, valid_min/valid_max/
+    # valid_range for non-character data) in a single pass; variables
+    # with attributes that require other decoding use netCDF4
+    attrs = set(var.ncattrs())
+    kind = var.dtype.str[1:]
+    if not var.mask or var.dtype.kind not in 'fiuS' or kind not in default_fillvals or \
+            attrs & {'scale_factor', 'add_offset', 'missing_value', '_Unsigned'} or \
+            (kind in ('i1', 'u1') and '_FillValue' not in attrs):
+        return var[:]
+
+    with _undecoded(var):
+        data = var[:]
+
+    if '_FillValue' in attrs:
+        fill_value = _safe_attr(var, '_FillValue')
+        if fill_value is None:
+            return var[:]
+    else:
+        fill_value = np.array(default_fillvals[kind], var.dtype)
+
+    if var.dtype.kind == 'f' and np.isnan(fill_value):
+        mask = np.isnan(data)
+    else:
+        mask = data == fill_value
+
+    if var.dtype.kind != 'S':
+        if 'valid_range' in attrs and np.size(var.getncattr('valid_range')) == 2:
+            valid_range = _safe_attr(var, 'valid_range')
+            valid_min, valid_max = (None, None) if valid_range is None else valid_range
+        else:
+            valid_min = _safe_attr(var, 'valid_min') if 'valid_min' in attrs else None
+            valid_max = _safe_attr(var, 'valid_max') if 'valid_max' in attrs else None
+        if valid_min is not None:
+            mask |= data < valid_min
+        if valid_max is not None:
+            mask |= data > valid_max
+
+    if mask.any():
+        return np.ma.masked_array(data, mask=mask, fill_value=fill_value)
+    else:
+        return np.ma.masked_array(data)
+
+
+def _safe_attr(var, attr):
+    # an attribute cast to the variable's type or None if it can't be safely cast
+    value = np.array(var.getncattr(attr))
+    try:
+        cast = np.array(value, var.dtype)
+        if np.all((value == cast) | (np.isnan(value) & np.isnan(cast)) if cast.dtype.kind == 'f' else value == cast):
+            return cast
+    except (ValueError, TypeError):
+        pass
+    return None
+
+
+class _undecoded:
+    # temporarily read or write a Variable's stored values
+
+    def __init__(self, var):
+        self._var = var
+
+    def __enter__(self):
+        var = self._var
+        self._decode = (var.mask, var.scale, var.chartostring)
+        var.set_auto_maskandscale(False)
+        var.set_auto_chartostring(False)
+        return var
+
+    def __exit__(self, *execinfo):
+        mask, scale, chartostring = self._decode
+        self._var.set_auto_mask(mask)
+        self._var.set_auto_scale(scale)
+        self._var.set_auto_chartostring(chartostring)
+
+
+def _copy_dataset(src, dest):
+    # copy a Dataset using undecoded values (no masking, scaling,
+    # or character conversion) and the storage settings of the source
+    with Dataset(dest, mode='w', format=src.data_model) as dst:
+        dst.setncatts({attr: src.getncattr(attr) for attr in src.ncattrs()})
+        for name, dim in src.dimensions.items():
+            dst.createDimension(name, None if dim.isunlimited() else len(dim))
+
+        netcdf4 = src.data_model.startswith('NETCDF4')
+        for name, var in src.variables.items():
+            attrs = {attr: var.getncattr(attr) for attr in var.ncattrs()}
+            storage = {}
+            if netcdf4:
+                chunking = var.chunking()
+                storage = {k: v for k, v in (var.filters() or {}).items() if k in ('zlib', 'complevel', 'shuffle', 'fletcher32')}
+                storage['contiguous'] = chunking == 'contiguous'
+                storage['chunksizes'] = None if chunking == 'contiguous' else chunking
+
+            out = dst.createVariable(
+                name, var.dtype, var.dimensions,
+                fill_value=attrs.pop('_FillValue', False),
+                **storage
+            )
+            out.setncatts(attrs)
+
+            if var.size == 0:
+                continue
+
+            out.set_auto_maskandscale(False)
+            out.set_auto_chartostring(False)
+            with _undecoded(var):
+                out[:] = var[:]
+
+
+def load(src, mode='r', cache=None, byte_range=False):
     """
     Load a ``netCDF4.Dataset`` from a filename, url, bytes, or existing
     ``netCDF4.Dataset``. This is applied to anywhere a NetCDF file must
@@ -229,6 +746,15 @@ def load(src, mode='r'):
 
     :param src: A URL, filename, bytes, or existing ``netCDF4.Dataset``
     :param mode: Use ``'r+'`` to allow updates.
+    :param cache: For URLs, a :class:`medsrtqc.remote.URLCache`, a cache
+        directory, ``True`` to use :func:`medsrtqc.remote.default_cache`,
+        or ``None`` to download without caching. Updates to files loaded
+        from URLs are never written to the cache.
+    :param byte_range: Use ``True`` to open ``http://`` or ``https://``
+        URLs without downloading them. Only the header and the variables
+        that are accessed are read using HTTP Range requests. This requires
+        a NetCDF library with byte-range support, a server that supports
+        Range requests, and ``mode='r'``; ``cache`` is not used.
     """
 
     if not isinstance(src, (Dataset, bytes, str)):
@@ -240,16 +766,17 @@ def load(src, mode='r'):
         return Dataset(src, mode=mode)
     elif isinstance(src, bytes):
         return Dataset('in-mem-file', mode=mode, memory=src)
+    elif byte_range and (src.startswith('http://') or src.startswith('https://')):
+        if mode != 'r':
+            raise ValueError("`byte_range=True` requires mode='r'")
+        return Dataset(src + '#mode=bytes', mode=mode)
     elif src.startswith('http://') or src.startswith('https://') or src.startswith('ftp://'):
-        buf = io.BytesIO()
-        with urllib.request.urlopen(src) as f:
-            shutil.copyfileobj(f, buf)
-        return Dataset('in-mem-file', mode=mode, memory=buf.getvalue())
+        return Dataset('in-mem-file', mode=mode, memory=remote.fetch(src, cache=cache))
     else:
         raise ValueError(f"Don't know how to open '{reprlib.repr(src)}'\n.Is it a valid file or URL?")
 
 
-def read_nc_profile(*src, mode='r'):
+def read_nc_profile(*src, mode='r', cache=None, byte_range=False, raw=False):
     """
     Load a :class:`medsrtqc.Profile` backed by a NetCDF file. For details
     on the underlying data structure, see :class:`NetCDFProfile`.
@@ -258,6 +785,10 @@ def read_nc_profile(*src, mode='r'):
         If more than one is passed, the first
         data set will mask variables available in subsequent data sets.
         This is useful for combining BGC and core files.
+    :param mode: Use ``'r+'`` to allow updates.
+    :param cache: Passed to :func:`load` for sources that are URLs.
+    :param byte_range: Passed to :func:`load` for sources that are URLs.
+    :param raw: Passed to :class:`NetCDFProfile`.
 
     >>> from medsrtqc.nc import read_nc_profile
     >>> from medsrtqc.resources import resource_path
@@ -265,8 +796,88 @@ def read_nc_profile(*src, mode='r'):
     >>> profile['TEMP']
     """
 
-    return NetCDFProfile(*[load(s, mode=mode) for s in src])
+    return NetCDFProfile(*[load(s, mode=mode, cache=cache, byte_range=byte_range) for s in src], raw=raw)
+
+def iter_nc_profiles(*src, mode='r', cache=None, byte_range=False, raw=False, by_cycle=False):
+    """
+    Iterate over every profile (i.e., every index along the ``N_PROF``
+    dimension) of one or more NetCDF files, such as the multi-profile
+    ``_prof.nc`` files on the Argo GDAC. Each file is opened once and
+    its variables are read once for all profiles. Changes to the
+    yielded :class:`NetCDFProfile` objects are written when iteration
+    completes (or when :meth:`NetCDFProfile.flush` is called). Files
+    that were opened by this function are closed when iteration
+    completes, after which the yielded profiles can no longer read
+    their traces; pass an open ``netCDF4.Dataset`` (which is never
+    closed) to use the profiles afterwards (e.g., after ``list()``).
+
+    :param src: One or more URLs, filename, bytes, or existing ``netCDF4.Dataset``s.
+        Each is iterated separately.
+    :param mode: Use ``'r+'`` to allow updates.
+    :param cache: Passed to :func:`load` for sources that are URLs.
+    :param byte_range: Passed to :func:`load` for sources that are URLs.
+    :param raw: Passed to :class:`NetCDFProfile`.
+    :param by_cycle: Use ``True`` to yield one :class:`NetCDFProfile` for
+        the consecutive ``N_PROF`` of each cycle (e.g., the sampling schemes
+        of a BGC profile, such as those written by
+        :func:`medsrtqc.convert.vms_to_nc`). A cycle starts at an ``N_PROF``
+        whose ``VERTICAL_SAMPLING_SCHEME`` is primary sampling or whose
+        ``PLATFORM_NUMBER``, ``CYCLE_NUMBER``, or ``DIRECTION`` differs from
+        the previous one.
+
+    >>> from medsrtqc.nc import iter_nc_profiles
+    >>> from medsrtqc.resources import resource_path
+    >>> for profile in iter_nc_profiles(resource_path('BD6903197_026.nc')):
+    ...     print(profile.keys())
+    """
+
+    for s in src:
+        dataset = load(s, mode=mode, cache=cache, byte_range=byte_range)
+        try:
+            variables = _VariableCache([dataset], raw=raw)
+            try:
+                n_prof = len(dataset.dimensions['N_PROF'])
+                rows = _cycle_rows(variables, n_prof) if by_cycle else range(n_prof)
+                for i_prof in rows:
+                    yield NetCDFProfile(dataset, i_prof=i_prof, _cache=variables)
+            finally:
+                variables.flush()
+        finally:
+            if dataset is not s:
+                dataset.close()
+
+
+def _cycle_rows(variables, n_prof):
+    # a range() of N_PROF for each cycle (see iter_nc_profiles())
+    keys = [[None] * n_prof]
+    for var in ('PLATFORM_NUMBER', 'CYCLE_NUMBER', 'DIRECTION'):
+        if variables.has_variable(0, var):
+            values = variables.read(0, var)
+            # PLATFORM_NUMBER is (N_PROF, STRING8) and the others are (N_PROF, )
+            values = read_ncstr_array(values) if values.ndim > 1 else np.ma.filled(values)
+            keys.append(values.tolist())
+    keys = list(zip(*keys))
+
+    primary = np.zeros(n_prof, dtype=bool)
+    if variables.has_variable(0, 'VERTICAL_SAMPLING_SCHEME'):
+        schemes = read_ncstr_array(variables.read(0, 'VERTICAL_SAMPLING_SCHEME'))
+        primary = np.char.startswith(schemes.astype(str), 'Primary sampling')
+
+    starts = [i for i in range(n_prof) if i == 0 or primary[i] or keys[i] != keys[i - 1]]
+    return [range(start, stop) for start, stop in zip(starts, starts[1:] + [n_prof])]
+
 
 def read_ncstr(s):
-    lst = [l.decode() for l in s.data]
-    return ''.join(lst).strip()
+    """
+    Decode a one-dimensional NetCDF character array as a stripped ``str``.
+    """
+    return str(read_ncstr_array(s))
+
+
+def read_ncstr_array(s):
+    """
+    Decode a NetCDF character array whose last dimension is the string
+    length as an array of stripped ``str`` with one fewer dimension.
+    Masked characters are decoded as their underlying (fill) value.
+    """
+    return np.char.strip(chartostring(np.ma.getdata(s)))
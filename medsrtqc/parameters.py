@@ -0,0 +1,163 @@
+"""
+The parameter catalog describes each BGC parameter (and the core
+``TEMP``, ``PSAL``, and ``CNDC``) once: its VMS code, its Argo NetCDF
+variable name, units, global range limits, and the QC tests that
+apply to it. The catalog is read from ``'parameters.csv'`` using
+:func:`medsrtqc.resources.resource_path`, so a ``config/parameters.csv``
+takes precedence over the version distributed with the package. Lookups
+use precomputed, read-only mappings.
+
+>>> from medsrtqc.parameters import parameters
+>>> parameters.vms_to_nc['PHTO']
+'PH_IN_SITU_TOTAL'
+>>> parameters.valid_range('PHTO')
+(7.0, 8.3)
+"""
+
+from collections import namedtuple
+from types import MappingProxyType
+
+from .resources import resource_path
+
+
+#: One row of the parameter catalog. ``vms_tests`` and ``nc_tests`` are
+#: the names of the QC tests that apply when the parameter is present in a
+#: profile under its VMS code or its NetCDF name, respectively.
+Parameter = namedtuple(
+    'Parameter',
+    ['vms', 'nc', 'units', 'valid_min', 'valid_max', 'vms_tests', 'nc_tests']
+)
+
+
+class ParameterCatalog:
+    """
+    An immutable collection of :class:`Parameter` objects with
+    lookups by VMS code or NetCDF name. These objects are usually
+    created by :func:`read_parameter_file`.
+    """
+
+    def __init__(self, parameters):
+        """
+        :param parameters: An iterable of :class:`Parameter` objects.
+        """
+
+        self._parameters = tuple(parameters)
+
+        by_vms = {}
+        by_nc = {}
+        test_keys = {}
+        for p in self._parameters:
+            if p.vms in by_vms:
+                raise ValueError(f"Duplicate VMS code in parameter catalog: '{p.vms}'")
+            by_vms[p.vms] = p
+            if p.nc:
+                if p.nc in by_nc:
+                    raise ValueError(f"Duplicate NetCDF name in parameter catalog: '{p.nc}'")
+                by_nc[p.nc] = p
+
+            for test in p.vms_tests:
+                test_keys.setdefault(test, set()).add(p.vms)
+            for test in p.nc_tests:
+                test_keys.setdefault(test, set()).add(p.nc)
+
+        self._by_vms = MappingProxyType(by_vms)
+        self._by_nc = MappingProxyType(by_nc)
+        self._vms_to_nc = MappingProxyType({p.vms: p.nc for p in self._parameters if p.nc})
+        self._nc_to_vms = MappingProxyType({p.nc: p.vms for p in self._parameters if p.nc})
+        self._test_keys = MappingProxyType({k: frozenset(v) for k, v in test_keys.items()})
+
+    @property
+    def by_vms(self):
+        """A read-only mapping of VMS codes to :class:`Parameter` objects"""
+        return self._by_vms
+
+    @property
+    def by_nc(self):
+        """A read-only mapping of NetCDF names to :class:`Parameter` objects"""
+        return self._by_nc
+
+    @property
+    def vms_to_nc(self):
+        """A read-only mapping of VMS codes to NetCDF names"""
+        return self._vms_to_nc
+
+    @property
+    def nc_to_vms(self):
+        """A read-only mapping of NetCDF names to VMS codes"""
+        return self._nc_to_vms
+
+    @property
+    def test_keys(self):
+        """
+        A read-only mapping of QC test names to the ``frozenset()`` of
+        profile keys (VMS codes or NetCDF names) that trigger the test
+        """
+        return self._test_keys
+
+    def for_test(self, test):
+        """
+        The :class:`Parameter` objects that the QC test ``test`` applies
+        to in the order they appear in the catalog.
+        """
+        return tuple(p for p in self._parameters if test in p.vms_tests or test in p.nc_tests)
+
+    def valid_range(self, k):
+        """
+        The global range limits for the parameter with VMS code or
+        NetCDF name ``k`` as a ``tuple()`` of ``(valid_min, valid_max)``.
+        Limits that are not defined are ``None``.
+        """
+        p = self[k]
+        return p.valid_min, p.valid_max
+
+    def __getitem__(self, k) -> Parameter:
+        try:
+            return self._by_vms[k]
+        except KeyError:
+            return self._by_nc[k]
+
+    def __contains__(self, k):
+        return k in self._by_vms or k in self._by_nc
+
+    def __iter__(self):
+        return iter(self._parameters)
+
+    def __len__(self):
+        return len(self._parameters)
+
+
+def read_parameter_file(path=None) -> ParameterCatalog:
+    """
+    Read a parameter catalog from a CSV file with columns ``vms``,
+    ``nc``, ``units``, ``valid_min``, ``valid_max``, ``vms_tests``,
+    and ``nc_tests``. Multiple test names are separated by spaces.
+
+    :param path: The path to the file. Defaults to the
+        ``'parameters.csv'`` resource.
+    """
+
+    if path is None:
+        path = resource_path('parameters.csv')
+
+    parameters = []
+    with open(path) as fid:
+        header = [item.strip() for item in fid.readline().split(',')]
+        for line in fid:
+            if not line.strip():
+                continue
+
+            row = dict(zip(header, (item.strip() for item in line.split(','))))
+            parameters.append(Parameter(
+                vms=row['vms'],
+                nc=row['nc'] or None,
+                units=row['units'] or None,
+                valid_min=float(row['valid_min']) if row['valid_min'] else None,
+                valid_max=float(row['valid_max']) if row['valid_max'] else None,
+                vms_tests=tuple(row['vms_tests'].split()),
+                nc_tests=tuple(row['nc_tests'].split())
+            ))
+
+    return ParameterCatalog(parameters)
+
+
+parameters = read_parameter_file()
@@ -1,15 +1,15 @@
 
-import copy
 import numpy as np
 
 from medsrtqc.qc.operation import QCOperation
 from medsrtqc.qc.flag import Flag
 from medsrtqc.qc.history import QCx
+from medsrtqc.qc.kernels import running_median
 
 class bbpTest(QCOperation):
 
     def run_impl(self):
-        bbp = self.profile['BBP$']
+        bbp = self.profile.copy('BBP$')
         all_passed = True
 
         self.log('Setting previously unset flags for BBP to GOOD')
@@ -29,7 +29,8 @@ class bbpTest(QCOperation):
         # high deep value test
         self.log('Performing high deep value')
         median_bbp = self.running_median(5)
-        high_deep_value = (sum(bbp.pres > 700) > 5) & (np.nanmedian(median_bbp[bbp.pres > 700]) > 5e-4)
+        deep_median_bbp = median_bbp[bbp.window(700)]
+        high_deep_value = (len(deep_median_bbp) > 5) and (np.nanmedian(deep_median_bbp) > 5e-4)
         new_flag = Flag.PROBABLY_BAD if high_deep_value else Flag.GOOD
         all_passed = all_passed and not high_deep_value
         Flag.update_safely(bbp.qc, new_flag)
@@ -37,10 +38,8 @@ class bbpTest(QCOperation):
 
         # noisy profile test
         self.log('Performing noisy profile test')
-        deep_ix = bbp.pres > 100
         residual = bbp.value - median_bbp
-        high_residuals = residual > 0.0005
-        high_residuals = high_residuals[deep_ix]
+        high_residuals = residual[bbp.window(100)] > 0.0005
         pct_residuals = 100*sum(high_residuals)/len(high_residuals)
         many_high_residuals = pct_residuals > 10
         new_flag = Flag.PROBABLY_BAD if many_high_residuals else Flag.GOOD
@@ -66,20 +65,20 @@ class bbpTest(QCOperation):
         # parking hook test
         ascending = self.profile.direction == 'A'
         if ascending:
-            pres = copy.deepcopy(bbp.pres)
-            pres[np.abs(pres) > 6000] = np.nan
-            pres = np.sort(pres)
-            deepest_diff = pres[-1] - pres[-2]
+            pres = np.sort(bbp.pres[bbp.window(-6000, 6000, inclusive=True)])
+            # the test is skipped if any pressure is missing or out of range
+            complete = len(pres) == len(bbp) and len(pres) >= 2
+            deepest_diff = pres[-1] - pres[-2] if complete else np.nan
             if deepest_diff < 20:
                 parking_diff = np.abs(pres[-1] - self.profile.parking_pres)
                 if parking_diff < 100:
                     self.log('Performing parking hook test')
-                    ix = (bbp.pres < (pres[-1] - 20)) & (bbp.pres > (pres[-1] - 50))
-                    baseline = np.median(bbp.value[ix]) + 0.0002
-                    deep_above_baseline = (bbp.pres > (pres[-1] - 50)) & (bbp.value > baseline)
-                    all_passed = all_passed and not any(deep_above_baseline)
+                    baseline = np.median(bbp.value[bbp.window(pres[-1] - 50, pres[-1] - 20)]) + 0.0002
+                    deep_ix = np.arange(len(bbp))[bbp.window(pres[-1] - 50)]
+                    deep_above_baseline = deep_ix[bbp.value[deep_ix] > baseline]
+                    all_passed = all_passed and len(deep_above_baseline) == 0
                     Flag.update_safely(bbp.qc, Flag.BAD, where=deep_above_baseline)
-                    self.log(f'Parking hook test results: {sum(deep_above_baseline)} points set to 4')
+                    self.log(f'Parking hook test results: {len(deep_above_baseline)} points set to 4')
                     
         # # old tests - still run or no?
 
@@ -123,11 +122,5 @@ class bbpTest(QCOperation):
 
     def running_median(self, n):
         self.log(f'Calculating running median over window size {n}')
-        x = self.profile['BBP$'].value
-        ix = np.arange(n) + np.arange(len(x)-n+1)[:,None]
-        b = [row[row > 0] for row in x[ix]]
-        k = int(n/2)
-        med = [np.median(c) for c in b]
-        med = np.array(k*[np.nan] + med + k*[np.nan])
-        return med
+        return running_median(self.profile['BBP$'].value, n)
 
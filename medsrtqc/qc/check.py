@@ -4,6 +4,16 @@ from medsrtqc.qc.bbp import bbpTest
 from medsrtqc.qc.ph import pHTest
 from medsrtqc.qc.radio import radiometryTest
 from medsrtqc.qc.operation import QCOperation
+from medsrtqc.parameters import parameters
+
+# tests in the order they are run; which tests apply to a profile is
+# determined by the test names listed in the parameter catalog
+_TESTS = (
+    ('chla', ChlaTest),
+    ('bbp', bbpTest),
+    ('ph', pHTest),
+    ('radiometry', radiometryTest)
+)
 
 class preTestCheck(QCOperation):
 
@@ -15,14 +25,10 @@ class preTestCheck(QCOperation):
 
     def list_tests(self):
 
+        keys = self.profile.keys()
         tests = list()
-        if 'FLU1' in self.profile.keys() or 'CHLA' in self.profile.keys():
-            tests.append(ChlaTest())
-        if 'BBP$' in self.profile.keys() or 'BBP700' in self.profile.keys():
-            tests.append(bbpTest())
-        if 'PHPH' in self.profile.keys() or 'PH_IN_SITU' in self.profile.keys():
-            tests.append(pHTest())
-        if any(x in self.profile.keys() for x in ['P380', 'P412', 'P443', 'P490', 'PAR$']):
-            tests.append(radiometryTest())
+        for name, test_class in _TESTS:
+            if not parameters.test_keys.get(name, frozenset()).isdisjoint(keys):
+                tests.append(test_class())
 
         self.tests = tests
@@ -1,21 +1,21 @@
 
 import numpy as np
-import gsw
 
 from medsrtqc.resources import resource_path
 from medsrtqc.core import Trace
 from medsrtqc.qc.operation import QCOperation, QCOperationError
 from medsrtqc.qc.flag import Flag
 from medsrtqc.qc.history import QCx
+from medsrtqc.qc.kernels import running_median
 from medsrtqc.coefficient import coeff
+from medsrtqc.parameters import parameters
 
 class ChlaTest(QCOperation):
 
     def run_impl(self):
-        self.profile['FLU1'].adjusted.mask = False
-        chla = self.profile['FLU1']
+        chla = self.profile.copy('FLU1')
         fluo = self.profile['FLU3']
-        adjusted = self.profile['FLUA']
+        adjusted = self.profile.copy('FLUA')
 
         all_passed = True
 
@@ -30,7 +30,8 @@ class ChlaTest(QCOperation):
 
         # global range test
         self.log('Applying global range test to CHLA')
-        values_outside_range = (chla.value < -0.1) | (chla.value > 50.0)
+        valid_min, valid_max = parameters.valid_range('FLU1')
+        values_outside_range = (chla.value < valid_min) | (chla.value > valid_max)
         Flag.update_safely(chla.qc, Flag.BAD, values_outside_range)
         Flag.update_safely(adjusted.qc, Flag.BAD, values_outside_range)
         QCx.update_safely(self.profile.qc_tests, 6, not any(values_outside_range))
@@ -67,7 +68,7 @@ class ChlaTest(QCOperation):
         delta_dark = 50
 
         # maximum pressure reached on this profile
-        max_pres = np.nanmax(chla.pres)
+        _, max_pres = chla.pres_range()
 
         # I find the QC manual unclear on what to do here, should check with perhaps Catherine Schmechtig on how to process w/ no MLD
         if flag_mld: # pragma: no cover
@@ -82,7 +83,7 @@ class ChlaTest(QCOperation):
             Flag.update_safely(chla.qc, to=Flag.PROBABLY_GOOD)
             Flag.update_safely(adjusted.qc, to=Flag.PROBABLY_GOOD)
         else:
-            dark_prime_chla = np.nanmedian(fluo.value[fluo.pres > (max_pres - delta_dark)])
+            dark_prime_chla = np.nanmedian(fluo.value[fluo.window(max_pres - delta_dark)])
     
         # test 3
         if np.abs(dark_prime_chla - dark_chla) > 0.2*dark_chla:
@@ -139,8 +140,8 @@ class ChlaTest(QCOperation):
                 self.log(f'Adjusting surface values (P < {depthNPQ}dbar) to CHLA({depthNPQ}) = {chla.value[depthNPQ_ix]}mg/m3')
                 chla.adjusted[:depthNPQ_ix] = chla.adjusted[depthNPQ_ix]
                 self.log('Setting values above this depth in CHLA_QC to PROBABLY_BAD, and in CHLA_ADJUSTED_QC to changed')
-                Flag.update_safely(chla.qc, to=Flag.PROBABLY_BAD, where=chla.pres < depthNPQ)
-                Flag.update_safely(adjusted.qc, to=Flag.CHANGED, where=chla.pres < depthNPQ)
+                Flag.update_safely(chla.qc, to=Flag.PROBABLY_BAD, where=chla.window(pmax=depthNPQ))
+                Flag.update_safely(adjusted.qc, to=Flag.CHANGED, where=chla.window(pmax=depthNPQ))
                 all_passed = False
         
         # update QCP/QCF
@@ -154,25 +155,12 @@ class ChlaTest(QCOperation):
 
     def mixed_layer_depth(self):
         self.log('Calculating mixed layer depth')
-        pres = self.profile['PRES']
-        temp = self.profile['TEMP']
-        psal = self.profile['PSAL']
-        if np.any(pres.value != temp.pres) or np.any(pres.value != psal.pres):
-            self.error('PRES, TEMP, and PSAL are not aligned along the same pressure axis')
-
-        # the longitude isn't actually important here because we're calculating relative
-        # density in the same location
-        longitude = 0
-        latitude = 0
-        abs_salinity = gsw.SA_from_SP(psal.value, pres.value, longitude, latitude)
-        conservative_temp = gsw.CT_from_t(abs_salinity, temp.value, pres.value)
-        density = gsw.sigma0(abs_salinity, conservative_temp)
-
-        mixed_layer_start = (np.abs(np.diff(density)) > 0.03) & (pres.value[1:] > 10)
-        if not np.any(mixed_layer_start): # pragma: no cover
-            self.error("Can't determine mixed layer depth (no density changes > 0.03 below 10 dbar)")
-
-        mixed_layer_depth = np.nanmin(pres.value[1:][mixed_layer_start])
+        try:
+            # shared with other operations on this profile
+            mixed_layer_depth = self.profile.derived('mixed_layer_depth')
+        except ValueError as e:
+            self.error(str(e))
+
         self.log(f'...mixed layer depth found at {mixed_layer_depth} dbar')
 
         return mixed_layer_depth
@@ -184,13 +172,7 @@ class ChlaTest(QCOperation):
 
     def running_median(self, n):
         self.log(f'Calculating running median over window size {n}')
-        x = self.profile['FLU1'].value
-        ix = np.arange(n) + np.arange(len(x)-n+1)[:,None]
-        b = [row[row > 0] for row in x[ix]]
-        k = int(n/2)
-        med = [np.median(c) for c in b]
-        med = np.array(k*[np.nan] + med + k*[np.nan])
-        return med
+        return running_median(self.profile['FLU1'].value, n)
 
     def read_last_dark_chla(self):
 
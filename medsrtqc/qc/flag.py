@@ -4,6 +4,9 @@
 # in the future this package should import that one and use it where
 # possible!
 
+import numpy as np
+
+
 class Flag:
     """
     Flags for check output. These values are valid values of the
@@ -27,12 +30,150 @@ class Flag:
                 return value
         raise KeyError(f"'{label}' is not the name of a QC flag")
 
+    @staticmethod
+    def code(flag) -> int:
+        """
+        Return the integer code of a QC flag (i.e., the value of
+        its byte, or 0 for :attr:`FILL_VALUE`)
+        """
+        return int(_flag_code(flag))
+
+    @staticmethod
+    def codes(qc) -> np.ndarray:
+        """
+        Return the QC flags in ``qc`` as an array of ``uint8`` codes.
+        For ``'S1'`` arrays (e.g., the ``qc`` attribute of a
+        :class:`~medsrtqc.core.Trace`) this is a view that shares
+        memory with ``qc``; masked values are not excluded.
+
+        >>> import numpy as np
+        >>> from medsrtqc.qc.flag import Flag
+        >>> Flag.codes(np.array([Flag.GOOD, Flag.BAD]))
+        array([49, 52], dtype=uint8)
+        """
+
+        codes = _flag_codes(qc)
+        if codes is None:
+            codes = np.asarray(np.ma.getdata(qc), dtype='S1').view(np.uint8)
+        return codes
+
+    @staticmethod
+    def from_codes(codes) -> np.ndarray:
+        """
+        Return an ``'S1'`` view of an array of ``uint8`` codes
+        (the inverse of :meth:`codes`).
+        """
+        return np.asarray(codes, dtype=np.uint8).view('S1')
+
+    @staticmethod
+    def isin(qc, flags) -> np.ndarray:
+        """
+        Return a boolean array that is ``True`` where ``qc`` is one
+        of ``flags`` and is not masked.
+
+        :param qc: An array of QC flags.
+        :param flags: A flag or a sequence of flags.
+
+        >>> import numpy as np
+        >>> from medsrtqc.qc.flag import Flag
+        >>> Flag.isin(np.array([Flag.GOOD, Flag.BAD]), [Flag.PROBABLY_BAD, Flag.BAD])
+        array([False,  True])
+        """
+
+        if isinstance(flags, (bytes, np.bytes_)):
+            flags = [flags]
+        table = np.zeros(256, dtype=bool)
+        table[[_flag_code(flag) for flag in flags]] = True
+        return np.take(table, Flag.codes(qc)) & ~np.ma.getmaskarray(qc)
+
     @staticmethod
     def update_safely(qc, to, where=None):
         """
         Safely update ``qc`` to the value ``to``. Values that are
         already marked at a "worse" QC level are not modified.
+        ``qc`` may also be an array of ``uint8`` codes (see :meth:`codes`).
         """
+        table = Flag._lut[Flag._lut_index[to]]
+        codes = _flag_codes(qc)
+        if codes is None:
+            return Flag._update_safely_loop(qc, to, where)
+        elif not codes.flags.writeable:
+            # e.g., the placeholder for a Trace attribute that was never
+            # supplied, which allocates an array when it is assigned to
+            updated = qc.copy()
+            Flag.update_safely(updated, to, where)
+            qc[...] = updated
+            return
+
+        where = slice(None) if where is None else where
+        current = codes[where]
+        updated = np.take(table, current)
+        mask = np.ma.getmask(qc)
+        if mask is not np.ma.nomask:
+            # masked flags are never updated
+            masked = mask[where]
+            updated[masked] = current[masked]
+        codes[where] = updated
+
+    @staticmethod
+    def update_many(qc, updates):
+        """
+        Apply several :meth:`update_safely` calls to ``qc`` at once.
+        The result is identical to calling ``Flag.update_safely(qc, to, where)``
+        for each item of ``updates`` in order but ``qc`` is only read
+        and written once.
+
+        :param qc: An array of QC flags.
+        :param updates: An iterable of ``(to, where)`` tuples, where
+            ``where`` may be ``None`` to update all values.
+
+        >>> import numpy as np
+        >>> from medsrtqc.qc.flag import Flag
+        >>> qc = np.array([Flag.NO_QC, Flag.NO_QC, Flag.GOOD])
+        >>> Flag.update_many(qc, [(Flag.GOOD, None), (Flag.BAD, [False, True, False])])
+        >>> qc
+        array([b'1', b'4', b'1'], dtype='|S1')
+        """
+
+        updates = list(updates)
+        rows = [Flag._lut_index[to] for to, _ in updates]
+        codes = _flag_codes(qc)
+        if codes is None:
+            for to, where in updates:
+                Flag._update_safely_loop(qc, to, where)
+            return
+        elif not updates:
+            return
+        elif not codes.flags.writeable:
+            # as in update_safely()
+            updated = qc.copy()
+            Flag.update_many(updated, updates)
+            qc[...] = updated
+            return
+
+        # which updates apply to each flag
+        applies = np.zeros((len(updates), ) + codes.shape, dtype=bool)
+        for i, (_, where) in enumerate(updates):
+            applies[i][slice(None) if where is None else where] = True
+        applies = applies.reshape((len(updates), -1))
+        applies &= ~np.ma.getmaskarray(qc).reshape(-1)
+
+        # compose the lookup tables for each distinct combination of updates
+        # so that every flag is updated in a single pass
+        patterns, pattern_index = np.unique(applies, axis=1, return_inverse=True)
+        tables = np.empty((patterns.shape[1], 256), dtype=np.uint8)
+        for j in range(patterns.shape[1]):
+            table = np.arange(256, dtype=np.uint8)
+            for i in np.flatnonzero(patterns[:, j]):
+                table = np.take(Flag._lut[rows[i]], table)
+            tables[j] = table
+
+        flat = codes.reshape(-1)
+        codes[...] = tables[pattern_index.reshape(-1), flat].reshape(codes.shape)
+
+    @staticmethod
+    def _update_safely_loop(qc, to, where=None):
+        # flags that aren't stored as 'S1' (e.g., object arrays)
         where = slice(None) if where is None else where
         flags = qc[where]
         for overridable_flag in Flag._precedence[to]:
@@ -105,3 +246,39 @@ class Flag:
             FILL_VALUE,
         },
     }
+
+    # _lut[_lut_index[to]][code] is the result of updating a flag whose
+    # byte value is code to the flag to
+    _lut_index = {}
+    _lut = None
+
+
+def _flag_lut():
+    index = {}
+    lut = np.tile(np.arange(256, dtype=np.uint8), (len(Flag._precedence), 1))
+    for i, (to, overridable) in enumerate(Flag._precedence.items()):
+        index[to] = i
+        for flag in overridable:
+            lut[i, _flag_code(flag)] = _flag_code(to)
+    return index, lut
+
+
+def _flag_code(flag):
+    return np.frombuffer(np.array(flag, dtype='S1').tobytes(), dtype=np.uint8)[0]
+
+
+def _flag_codes(qc):
+    # a writable uint8 view of 'S1' flags (or uint8 codes as-is) or None
+    # for other dtypes
+    data = np.ma.getdata(qc)
+    if not isinstance(data, np.ndarray):
+        return None
+    elif data.dtype == np.dtype('S1'):
+        return data.view(np.uint8)
+    elif data.dtype == np.dtype(np.uint8):
+        return data
+    else:
+        return None
+
+
+Flag._lut_index, Flag._lut = _flag_lut()
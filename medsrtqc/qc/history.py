@@ -2,45 +2,117 @@
 from collections import OrderedDict
 import numpy as np
 
-def read_qc_hex(hex_code):
-    if len(hex_code.strip()) == 0: # pragma: no cover
-        hex_code = hex(0)
-    num = int(hex_code, 16)
-    # list to save test number in
-    tests = []
-    for i in range(63, 56, -1):
-        qc_binary_id = 2**i
-        if qc_binary_id <= num:
-            num -= qc_binary_id
-            tests.append(i)
-
-    for i in range(26, 0, -1):
-        qc_binary_id = 2**i
-        if qc_binary_id <= num:
-            num -= qc_binary_id
-            tests.append(i)
-    
-    if num != 0: # pragma: no cover
+# the Argo QC test numbers in the order used by the (2, 32) qc_tests arrays;
+# each test is stored as bit 2 ** test of the hex codes
+_TEST_NUMBERS = np.array(list(range(1, 26)) + list(range(57, 64)))
+_TEST_INDEX = {int(t): i for i, t in enumerate(_TEST_NUMBERS)}
+_TEST_BITS = np.left_shift(np.uint64(1), _TEST_NUMBERS.astype(np.uint64))
+_VALID_BITS = np.bitwise_or.reduce(_TEST_BITS)
+
+_HEX_SHIFTS = np.arange(60, -1, -4, dtype=np.uint64)
+_HEX_UPPER = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+_HEX_VALUES = np.full(256, 255, dtype=np.uint8)
+_HEX_VALUES[np.frombuffer(b'0123456789abcdef', dtype=np.uint8)] = np.arange(16)
+_HEX_VALUES[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+
+_PASS = ('p', 'P', 'PASS', 'pass', 1, '1', True)
+_FAIL = ('f', 'F', 'FAIL', 'fail', 0, '0', False)
+
+
+def hex_to_bitmask(hex_code):
+    """
+    Decode one or more QCP$/QCF$ hex codes (e.g., ``'0x8000000000000010'``,
+    ``'  000DFFCE'``, or ``'0000000000000000'``) to ``uint64`` bitmasks.
+    Blank codes are zero.
+
+    :param hex_code: A ``str`` or an array of ``str`` or ``bytes``.
+
+    >>> from medsrtqc.qc.history import hex_to_bitmask
+    >>> hex_to_bitmask(['0x10', '  000DFFCE'])
+    array([    16, 917454], dtype=uint64)
+    """
+
+    if isinstance(hex_code, (str, bytes)):
+        # a single code is faster to decode using int()
+        bitmask = int(hex_code.strip() or '0', 16)
+        if bitmask & ~int(_VALID_BITS):
+            raise ValueError('Invalid input, decoding QC tests left a non-zero remainder')
+        return np.uint64(bitmask)
+
+    shape = np.shape(hex_code)
+    codes = np.char.lower(np.char.strip(np.asarray(hex_code).astype('U').reshape(-1)))
+    codes = np.where(np.char.startswith(codes, '0x'), np.char.replace(codes, '0x', '', 1), codes)
+    codes = np.char.zfill(codes, 16)
+    if np.any(np.char.str_len(codes) > 16):
+        raise ValueError('Invalid input, QC hex codes must have at most 16 digits')
+
+    digits = _HEX_VALUES[np.char.encode(codes, 'ascii').astype('S16').view(np.uint8)]
+    if np.any(digits == 255):
+        raise ValueError(f'Invalid input, {repr(hex_code)} is not a hex code')
+
+    digits = digits.reshape(shape + (16, )).astype(np.uint64)
+    bitmask = np.bitwise_or.reduce(np.left_shift(digits, _HEX_SHIFTS), axis=-1)
+    if np.any(bitmask & ~_VALID_BITS):
         raise ValueError('Invalid input, decoding QC tests left a non-zero remainder')
+    return bitmask[()]
 
-    return tests[::-1]
 
-def test_index(test):
+def bitmask_to_hex(bitmask, width=None):
+    """
+    Encode one or more ``uint64`` bitmasks as hex codes. By default the
+    output is the same as ``hex()``; use ``width`` to get upper-case
+    digits without the ``0x`` prefix zero-padded to at least ``width``
+    digits (e.g., ``16`` for the NetCDF ``HISTORY_QCTEST`` variable).
 
-    test_numbers = list(range(1, 26)) + list(range(57, 64))
-    return test_numbers.index(test)
+    :param bitmask: A ``uint64`` value or array.
+    :param width: The minimum number of digits or ``None``.
+
+    >>> from medsrtqc.qc.history import bitmask_to_hex
+    >>> bitmask_to_hex(16), bitmask_to_hex(16, width=16)
+    ('0x10', '0000000000000010')
+    """
+
+    bitmask = np.asarray(bitmask, dtype=np.uint64)
+    if bitmask.ndim == 0:
+        return hex(int(bitmask)) if width is None else f'{int(bitmask):0{width}X}'
+
+    digits = np.right_shift(bitmask.reshape(-1, 1), _HEX_SHIFTS) & np.uint64(15)
+    codes = _HEX_UPPER[digits].view('S16')[:, 0].astype('U16')
+    codes = np.char.lstrip(codes, '0')
+    if width is None:
+        codes = np.char.add('0x', np.char.lower(np.char.zfill(codes, 1)))
+    else:
+        codes = np.char.zfill(codes, width)
+    return codes.reshape(bitmask.shape)
 
-def qc_array(qc):
 
-    QC_array = np.zeros((32,), dtype=int)
+def bitmask_to_array(bitmask):
+    """
+    Convert ``uint64`` bitmasks to arrays of 0/1 with one value for each
+    test (i.e., the rows of a ``qc_tests`` array).
+    """
+    bitmask = np.asarray(bitmask, dtype=np.uint64)
+    return ((bitmask[..., None] & _TEST_BITS) != 0).astype(int)
 
-    # hex to numeric
-    tests = read_qc_hex(qc)
-    if len(tests) != 0:
-        test_indices = [test_index(t) for t in tests]
-        QC_array[test_indices] = 1
 
-    return QC_array
+def array_to_bitmask(qcx):
+    """The inverse of :func:`bitmask_to_array`"""
+    qcx = np.asarray(qcx)
+    return np.bitwise_or.reduce(np.where(qcx == 1, _TEST_BITS, np.uint64(0)), axis=-1)
+
+
+def read_qc_hex(hex_code):
+    bitmask = int(hex_to_bitmask(hex_code))
+    return [int(t) for t in _TEST_NUMBERS if bitmask & (1 << int(t))]
+
+def test_index(test):
+    try:
+        return _TEST_INDEX[test]
+    except KeyError:
+        raise ValueError(f'{test} is not a QC test number')
+
+def qc_array(qc):
+    return bitmask_to_array(hex_to_bitmask(qc))
 
 class QCx:
 
@@ -68,31 +140,70 @@ class QCx:
         qcp = 0
         qcf = 1
         ix = test_index(test)
-        pass_list = ['p', 'P', 'PASS', 'pass', 1, '1', True]
-        fail_list = ['f', 'F', 'FAIL', 'fail', 0, '0', False]
 
-        if passfail in pass_list:
+        if passfail in _PASS:
             if qc[qcp, ix] == 0 and qc[qcf, ix] == 0:
                 qc[qcp, ix] = 1
-        elif passfail in fail_list:
+        elif passfail in _FAIL:
             if qc[qcp, ix] == 0 and qc[qcf, ix] == 0:
                 qc[qcf, ix] = 1
             elif qc[qcp, ix] == 1:
                 qc[qcf, ix] = 1
                 qc[qcp, ix] = 0
         else: # pragma: no cover
-            raise ValueError(f'passfail input not recognized, must be one of {pass_list} to pass or {fail_list} to fail')
+            raise ValueError(f'passfail input not recognized, must be one of {list(_PASS)} to pass or {list(_FAIL)} to fail')
 
     @staticmethod
     def array_to_hex(qcx):
-        test_numbers = list(range(1, 26)) + list(range(57, 64))
-        num = 0
-
-        for q, t in zip(qcx, test_numbers):
-            if q == 1:
-                num += 2**t
-        
-        return hex(num)
+        return bitmask_to_hex(array_to_bitmask(qcx))
+
+    @staticmethod
+    def bitmask(qc_tests):
+        """
+        Return the ``(qcp, qcf)`` ``uint64`` bitmasks of a ``(2, 32)``
+        ``qc_tests`` array or of an array of them with shape ``(n, 2, 32)``
+        (e.g., :attr:`medsrtqc.batch.ProfileBatch.qc_tests`).
+        """
+        bitmask = array_to_bitmask(qc_tests)
+        return bitmask[..., 0], bitmask[..., 1]
+
+    @staticmethod
+    def from_bitmask(qcp, qcf):
+        """The inverse of :meth:`bitmask`"""
+        qcp, qcf = np.broadcast_arrays(np.asarray(qcp, dtype=np.uint64), np.asarray(qcf, dtype=np.uint64))
+        return bitmask_to_array(np.stack([qcp, qcf], axis=-1))
+
+    @staticmethod
+    def update_bitmask(qcp, qcf, test, passfail):
+        """
+        The :meth:`update_safely` rules applied to ``uint64`` bitmasks:
+        a pass is only recorded for tests that have not yet been run and
+        a failure replaces a pass. Returns the updated ``(qcp, qcf)``.
+        ``qcp``, ``qcf``, and ``passfail`` may be arrays (e.g., one
+        value per profile); array values of ``passfail`` are
+        interpreted as ``bool``.
+
+        >>> from medsrtqc.qc.history import QCx
+        >>> qcp, qcf = QCx.update_bitmask(0, 0, 6, 'pass')
+        >>> QCx.update_bitmask(qcp, qcf, 6, 'fail')
+        (np.uint64(0), np.uint64(64))
+        """
+
+        bit = _TEST_BITS[test_index(test)]
+        qcp = np.asarray(qcp, dtype=np.uint64)
+        qcf = np.asarray(qcf, dtype=np.uint64)
+
+        if np.ndim(passfail) > 0:
+            passed = np.asarray(passfail, dtype=bool)
+            qcp, qcf = np.where(passed, qcp | (bit & ~qcf), qcp & ~bit), np.where(passed, qcf, qcf | bit)
+        elif passfail in _PASS:
+            qcp = qcp | (bit & ~qcf)
+        elif passfail in _FAIL:
+            qcp, qcf = qcp & ~bit, qcf | bit
+        else: # pragma: no cover
+            raise ValueError(f'passfail input not recognized, must be one of {list(_PASS)} to pass or {list(_FAIL)} to fail')
+
+        return qcp[()], qcf[()]
 
     test_descriptions = [
         '1. Platform Identification test',
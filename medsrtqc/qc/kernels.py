@@ -0,0 +1,109 @@
+"""
+Numerical kernels shared by several QC operations. These operate on
+plain arrays (or on the concatenated, ragged columns of a
+:class:`medsrtqc.batch.ProfileBatch`) rather than on
+:class:`medsrtqc.core.Profile` objects.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def running_median(x, n, positive=True) -> np.ndarray:
+    """
+    The median of each window of ``n`` consecutive values of ``x``,
+    padded with ``n // 2`` NaN values on either side. Masked and NaN
+    values (and, if ``positive`` is ``True``, values that are not
+    greater than zero) are excluded from each window and
+    windows without any valid values are NaN. The result is a float64
+    array with ``len(x) - n + 1 + 2 * (n // 2)`` values (i.e., the same
+    length as ``x`` for odd ``n``).
+
+    :param x: A one-dimensional array or masked array.
+    :param n: The window size.
+    :param positive: Use ``False`` to include values that are zero
+        or negative.
+
+    >>> from medsrtqc.qc.kernels import running_median
+    >>> running_median([1, 5, 2, 0, 3], 3)
+    array([nan, 2. , 3.5, 2.5, nan])
+    """
+
+    values, valid = _valid_values(x, positive)
+    pad = np.full(int(n / 2), np.nan)
+    med = _window_medians(values, valid, n)
+    return np.concatenate([pad, med, pad])
+
+
+def running_median_ragged(x, offsets, n, positive=True) -> np.ndarray:
+    """
+    :func:`running_median` for many profiles stored as one concatenated
+    array (e.g., :meth:`medsrtqc.batch.ProfileBatch.column`) where
+    ``x[offsets[i]:offsets[i + 1]]`` are the values of profile ``i``.
+    Windows never span more than one profile. The result has the
+    same length and offsets as ``x``: the ``n // 2`` values at either
+    end of each profile, and all values of profiles with fewer than
+    ``n`` levels, are NaN. For odd ``n`` and profiles with at least
+    ``n`` levels, each profile's values are identical to those of
+    :func:`running_median`.
+
+    :param x: A one-dimensional array or masked array.
+    :param offsets: An integer array with one more element than there
+        are profiles.
+    :param n: The window size.
+    :param positive: Use ``False`` to include values that are zero
+        or negative.
+    """
+
+    values, valid = _valid_values(x, positive)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(values) or np.any(np.diff(offsets) < 0):
+        raise ValueError('`offsets` must increase from 0 to the length of `x`')
+
+    out = np.full(len(values), np.nan)
+    med = _window_medians(values, valid, n)
+    if len(med) == 0:
+        return out
+
+    # window i covers x[i:(i + n)] and is only used if it lies within
+    # a single profile
+    start = np.arange(len(med))
+    profile = np.searchsorted(offsets, start, side='right') - 1
+    inside = start + n <= offsets[profile + 1]
+    out[start[inside] + int(n / 2)] = med[inside]
+    return out
+
+
+def _valid_values(x, positive):
+    values = np.ma.getdata(x)
+    if values.dtype.kind not in 'fc':
+        values = values.astype(np.float64)
+
+    valid = ~np.isnan(values) & ~np.ma.getmaskarray(x)
+    if positive:
+        valid &= values > 0
+    return values, valid
+
+
+def _window_medians(values, valid, n):
+    # The median of each window, exactly as np.median() of the valid values
+    # would calculate it: the middle value or the mean of the two middle
+    # values in the precision of the input. Windows are small and of fixed
+    # size, so sorting all windows at once is much faster than a per-window
+    # Python loop.
+    if len(values) < n:
+        return np.zeros(0)
+
+    values = np.where(valid, values, np.nan)
+    windows = np.sort(sliding_window_view(values, n), axis=1)
+    count = sliding_window_view(valid, n).sum(axis=1)
+
+    rows = np.arange(len(windows))
+    lower = windows[rows, np.maximum(count - 1, 0) // 2]
+    upper = windows[rows, count // 2]
+    with np.errstate(invalid='ignore', over='ignore'):
+        med = np.where(count % 2 == 1, lower, (lower + upper) / values.dtype.type(2))
+
+    med = med.astype(np.float64)
+    med[count == 0] = np.nan
+    return med
@@ -79,9 +79,9 @@ class PressureIncreasingTest(QCTest):
     nvs_uri = "http://vocab.nerc.ac.uk/collection/R11/current/8/"
 
     def run_impl(self):
-        pres = self.profile['PRES']
-        temp = self.profile['TEMP']
-        psal = self.profile['PSAL']
+        pres = self.profile.copy('PRES')
+        temp = self.profile.copy('TEMP')
+        psal = self.profile.copy('PSAL')
 
         # ensure pressure values are identical for the three params
         temp_pres_eq = temp.pres == pres.value
@@ -92,24 +92,23 @@ class PressureIncreasingTest(QCTest):
         # do the first pass checking that every value is increasing
         diff = np.diff(pres.value, prepend=-np.inf)  # first measurement always passes
         non_monotonic_elements = diff < 0.0
-        Flag.update_safely(pres.qc, Flag.BAD, where=non_monotonic_elements)
-        Flag.update_safely(temp.qc, Flag.BAD, where=non_monotonic_elements)
-        Flag.update_safely(psal.qc, Flag.BAD, where=non_monotonic_elements)
 
         # do the second pass finding consecutive constant values
         constant = diff == 0.0
-        Flag.update_safely(pres.qc, Flag.BAD, where=constant)
-        Flag.update_safely(temp.qc, Flag.BAD, where=constant)
-        Flag.update_safely(psal.qc, Flag.BAD, where=constant)
 
         # do the third pass finding any sections where it has been non-montonic and
         # is still below the last good value this is a running maximum,
         # constant parts mean bad values
         running_maximum = np.maximum.accumulate(pres.value, axis=-1)
         running_maximum_constant = np.diff(running_maximum, prepend=-np.inf) == 0.0
-        Flag.update_safely(pres.qc, Flag.BAD, where=running_maximum_constant)
-        Flag.update_safely(temp.qc, Flag.BAD, where=running_maximum_constant)
-        Flag.update_safely(psal.qc, Flag.BAD, where=running_maximum_constant)
+
+        updates = [
+            (Flag.BAD, non_monotonic_elements),
+            (Flag.BAD, constant),
+            (Flag.BAD, running_maximum_constant)
+        ]
+        for trace in (pres, temp, psal):
+            Flag.update_many(trace.qc, updates)
 
         # apply updates
         self.update_trace('PRES', pres)
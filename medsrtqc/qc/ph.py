@@ -1,15 +1,18 @@
 
 import numpy as np
 
+from medsrtqc.core import align
 from medsrtqc.qc.operation import QCOperation
 from medsrtqc.qc.flag import Flag
 from medsrtqc.qc.history import QCx
+from medsrtqc.qc.kernels import running_median
+from medsrtqc.parameters import parameters
 
 class pHTest(QCOperation):
 
     def run_impl(self):
-        pH_free = self.profile['PHPH']
-        pH_total = self.profile['PHTO']
+        pH_free = self.profile.copy('PHPH')
+        pH_total = self.profile.copy('PHTO')
 
         # set flags to zero, there are no QC tests for pH yet
         Flag.update_safely(pH_free.qc, Flag.NO_QC)
@@ -20,7 +23,8 @@ class pHTest(QCOperation):
 
         # global range test
         self.log('Applying global range test to PH_IN_SITU_TOTAL')
-        values_outside_range = (pH_total.value < 7.0) | (pH_total.value > 8.3)
+        valid_min, valid_max = parameters.valid_range('PHTO')
+        values_outside_range = (pH_total.value < valid_min) | (pH_total.value > valid_max)
         Flag.update_safely(pH_total.qc, Flag.BAD, values_outside_range)
         QCx.update_safely(self.profile.qc_tests, 6, not any(values_outside_range))
 
@@ -43,10 +47,10 @@ class pHTest(QCOperation):
         # pH specific tests
         pres = self.profile['PRES']
         temp = self.profile['TEMP']
-        temp_syn_qc = [temp.qc[np.abs(temp.pres - p) == np.min(np.abs(temp.pres - p))] for p in pH_total.pres]
-        Flag.update_safely(pH_total.qc, Flag.BAD, temp_syn_qc == 4)
-        pres_syn_qc = [pres.qc[np.abs(pres.value - p) == np.min(np.abs(pres.value - p))] for p in pH_total.pres]
-        Flag.update_safely(pH_total.qc, Flag.BAD, pres_syn_qc == 4)
+        temp_syn_qc = align(pH_total, temp).take(temp.qc)
+        Flag.update_safely(pH_total.qc, Flag.BAD, Flag.isin(temp_syn_qc, Flag.BAD))
+        pres_syn_qc = align(pH_total, pres).take(pres.qc)
+        Flag.update_safely(pH_total.qc, Flag.BAD, Flag.isin(pres_syn_qc, Flag.BAD))
         # technically another test is pH_total.qc = 3 if psal.qc = 4 but
         # pH_total.qc is already 3 by default - will matter for adjusted mode?
 
@@ -58,10 +62,4 @@ class pHTest(QCOperation):
 
     def running_median(self, n):
         self.log(f'Calculating running median over window size {n}')
-        x = self.profile['PHTO'].value
-        ix = np.arange(n) + np.arange(len(x)-n+1)[:,None]
-        b = [row[row > 0] for row in x[ix]]
-        k = int(n/2)
-        med = [np.median(c) for c in b]
-        med = np.array(k*[np.nan] + med + k*[np.nan])
-        return med
+        return running_median(self.profile['PHTO'].value, n)
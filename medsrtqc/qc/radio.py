@@ -4,25 +4,18 @@ import numpy as np
 from medsrtqc.qc.operation import QCOperation
 from medsrtqc.qc.flag import Flag
 from medsrtqc.qc.history import QCx
+from medsrtqc.parameters import parameters
 
 class radiometryTest(QCOperation):
 
     def run_impl(self, rad=True, par=True):
-        wavelength_keys = ['P380', 'P412', 'P443', 'P490', 'PAR$']
-        wavelength_lims = [
-            (-1, 1.7),
-            (-1, 2.9),
-            (-1, 3.2),
-            (-1, 3.4),
-            (-1, 4672),
-        ]
-        range_test_pairs = {k:v for k, v in zip(wavelength_keys, wavelength_lims)}
+        range_test_pairs = {p.vms: (p.valid_min, p.valid_max) for p in parameters.for_test('radiometry')}
 
         # irradiance tests
         all_passed = True
         for k, v in range_test_pairs.items():
             if k in self.profile.keys():
-                rad_trace = self.profile[k]
+                rad_trace = self.profile.copy(k)
                 self.log(f'Setting previously unset flags for {k} to GOOD')
                 Flag.update_safely(rad_trace.qc, to=Flag.GOOD)
                 # global range test
@@ -19,7 +19,7 @@ class ResetQCOperation(QCOperation):
             reset_vars = set(self.profile.keys).intersection(self._vars)
 
         for var in reset_vars:
-            trace = self.profile[var]
+            trace = self.profile.copy(var)
 
             if self._qc:
                 trace.qc[:] = Flag.NO_QC
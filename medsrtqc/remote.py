@@ -0,0 +1,418 @@
+"""
+Remote NetCDF files (e.g., from the Argo GDAC) are downloaded
+using a pool of keep-alive HTTP connections and can be stored in
+a :class:`URLCache` on disk so that repeated runs only revalidate
+files using their ``ETag`` or ``Last-Modified`` headers. Most users
+will use the ``cache`` argument of :func:`medsrtqc.nc.read_nc_profile`
+or :func:`prefetch` to download many files concurrently.
+
+>>> from medsrtqc.remote import URLCache, prefetch
+>>> from medsrtqc.nc import read_nc_profile
+>>> cache = URLCache('argo-cache', max_size=2 ** 30)
+>>> url = 'https://data-argo.ifremer.fr/dac/coriolis/6904117/profiles/BD6904117_085.nc'
+>>> prefetch([url], workers=4, cache=cache)
+>>> profile = read_nc_profile(url, cache=cache)
+"""
+
+import os
+import json
+import atexit
+import contextlib
+import time
+import hashlib
+import tempfile
+import threading
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+#: The result of :meth:`ConnectionPool.request`. ``headers`` is the
+#: ``http.client.HTTPMessage`` of the final response (header lookups
+#: are case-insensitive).
+Response = namedtuple('Response', ['url', 'status', 'headers', 'body'])
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of keep-alive ``http.client`` connections
+    keyed by scheme, host, and port. Connections are reused for
+    subsequent requests to the same server. Requests for which a
+    proxy is configured (e.g., using the ``http_proxy``, ``https_proxy``,
+    and ``no_proxy`` environment variables) are made without pooling
+    using ``urllib.request``.
+    """
+
+    def __init__(self, maxsize=8, timeout=60):
+        """
+        :param maxsize: The maximum number of idle connections kept
+            for each server.
+        :param timeout: The socket timeout in seconds.
+        """
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def request(self, url, headers=None, method='GET', max_redirects=5) -> Response:
+        """
+        Perform a request and read the response body. Redirects are
+        followed and statuses of 400 or more raise
+        ``urllib.error.HTTPError``.
+
+        :param url: An ``http://`` or ``https://`` URL.
+        :param headers: A ``dict()`` of request headers.
+        :param method: The HTTP method.
+        :param max_redirects: The maximum number of redirects to follow.
+        """
+
+        headers = {} if headers is None else dict(headers)
+        if _uses_proxy(url):
+            return self._request_urllib(url, headers, method)
+
+        for _ in range(max_redirects + 1):
+            status, response_headers, body = self._request_once(url, headers, method)
+            if status in _REDIRECTS and 'Location' in response_headers:
+                url = urllib.parse.urljoin(url, response_headers['Location'])
+                continue
+            if status >= 400:
+                raise urllib.error.HTTPError(url, status, http.client.responses.get(status, ''), response_headers, None)
+            return Response(url, status, response_headers, body)
+
+        raise urllib.error.HTTPError(url, status, 'Too many redirects', response_headers, None)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _request_once(self, url, headers, method):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Can't request '{url}' using a ConnectionPool")
+
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        connection, reused = self._get(key)
+        try:
+            try:
+                response = self._send(connection, method, path, headers)
+            except (http.client.HTTPException, ConnectionError):
+                if not reused:
+                    raise
+                # the server may have closed an idle connection
+                connection.close()
+                connection, reused = self._new(key), False
+                response = self._send(connection, method, path, headers)
+            body = response.read()
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._put(key, connection)
+
+        return response.status, response.msg, body
+
+    def _request_urllib(self, url, headers, method):
+        request = urllib.request.Request(url, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as f:
+                return Response(f.geturl(), f.status, f.headers, f.read())
+        except urllib.error.HTTPError as e:
+            # urllib raises for statuses like 304 that request() returns
+            if e.code >= 400:
+                raise
+            with e:
+                return Response(e.geturl(), e.code, e.headers, e.read())
+
+    def _send(self, connection, method, path, headers):
+        connection.request(method, path, headers=headers)
+        return connection.getresponse()
+
+    def _get(self, key):
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                return connections.pop(), True
+        return self._new(key), False
+
+    def _new(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        else:
+            return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _put(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.maxsize:
+                connections.append(connection)
+                return
+        connection.close()
+
+
+def _uses_proxy(url):
+    parts = urllib.parse.urlsplit(url)
+    proxy = urllib.request.getproxies().get(parts.scheme)
+    return bool(proxy) and not urllib.request.proxy_bypass(parts.netloc)
+
+
+class URLCache:
+    """
+    A directory of downloaded files keyed by URL. Cached files are
+    revalidated with the server using their ``ETag`` and/or
+    ``Last-Modified`` headers, are written atomically (so that several
+    processes can share a cache), and the least-recently used files
+    are removed when the total size exceeds ``max_size``.
+    """
+
+    def __init__(self, path, max_size=None, max_age=0, pool=None):
+        """
+        :param path: The cache directory, which is created if it does
+            not exist.
+        :param max_size: The maximum total size of cached files in bytes
+            or ``None`` for no limit.
+        :param max_age: The number of seconds after a file was last
+            validated during which it is used without contacting the server.
+        :param pool: The :class:`ConnectionPool` used for downloads.
+            Defaults to a pool shared by the module.
+        """
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.pool = _default_pool if pool is None else pool
+        self._lock = threading.Lock()
+        self._pins = {}
+        os.makedirs(self.path, exist_ok=True)
+
+    def fetch(self, url) -> str:
+        """
+        Download ``url`` if it is not cached or has changed on the server
+        and return the path to the cached file. The file is not evicted
+        while it is being fetched, even if it is larger than ``max_size``.
+        """
+
+        data_path, meta_path = self._paths(url)
+        with self._pinned([url]):
+            return self._fetch(url, data_path, meta_path)
+
+    def _fetch(self, url, data_path, meta_path):
+        meta = self._read_meta(meta_path)
+        if meta is not None and not os.path.exists(data_path):
+            meta = None
+
+        if meta is not None and time.time() - meta.get('validated', 0) < self.max_age:
+            self._touch(data_path)
+            return data_path
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.pool.request(url, headers=headers)
+        if response.status == 304 and meta is not None:
+            meta['validated'] = time.time()
+            self._write(meta_path, json.dumps(meta).encode())
+            self._touch(data_path)
+            return data_path
+
+        self._write(data_path, response.body)
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'size': len(response.body),
+            'validated': time.time()
+        }
+        self._write(meta_path, json.dumps(meta).encode())
+        self.evict()
+        return data_path
+
+    def cached_path(self, url):
+        """The path to the cached file for ``url`` or ``None`` if it is not cached."""
+        data_path, meta_path = self._paths(url)
+        return data_path if os.path.exists(data_path) and os.path.exists(meta_path) else None
+
+    def size(self):
+        """The total size of cached files in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, max_size=None):
+        """
+        Remove the least-recently used files until the total size
+        is at most ``max_size`` (defaults to the ``max_size`` of the cache).
+        Files that are currently being fetched are kept.
+        """
+
+        max_size = self.max_size if max_size is None else max_size
+        if max_size is None:
+            return
+
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda item: item[2])
+            total = sum(size for _, size, _ in entries)
+            for data_path, size, _ in entries:
+                if total <= max_size:
+                    break
+                if data_path in self._pins:
+                    continue
+                for path in (data_path, data_path[:-len('.data')] + '.json'):
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:  # pragma: no cover
+                        pass
+                total -= size
+
+    def clear(self):
+        """Remove all cached files."""
+        self.evict(0)
+
+    @contextlib.contextmanager
+    def _pinned(self, urls):
+        # files for urls are not evicted until the block exits
+        data_paths = [self._paths(url)[0] for url in urls]
+        with self._lock:
+            for data_path in data_paths:
+                self._pins[data_path] = self._pins.get(data_path, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for data_path in data_paths:
+                    self._pins[data_path] -= 1
+                    if not self._pins[data_path]:
+                        del self._pins[data_path]
+
+    def _entries(self):
+        entries = []
+        for item in os.scandir(self.path):
+            if item.name.endswith('.data'):
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:  # pragma: no cover
+                    continue
+                entries.append((item.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, key + '.data'), os.path.join(self.path, key + '.json')
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path, 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _touch(self, data_path):
+        # the modification time is used to track recent use
+        try:
+            os.utime(data_path)
+        except FileNotFoundError:  # pragma: no cover
+            pass
+
+    def _write(self, path, content):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:  # pragma: no cover
+                pass
+            raise
+
+
+def default_cache() -> URLCache:
+    """
+    The :class:`URLCache` used when ``cache=True``. Its directory is the
+    ``MEDSRTQC_CACHE`` environment variable or ``~/.cache/medsrtqc``.
+    """
+
+    global _default_cache
+    path = os.environ.get('MEDSRTQC_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'medsrtqc'))
+    with _default_lock:
+        if _default_cache is None or _default_cache.path != os.path.abspath(path):
+            _default_cache = URLCache(path)
+        return _default_cache
+
+
+def fetch(url, cache=None) -> bytes:
+    """
+    Download the content of ``url`` using a pooled connection.
+
+    :param url: An ``http://``, ``https://``, or ``ftp://`` URL. Only
+        HTTP(S) URLs use connection pooling and caching.
+    :param cache: A :class:`URLCache`, a cache directory, ``True`` to use
+        :func:`default_cache`, or ``None`` to skip caching.
+    """
+
+    cache = _as_cache(cache)
+    if not url.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(url) as f:
+            return f.read()
+    elif cache is None:
+        return _default_pool.request(url).body
+    else:
+        with cache._pinned([url]), open(cache.fetch(url), 'rb') as f:
+            return f.read()
+
+
+def prefetch(urls, workers=4, cache=True):
+    """
+    Download ``urls`` concurrently into a cache and return the ``list()``
+    of cached paths. None of these files are evicted before this function
+    returns, even if their total size is more than the ``max_size`` of the cache.
+
+    :param urls: An iterable of ``http://`` or ``https://`` URLs.
+    :param workers: The number of concurrent downloads.
+    :param cache: A :class:`URLCache`, a cache directory, or ``True``
+        to use :func:`default_cache`.
+    """
+
+    cache = _as_cache(cache)
+    if cache is None:
+        raise ValueError('prefetch() requires a cache')
+
+    urls = list(urls)
+    with cache._pinned(urls), ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(cache.fetch, urls))
+
+
+def _as_cache(cache):
+    if cache is None or cache is False:
+        return None
+    elif cache is True:
+        return default_cache()
+    elif isinstance(cache, URLCache):
+        return cache
+    else:
+        return URLCache(cache)
+
+
+_default_pool = ConnectionPool()
+atexit.register(_default_pool.close)
+_default_cache = None
+_default_lock = threading.Lock()
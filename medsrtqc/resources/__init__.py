@@ -18,6 +18,9 @@ include:
 
 ``'BR6904117_085.nc'``, ``'R6904117_085.nc'``
     A core and BGC Argo NetCDF file for use testing BGC variables.
+
+``'parameters.csv'``
+    The parameter catalog read by :mod:`medsrtqc.parameters`.
 """
 
 import sys
@@ -0,0 +1,360 @@
+"""
+A compact binary representation of :class:`medsrtqc.core.Trace` and
+:class:`medsrtqc.core.Profile` objects for passing profiles between
+processes or caching QC results on disk. A serialized object is a small
+JSON header describing the traces and profile attributes followed by
+one contiguous buffer for each array. Arrays are read directly from
+those buffers without copying, and :class:`Packed` objects pass them
+as out-of-band buffers when pickled with protocol 5.
+
+>>> from medsrtqc.serialize import dumps, loads
+>>> from medsrtqc.core import Trace
+>>> trace = loads(dumps(Trace([1, 2, 3], qc=[b'1', b'1', b'4'])))
+>>> trace.qc
+masked_array(data=[b'1', b'1', b'4'],
+             mask=False,
+       fill_value=b'N/A',
+            dtype='|S1')
+"""
+
+import json
+import pickle
+import struct
+
+import numpy as np
+from numpy.ma import MaskedArray
+
+from .core import Trace, Profile
+from .batch import ProfileBatch
+
+#: The version written to the header of serialized objects
+FORMAT_VERSION = 1
+
+_MAGIC = b'MEDSRTQC'
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGN = 8
+
+_TRACE_ATTRS = ('value', 'qc', 'adjusted', 'adjusted_error', 'adjusted_qc', 'pres', 'mtime')
+
+# profile attributes set by VMSProfile.prepare() and NetCDFProfile.prepare()
+_PROFILE_ATTRS = ('wmo', 'cycle_number', 'direction', 'parking_pres', 'latitude', 'longitude')
+
+
+class SerializationError(ValueError):
+    """Raised when serialized data is invalid or of an unsupported version"""
+    pass
+
+
+def to_buffers(obj, pack_masks=True, complete=False):
+    """
+    Serialize a :class:`medsrtqc.core.Trace`, :class:`medsrtqc.core.Profile`,
+    or :class:`medsrtqc.batch.ProfileBatch` into a header and a ``list()`` of
+    buffers. Profiles are serialized as the :class:`medsrtqc.core.Trace`
+    objects they contain, their metadata (if implemented), and the
+    ``wmo``, ``cycle_number``, ``direction``, ``parking_pres``,
+    ``latitude``, ``longitude``, and ``qc_tests`` attributes if present.
+
+    :param obj: A :class:`medsrtqc.core.Trace`, :class:`medsrtqc.core.Profile`,
+        or :class:`medsrtqc.batch.ProfileBatch`.
+    :param pack_masks: Use ``False`` to store masks with one byte per value
+        rather than one bit so that they can be modified in place
+        after :func:`from_buffers`.
+    :param complete: Use ``True`` to also store attributes that were not
+        supplied and masks that contain no masked values so that every
+        attribute can be modified in place after :func:`from_buffers`.
+    :return: A ``tuple()`` of the header (``bytes``) and a ``list()`` of
+        ``memoryview`` objects.
+    """
+
+    pack_masks = pack_masks and not complete
+    buffers = []
+    if isinstance(obj, Trace):
+        header = {'type': 'trace', 'trace': _trace_header(obj, buffers, pack_masks, complete)}
+    elif isinstance(obj, ProfileBatch):
+        header = {
+            'type': 'batch',
+            'columns': {k: _trace_header(obj.column(k, readonly=True), buffers, pack_masks, complete) for k in obj.keys()},
+            'offsets': {k: _add_buffer(buffers, obj.offsets(k)) for k in obj.keys()},
+            'keys': [list(profile.keys()) for profile in obj],
+            'meta': {attr: [_json_value(v) for v in values] for attr, values in obj.meta.items()},
+            'qc_tests': None if obj.qc_tests is None else _add_buffer(buffers, obj.qc_tests),
+            'has_qc_tests': [bool(v) for v in obj.has_qc_tests]
+        }
+    elif isinstance(obj, Profile):
+        header = {'type': 'profile', 'traces': {}, 'meta': None, 'attrs': {}, 'qc_tests': None}
+        for k, trace in obj.items():
+            header['traces'][k] = _trace_header(trace, buffers, pack_masks, complete)
+
+        try:
+            header['meta'] = {k: _json_value(obj.meta(k)) for k in obj.meta_keys()}
+        except NotImplementedError:
+            pass
+
+        for attr in _PROFILE_ATTRS:
+            if hasattr(obj, attr):
+                header['attrs'][attr] = _json_value(getattr(obj, attr))
+
+        if hasattr(obj, 'qc_tests'):
+            header['qc_tests'] = _add_buffer(buffers, np.asarray(obj.qc_tests))
+    else:
+        raise TypeError(f"Can't serialize object of type '{type(obj).__name__}'")
+
+    header['version'] = FORMAT_VERSION
+    header['buffers'] = [{'dtype': v.dtype.str, 'shape': list(v.shape)} for v in buffers]
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+    return header, [memoryview(v).cast('B') for v in buffers]
+
+
+def from_buffers(header, buffers, profile_type=Profile):
+    """
+    Recreate the :class:`medsrtqc.core.Trace`, :class:`medsrtqc.core.Profile`,
+    or :class:`medsrtqc.batch.ProfileBatch` from the output of :func:`to_buffers`.
+    The arrays of the result share memory with ``buffers`` and are only
+    writable if ``buffers`` are writable. Profiles are recreated as
+    a :class:`medsrtqc.core.Profile` regardless of the type that was
+    serialized.
+
+    :param header: The header as returned by :func:`to_buffers`.
+    :param buffers: The buffers as returned by :func:`to_buffers`.
+    :param profile_type: The type used to recreate profiles, which
+        is called with a ``dict`` of traces and metadata like
+        the :class:`medsrtqc.core.Profile` constructor.
+    """
+
+    try:
+        header = json.loads(bytes(header).decode('utf-8'))
+    except ValueError as e:
+        raise SerializationError(f'Invalid header: {e}')
+
+    if header.get('version') != FORMAT_VERSION:
+        raise SerializationError(f"Unsupported serialization version: {header.get('version')}")
+
+    specs = header['buffers']
+    if len(specs) != len(buffers):
+        raise SerializationError(f'Expected {len(specs)} buffers but got {len(buffers)}')
+
+    arrays = []
+    for spec, buf in zip(specs, buffers):
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        try:
+            v = np.frombuffer(buf, dtype=dtype, count=count)
+        except ValueError as e:
+            raise SerializationError(f'Invalid buffer: {e}')
+        arrays.append(v.reshape(spec['shape']))
+
+    if header['type'] == 'trace':
+        return _trace_from_header(header['trace'], arrays)
+    elif header['type'] == 'batch':
+        return ProfileBatch(
+            {k: _trace_from_header(v, arrays) for k, v in header['columns'].items()},
+            {k: arrays[i] for k, i in header['offsets'].items()},
+            header['keys'],
+            meta=header['meta'],
+            qc_tests=None if header['qc_tests'] is None else arrays[header['qc_tests']].copy(),
+            has_qc_tests=header['has_qc_tests']
+        )
+
+    traces = {k: _trace_from_header(v, arrays) for k, v in header['traces'].items()}
+    profile = profile_type(traces, header['meta'])
+    for attr, value in header['attrs'].items():
+        setattr(profile, attr, value)
+    if header['qc_tests'] is not None:
+        # qc_tests is small and is modified in place by QC operations
+        profile.qc_tests = arrays[header['qc_tests']].copy()
+    return profile
+
+
+def dumps(obj, pack_masks=True, complete=False) -> bytes:
+    """
+    Serialize a :class:`medsrtqc.core.Trace`, :class:`medsrtqc.core.Profile`,
+    or :class:`medsrtqc.batch.ProfileBatch` to ``bytes``. See
+    :func:`to_buffers` for details.
+    """
+
+    header, buffers = to_buffers(obj, pack_masks=pack_masks, complete=complete)
+    out = bytearray(packed_size(header, buffers))
+    pack_into(out, header, buffers)
+    return bytes(out)
+
+
+def packed_size(header, buffers):
+    """
+    The number of bytes needed to write ``header`` and ``buffers``
+    (as returned by :func:`to_buffers`) using :func:`pack_into`.
+    """
+
+    offset = _PREAMBLE.size + len(header)
+    for buf in buffers:
+        offset += -offset % _ALIGN + len(buf)
+    return offset
+
+
+def pack_into(out, header, buffers):
+    """
+    Write ``header`` and ``buffers`` (as returned by :func:`to_buffers`)
+    into the writable buffer ``out`` in the format used by :func:`dumps`.
+    This can be used to serialize directly into memory that was
+    allocated elsewhere (e.g., shared memory).
+    """
+
+    out = memoryview(out).cast('B')
+    if len(out) < packed_size(header, buffers):
+        raise ValueError('`out` is too small to contain the serialized data')
+
+    _PREAMBLE.pack_into(out, 0, _MAGIC, FORMAT_VERSION, len(header))
+    offset = _PREAMBLE.size
+    out[offset:(offset + len(header))] = header
+    offset += len(header)
+    for buf in buffers:
+        pad = -offset % _ALIGN
+        out[offset:(offset + pad)] = bytes(pad)
+        offset += pad
+        out[offset:(offset + len(buf))] = buf
+        offset += len(buf)
+
+
+def loads(data, profile_type=Profile):
+    """
+    Recreate a :class:`medsrtqc.core.Trace`, :class:`medsrtqc.core.Profile`,
+    or :class:`medsrtqc.batch.ProfileBatch` from the output of :func:`dumps`.
+    The arrays of the result are read-only views of ``data`` unless ``data``
+    is writable (e.g., a ``bytearray``). See :func:`from_buffers` for
+    details.
+    """
+
+    data = memoryview(data).cast('B')
+    if len(data) < _PREAMBLE.size:
+        raise SerializationError('Serialized data is too short')
+
+    magic, version, header_len = _PREAMBLE.unpack_from(data)
+    if magic != _MAGIC:
+        raise SerializationError('Serialized data does not start with the expected signature')
+    if version != FORMAT_VERSION:
+        raise SerializationError(f'Unsupported serialization version: {version}')
+
+    offset = _PREAMBLE.size + header_len
+    header = data[_PREAMBLE.size:offset]
+    try:
+        specs = json.loads(bytes(header).decode('utf-8'))['buffers']
+    except (ValueError, KeyError) as e:
+        raise SerializationError(f'Invalid header: {e}')
+
+    buffers = []
+    for spec in specs:
+        offset += -offset % _ALIGN
+        size = np.dtype(spec['dtype']).itemsize * int(np.prod(spec['shape'], dtype=np.int64))
+        if offset + size > len(data):
+            raise SerializationError('Serialized data is truncated')
+        buffers.append(data[offset:(offset + size)])
+        offset += size
+
+    return from_buffers(header, buffers, profile_type=profile_type)
+
+
+class Packed:
+    """
+    A serialized :class:`medsrtqc.core.Trace` or :class:`medsrtqc.core.Profile`
+    that can be sent to other processes. When pickled with protocol 5
+    and a ``buffer_callback``, the array buffers are passed out-of-band
+    rather than copied into the pickle stream.
+
+    >>> import pickle
+    >>> from medsrtqc.serialize import Packed
+    >>> from medsrtqc.core import Trace
+    >>> packed = Packed(Trace([1, 2, 3]))
+    >>> buffers = []
+    >>> data = pickle.dumps(packed, protocol=5, buffer_callback=buffers.append)
+    >>> pickle.loads(data, buffers=buffers).unpack().value
+    masked_array(data=[1., 2., 3.],
+                 mask=False,
+           fill_value=1e+20,
+                dtype=float32)
+    """
+
+    def __init__(self, obj, pack_masks=True):
+        """
+        :param obj: A :class:`medsrtqc.core.Trace` or :class:`medsrtqc.core.Profile`.
+        :param pack_masks: See :func:`to_buffers`.
+        """
+        self.header, self.buffers = to_buffers(obj, pack_masks=pack_masks)
+
+    @classmethod
+    def _from_buffers(cls, header, *buffers):
+        packed = cls.__new__(cls)
+        packed.header = header
+        packed.buffers = [memoryview(buf).cast('B') for buf in buffers]
+        return packed
+
+    def unpack(self):
+        """Recreate the :class:`medsrtqc.core.Trace` or :class:`medsrtqc.core.Profile`"""
+        return from_buffers(self.header, self.buffers)
+
+    def __reduce_ex__(self, protocol):
+        if protocol >= 5:
+            buffers = [pickle.PickleBuffer(buf) for buf in self.buffers]
+        else:
+            buffers = [bytes(buf) for buf in self.buffers]
+        return type(self)._from_buffers, (self.header, ) + tuple(buffers)
+
+
+def _add_buffer(buffers, v):
+    buffers.append(np.ascontiguousarray(v))
+    return len(buffers) - 1
+
+
+def _trace_header(trace, buffers, pack_masks, complete):
+    storage = trace.storage
+    header = {'n': len(trace), 'storage': storage, 'attrs': {}}
+
+    for attr in _TRACE_ATTRS:
+        # absent attributes are not stored
+        if attr != 'value' and not complete and getattr(trace, '_' + attr) is None:
+            continue
+
+        v = getattr(trace, attr)
+        item = {'data': _add_buffer(buffers, np.ma.getdata(v)), 'mask': None, 'packed': pack_masks}
+        if storage == 'masked' and (complete or v.mask is not np.ma.nomask):
+            mask = np.ma.getmaskarray(v)
+            item['mask'] = _add_buffer(buffers, np.packbits(mask) if pack_masks else mask)
+
+        header['attrs'][attr] = item
+
+    return header
+
+
+def _trace_from_header(header, arrays):
+    attrs = {}
+    for attr, item in header['attrs'].items():
+        data = arrays[item['data']]
+        if header['storage'] == 'plain':
+            attrs[attr] = data
+        elif item['mask'] is None:
+            attrs[attr] = MaskedArray(data)
+        elif item['packed']:
+            mask = np.unpackbits(arrays[item['mask']], count=data.size).astype(bool).reshape(data.shape)
+            attrs[attr] = MaskedArray(data, mask=mask)
+        else:
+            attrs[attr] = MaskedArray(data, mask=arrays[item['mask']], copy=False)
+
+    return Trace(storage=header['storage'], **attrs)
+
+
+def _json_value(v):
+    # numpy scalars (e.g., read from a NetCDF file) can't be JSON-encoded
+    # and profiles read from several files have a list of them
+    if v is np.ma.masked:
+        return None
+    elif isinstance(v, (list, tuple)):
+        return [_json_value(item) for item in v]
+    elif isinstance(v, dict):
+        return {k: _json_value(item) for k, item in v.items()}
+    elif isinstance(v, np.ndarray):
+        # masked values are None
+        return _json_value(v.tolist())
+    elif isinstance(v, np.generic):
+        return v.item()
+    elif isinstance(v, bytes):
+        return v.decode('utf-8')
+    return v
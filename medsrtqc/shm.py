@@ -0,0 +1,301 @@
+"""
+When QC is run using a pool of worker processes, the arrays of every
+profile are normally pickled into and out of each worker. This module
+places :class:`medsrtqc.core.Profile`, :class:`medsrtqc.core.Trace`,
+or :class:`medsrtqc.batch.ProfileBatch` data in a
+``multiprocessing.shared_memory`` block using the format of
+:mod:`medsrtqc.serialize` so that workers can attach to it without
+copying, modify flags in place, and return only a small
+:class:`QCStatus`. The process that creates a :class:`SharedObject`
+owns the shared memory and is responsible for releasing it, which
+happens when it is closed or garbage collected (or by the
+``multiprocessing`` resource tracker if the owner crashes).
+
+>>> from concurrent.futures import ProcessPoolExecutor
+>>> from medsrtqc.shm import SharedObject, run_qc
+>>> from medsrtqc.vms import read_vms_profiles
+>>> from medsrtqc.resources import resource_path
+>>> from medsrtqc.qc.bbp import bbpTest
+>>> profile = read_vms_profiles(resource_path('bgc_vms.dat'))[0]
+>>> tests = profile.prepare(tests=[bbpTest()])
+>>> with SharedObject(profile) as shared, ProcessPoolExecutor() as pool:
+...     status = pool.submit(run_qc, shared.handle, tests).result()
+...     shared.write_back(profile, status)
+"""
+
+import contextlib
+import multiprocessing
+import os
+import sys
+import traceback
+import weakref
+from collections import namedtuple
+from multiprocessing import shared_memory, resource_tracker
+
+from .core import Profile
+from .batch import ProfileBatch
+from .qc.operation import QCOperationContext
+from . import serialize
+
+
+#: A picklable reference to a :class:`SharedObject` that workers
+#: use to :func:`attach` to it. ``owner`` is the process ID of the
+#: process that created the shared memory (``None`` if unknown).
+SharedHandle = namedtuple('SharedHandle', ['name', 'size', 'owner'], defaults=[None])
+
+#: The result of :func:`run_qc`: the QCP/QCF ``qc_tests`` array (or
+#: ``None``) for the profile or each profile in a batch, the log messages
+#: that were generated, and the keys that were modified (for batches,
+#: ``(profile_index, key)`` tuples).
+QCStatus = namedtuple('QCStatus', ['qc_tests', 'logs', 'modified'])
+
+
+class SharedProfile(Profile):
+    """
+    A :class:`medsrtqc.core.Profile` whose :class:`medsrtqc.core.Trace`
+    objects are backed by shared memory. Assigning a
+    :class:`medsrtqc.core.Trace` writes into the shared arrays rather than
+    replacing them so that the change is visible to every process
+    attached to the same :class:`SharedObject`. These objects are
+    created by :func:`attach` and :attr:`SharedObject.value`.
+    """
+
+    def __init__(self, data, meta=None):
+        super().__init__(data, meta)
+        self._traces = dict(data)
+        self._modified = set()
+
+    def __setitem__(self, k, v):
+        if k not in self._traces:
+            raise KeyError(f"Can't add new parameter '{k}' to a SharedProfile")
+
+        current = self._traces[k]
+        if len(v) != len(current):
+            msg = f"Expected trace for '{k}' with size {len(current)} but got {len(v)}"
+            raise ValueError(msg)
+
+        v = v.with_storage(current.storage)
+        for attr in serialize._TRACE_ATTRS:
+            getattr(current, attr)[:] = getattr(v, attr)
+
+        self._modified.add(k)
+
+    def update_qcx(self):
+        # qc_tests is returned to the owner in a QCStatus
+        pass
+
+
+class SharedObject:
+    """
+    A :class:`medsrtqc.core.Profile`, :class:`medsrtqc.core.Trace`, or
+    :class:`medsrtqc.batch.ProfileBatch` copied into a new shared memory
+    block. Pass :attr:`handle` to worker processes and use the object
+    as a context manager (or call :meth:`close`) to release the
+    shared memory when workers are finished.
+    """
+
+    def __init__(self, obj):
+        """
+        :param obj: A :class:`medsrtqc.core.Profile`, :class:`medsrtqc.core.Trace`,
+            or :class:`medsrtqc.batch.ProfileBatch`.
+        """
+
+        # store every attribute and mask so that workers can update them in place
+        header, buffers = serialize.to_buffers(obj, complete=True)
+        size = serialize.packed_size(header, buffers)
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self._finalizer = weakref.finalize(self, _release, self._shm, True)
+        try:
+            serialize.pack_into(self._shm.buf, header, buffers)
+        except Exception:
+            self._finalizer()
+            raise
+
+        self.handle = SharedHandle(self._shm.name, size, os.getpid())
+        self._value = None
+
+    @property
+    def value(self):
+        """
+        The shared object as seen by this process. For profiles this is a
+        :class:`SharedProfile` and for traces and batches the arrays are
+        backed by the shared memory.
+        """
+
+        if not self._finalizer.alive:
+            raise ValueError('SharedObject is closed')
+        if self._value is None:
+            self._value = _load(self._shm.buf, self.handle.size)
+        return self._value
+
+    def write_back(self, dest, status=None):
+        """
+        Copy the shared data to the object that was originally shared.
+        Only traces that a worker reported as modified in ``status`` are
+        assigned; without a ``status`` all traces are assigned.
+
+        :param dest: The :class:`medsrtqc.core.Profile` or ``list()`` of
+            :class:`medsrtqc.core.Profile` objects (for a shared
+            :class:`medsrtqc.batch.ProfileBatch`) to update.
+        :param status: A :class:`QCStatus` (or a ``list()`` of them)
+            returned by :func:`run_qc`.
+        """
+
+        statuses = [] if status is None else ([status] if isinstance(status, QCStatus) else list(status))
+        modified = set()
+        qc_tests = None
+        for item in statuses:
+            modified.update(item.modified)
+            if item.qc_tests is not None:
+                qc_tests = item.qc_tests
+
+        value = self.value
+        if isinstance(value, ProfileBatch):
+            if qc_tests is not None:
+                value.qc_tests[:] = qc_tests
+            value._modified.update(modified)
+            value.write_back(dest, modified_only=status is not None)
+        elif isinstance(value, Profile):
+            for k in value.keys():
+                if status is None or k in modified:
+                    dest[k] = value.copy(k)
+
+            if qc_tests is not None:
+                dest.qc_tests = qc_tests.copy()
+                if hasattr(dest, 'update_qcx'):
+                    dest.update_qcx()
+        else:
+            raise TypeError('Only shared Profile and ProfileBatch objects can be written back')
+
+    def close(self):
+        """Release the shared memory. Workers must not attach after this is called."""
+        self._value = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *execinfo):
+        self.close()
+
+
+@contextlib.contextmanager
+def attach(handle):
+    """
+    Attach to a :class:`SharedObject` from another process. Use as
+    a context manager; arrays of the yielded object are backed
+    by the shared memory and references to them should be deleted
+    before the ``with`` block ends so that it can be unmapped.
+
+    :param handle: The :attr:`SharedObject.handle`.
+    """
+
+    shm = _open(handle.name, handle.owner)
+    try:
+        yield _load(shm.buf, handle.size)
+    finally:
+        _release(shm, False)
+
+
+def run_qc(handle, tests):
+    """
+    Run QC tests on a :class:`SharedObject` from a worker process.
+    Flags are updated in the shared memory and only a :class:`QCStatus`
+    is returned so that it can be cheaply sent back to the owner.
+
+    :param handle: The :attr:`SharedObject.handle` of a shared
+        :class:`medsrtqc.core.Profile` or :class:`medsrtqc.batch.ProfileBatch`.
+    :param tests: A ``list()`` of :class:`medsrtqc.qc.operation.QCOperation`
+        objects to run. For a :class:`medsrtqc.batch.ProfileBatch` this may
+        be a ``list()`` with one ``list()`` of tests per profile.
+    """
+
+    context = _LogContext()
+    with attach(handle) as value:
+        try:
+            qc_tests, modified = _run_qc(value, tests, context)
+        except Exception as e:
+            # the traceback refers to shared arrays that would otherwise
+            # prevent the memory from being unmapped
+            traceback.clear_frames(e.__traceback__)
+            raise
+        finally:
+            del value
+
+    return QCStatus(qc_tests, context.logs, modified)
+
+
+def _run_qc(value, tests, context):
+    # kept separate from run_qc() so that no references to shared arrays
+    # (e.g., loop variables) outlive the attachment
+    if isinstance(value, ProfileBatch):
+        if tests and not isinstance(tests[0], (list, tuple)):
+            tests = [tests] * len(value)
+
+        for profile, profile_tests in zip(value, tests):
+            for test in profile_tests:
+                test.run(profile, context=context)
+
+        qc_tests = None if value.qc_tests is None else value.qc_tests.copy()
+    elif isinstance(value, Profile):
+        for test in tests:
+            test.run(value, context=context)
+
+        qc_tests = value.qc_tests.copy() if hasattr(value, 'qc_tests') else None
+    else:
+        raise TypeError('QC can only be run on a shared Profile or ProfileBatch')
+
+    return qc_tests, sorted(value._modified)
+
+
+class _LogContext(QCOperationContext):
+
+    def __init__(self):
+        self.logs = []
+
+    def log(self, profile, message):
+        self.logs.append(str(message))
+
+
+def _load(buf, size):
+    return serialize.loads(buf[:size], profile_type=SharedProfile)
+
+
+def _open(name, owner):
+    if sys.version_info >= (3, 13):  # pragma: no cover
+        # attaching processes should not track (and possibly unlink) a
+        # segment that they do not own
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    # Before Python 3.13 attaching registers the segment with this process's
+    # resource tracker, which would unlink it (and warn about a leak) when
+    # this process exits. The owner and workers that multiprocessing starts
+    # from it share the owner's tracker, where this is a no-op that must not
+    # be undone; every other process unregisters the segment.
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix' and not _shares_tracker(owner):
+        resource_tracker.unregister('/' + shm.name, 'shared_memory')
+    return shm
+
+
+def _shares_tracker(owner):
+    if owner is None:
+        return False
+    parent = multiprocessing.parent_process()
+    return owner == os.getpid() or (parent is not None and owner == parent.pid)
+
+
+def _release(shm, unlink):
+    try:
+        shm.close()
+    except BufferError:
+        # arrays still refer to the memory; it is unmapped when they are
+        # garbage collected
+        pass
+
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:  # pragma: no cover
+            pass
@@ -4,8 +4,6 @@ from typing import Iterable
 from copy import deepcopy
 
 import numpy as np
-from numpy.ma import MaskedArray
-from numpy.ma.core import zeros
 
 from medsrtqc.qc.history import QCx
 from medsrtqc.core import Trace, Profile
@@ -41,6 +39,15 @@ class VMSProfile(Profile):
         self.direction = self.get_surf_code(['PDR$', 'PARM_SURF.PDR$'])
         self.parking_pres = self.get_park_depth()
 
+        # MEDS longitudes are positive west but these are positive east
+        # (as in NetCDF files) or None if the position is missing
+        fxd = data['PR_STN']['FXD']
+        if abs(fxd['LATITUDE']) <= 90 and 0 <= fxd['LONGITUDE'] <= 360:
+            self.latitude = fxd['LATITUDE']
+            self.longitude = (180.0 - fxd['LONGITUDE']) % 360.0 - 180.0
+        else:
+            self.latitude = self.longitude = None
+
         if 'FLU1' in self.keys() and 'FLUA' not in self.keys():
             self.add_new_pr_profile('FLU1', 'FLUA')
 
@@ -94,23 +101,23 @@ class VMSProfile(Profile):
         else:
             meas = self._by_param[k]['_pr_profile_prof']
 
-        pres = MaskedArray(zeros(len(meas)))
-        value = MaskedArray(zeros(len(meas)))
-        qc = MaskedArray(zeros(len(meas)))
+        # build arrays with the Trace storage dtypes so that they
+        # are used as-is rather than copied again
+        pres = np.array([m['DEPTH_PRESS'] for m in meas], dtype=np.float32)
 
         if k == 'PRES':
-            for i, m in enumerate(meas):
-                pres[i] = m['DEPTH_PRESS']
-                value[i] = m['DEPTH_PRESS']
-                qc[i] = m['DP_FLAG']
+            value = pres.copy()
+            qc = np.array([m['DP_FLAG'] for m in meas], dtype='S1')
         else:
-            for i, m in enumerate(meas):
-                pres[i] = m['DEPTH_PRESS']
-                value[i] = m['PARM']
-                qc[i] = m['Q_PARM']
+            value = np.array([m['PARM'] for m in meas], dtype=np.float32)
+            qc = np.array([m['Q_PARM'] for m in meas], dtype='S1')
 
         return Trace(value, qc=qc, pres=pres)
 
+    def copy(self, k) -> Trace:
+        # __getitem__ already builds a new Trace on every call
+        return self[k]
+
     def __setitem__(self, k, v):
         # check dimensions against current
         current_value = self[k]
@@ -138,6 +145,9 @@ class VMSProfile(Profile):
         # to reduce the amount of copying.
         data_copy = deepcopy(self._data)
 
+        # convert the flags to bytes once rather than for every level
+        flags = np.ma.getdata(v.qc).astype('S1', copy=False).tolist()
+
         # PRES is special because it isn't stored explicitly
         # strategy is to check exact values and update the flag
         # for that
@@ -147,7 +157,7 @@ class VMSProfile(Profile):
                     pres_match = v.value == m['DEPTH_PRESS']
                     if not np.any(pres_match): # pragma: no cover
                         continue
-                    m['DP_FLAG'] = bytes(v.qc[pres_match][0])
+                    m['DP_FLAG'] = flags[np.argmax(pres_match)]
         else:
             # the data might be split into segments so we have to keep track of
             # the index within the trace separately
@@ -156,7 +166,7 @@ class VMSProfile(Profile):
                 if pr_profile['FXD']['PROF_TYPE'] == k:
                     for m in pr_profile['PROF']:
                         m['PARM'] = v.value[trace_i]
-                        m['Q_PARM'] = bytes(v.qc[trace_i])
+                        m['Q_PARM'] = flags[trace_i]
                         trace_i += 1
 
             # bookkeeping in case the check above didn't catch this
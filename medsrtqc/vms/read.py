@@ -2,6 +2,7 @@
 from .core_impl import VMSProfile
 from .profiles_enc import PrStnAndPrProfilesEncoding
 from .enc import ArrayOf, LineEnding
+from ..parameters import parameters
 
 def read_vms_profiles(src, ver='vms'):
     """
@@ -95,25 +96,9 @@ def write_vms_profiles(profiles, dest, ver='vms'):
         raise TypeError("Can't interpret `dest` as a file or file-like object")
     
 def check_vms(k):
-
-    vms_list = [
-        'VREF','PHPH','PHTO','CDO$','CDOM','FLU3','FLU1','B700','BBP$',
-        'C1PH','C2PH','DOXY','PPOX','OTMP'
-    ]
-
-    return k in vms_list
+    """``True`` if ``k`` is a VMS code in :data:`medsrtqc.parameters.parameters`"""
+    return k in parameters.by_vms
 
 def translate_vms(k):
-    keys = [
-        'PHPH','PHTO','CDO$','CDOM','FLU3','FLU1','B700','BBP$',
-        'C1PH','C2PH','DOXY','PPOX','OTMP'
-    ]
-    vals = [
-        'PH_IN_SITU_FREE', 'PH_IN_SITU_TOTAL', 'FLUORESCENCE_CDOM',
-        'CDOM', 'CHLA', 'FLUORESCENCE_CHLA', 'BETA_BACKSCATTERING', 'BBP700',
-        'C1PHASE_DOXY','C2PHASE_DOXY','DOXY','PPOX_DOXY','TEMP_DOXY'
-    ]
-
-    dc = {key:val for key, val in zip(keys, vals)}
-
-    return dc[k]
+    """The NetCDF variable name for VMS code ``k`` (raises ``KeyError`` if there is none)"""
+    return parameters.vms_to_nc[k]
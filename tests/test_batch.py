@@ -0,0 +1,119 @@
+
+import unittest
+import numpy as np
+
+from medsrtqc.core import Trace, Profile
+from medsrtqc.batch import ProfileBatch, BatchProfile
+from medsrtqc.resources import resource_path
+from medsrtqc.vms import read_vms_profiles
+from medsrtqc.qc.flag import Flag
+
+
+class TestProfileBatch(unittest.TestCase):
+
+    def test_from_profiles(self):
+        profiles = [
+            Profile({'TEMP': Trace([1, 2, 3], pres=[0, 1, 2])}),
+            Profile({'PSAL': Trace([4, 5])}),
+            Profile({'TEMP': Trace([6, 7], adjusted=[8, 9], pres=[0, 1])})
+        ]
+        batch = ProfileBatch.from_profiles(profiles)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch.keys(), ('TEMP', 'PSAL'))
+        self.assertTrue(np.all(batch.offsets('TEMP') == [0, 3, 3, 5]))
+        self.assertTrue(np.all(batch.lengths('PSAL') == [0, 2, 0]))
+        self.assertTrue(np.all(batch.profile_index('TEMP') == [0, 0, 0, 2, 2]))
+        self.assertTrue(np.all(batch.column('TEMP').value == [1, 2, 3, 6, 7]))
+        self.assertTrue(np.all(batch.column('TEMP').adjusted.mask == [True, True, True, False, False]))
+        # absent in every profile stays absent
+        self.assertIsNone(batch.column('TEMP')._adjusted_error)
+
+        self.assertEqual(batch[1].keys(), ('PSAL', ))
+        self.assertEqual(batch[-1].keys(), ('TEMP', ))
+        with self.assertRaises(IndexError):
+            batch[3]
+        with self.assertRaises(KeyError):
+            batch[1]['TEMP']
+
+        self.assertEqual([len(p.keys()) for p in batch], [1, 1, 1])
+
+    def test_views(self):
+        profiles = [
+            Profile({'TEMP': Trace([1, 2, 3], qc=[Flag.NO_QC] * 3)}),
+            Profile({'TEMP': Trace([4, 5], qc=[Flag.NO_QC] * 2)})
+        ]
+        batch = ProfileBatch.from_profiles(profiles)
+        view = batch[1]
+        self.assertIsInstance(view, BatchProfile)
+
+        temp = view['TEMP']
+        self.assertTrue(temp.readonly)
+        self.assertTrue(np.shares_memory(temp.value, batch.column('TEMP').value))
+
+        temp = view.copy('TEMP')
+        temp.qc[:] = Flag.BAD
+        temp.adjusted[:] = 0
+        view['TEMP'] = temp
+        self.assertTrue(np.all(batch.column('TEMP').qc == [Flag.NO_QC] * 3 + [Flag.BAD] * 2))
+        self.assertTrue(np.all(batch.column('TEMP').adjusted.mask == [True, True, True, False, False]))
+
+        with self.assertRaises(ValueError):
+            view['TEMP'] = Trace([1, 2, 3])
+        with self.assertRaises(KeyError):
+            view['PSAL'] = Trace([1, 2])
+
+        batch.write_back()
+        self.assertTrue(np.all(profiles[1]['TEMP'].qc == Flag.BAD))
+        self.assertTrue(np.all(profiles[0]['TEMP'].qc == Flag.NO_QC))
+
+    def test_column_write_back(self):
+        profiles = [
+            Profile({'TEMP': Trace([1, 2, 3], qc=[Flag.NO_QC] * 3)}),
+            Profile({'PSAL': Trace([4, 5], qc=[Flag.NO_QC] * 2)}),
+            Profile({'TEMP': Trace([6, 7], qc=[Flag.NO_QC] * 2)})
+        ]
+        batch = ProfileBatch.from_profiles(profiles)
+
+        # read-only columns don't mark profiles as modified
+        with self.assertRaises(ValueError):
+            batch.column('TEMP', readonly=True).qc[0] = Flag.BAD
+        batch.write_back()
+        self.assertEqual(batch._modified, set())
+
+        # in-place changes to a column are written back by default
+        Flag.update_safely(batch.column('TEMP').qc, Flag.BAD, where=[False, True, False, False, True])
+        batch.write_back()
+        self.assertTrue(np.all(profiles[0]['TEMP'].qc == [Flag.NO_QC, Flag.BAD, Flag.NO_QC]))
+        self.assertTrue(np.all(profiles[2]['TEMP'].qc == [Flag.NO_QC, Flag.BAD]))
+        self.assertTrue(np.all(profiles[1]['PSAL'].qc == Flag.NO_QC))
+
+    def test_vms(self):
+        profiles = read_vms_profiles(resource_path('BINARY_VMS.DAT'))
+        for p in profiles:
+            p.prepare(tests=[None])
+
+        batch = ProfileBatch.from_profiles(profiles)
+        for p, view in zip(profiles, batch):
+            self.assertEqual(view.wmo, p.wmo)
+            self.assertEqual(view.cycle_number, p.cycle_number)
+            for k in p.keys():
+                self.assertTrue(np.all(view[k].value == p[k].value))
+                self.assertTrue(np.all(view[k].qc == p[k].qc))
+
+        # qc_tests is a view into the batch
+        batch[1].qc_tests[0, 5] = 1
+        self.assertEqual(batch.qc_tests[1, 0, 5], 1)
+
+        temp = batch[1].copy('TEMP')
+        temp.qc[:] = Flag.BAD
+        batch[1]['TEMP'] = temp
+        batch.write_back()
+        self.assertTrue(np.all(profiles[1]['TEMP'].qc == Flag.BAD))
+        self.assertEqual(profiles[1].qc_tests[0, 5], 1)
+
+        with self.assertRaises(ValueError):
+            batch.write_back(profiles[:1])
+
+
+if __name__ == '__main__':
+    unittest.main()
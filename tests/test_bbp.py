@@ -3,6 +3,7 @@ import unittest
 import numpy as np
 
 from medsrtqc.betasw import betasw
+from medsrtqc.core import Profile, Trace
 from medsrtqc.resources import resource_path
 from medsrtqc.nc import read_nc_profile
 from medsrtqc.qc.bbp import bbpTest
@@ -16,6 +17,10 @@ class TestContext(QCOperationContext):
     def log(self, *args, **kwargs):
         pass
 
+class QCxProfile(Profile):
+    def update_qcx(self):
+        pass
+
 class TestBbpTest(unittest.TestCase):
 
     def test_basic(self):
@@ -35,6 +40,34 @@ class TestBbpTest(unittest.TestCase):
         nc.prepare(tests=[test])
         test.run(nc)
 
+    def test_parking_hook(self):
+        def profile(pres):
+            value = np.full(len(pres), 1e-4)
+            value[-3:] = 1e-3
+            prof = QCxProfile({'BBP$': Trace(value, pres=pres, qc=np.repeat(Flag.NO_QC, len(pres)))})
+            prof.direction = 'A'
+            prof.parking_pres = 1000
+            prof.qc_tests = np.zeros((2, 32), dtype=int)
+            return prof
+
+        pres = np.arange(0, 1001, 5, dtype=float)
+        prof = profile(pres)
+        bbpTest().run(prof, context=TestContext())
+        self.assertTrue(np.all(prof['BBP$'].qc[-3:] == Flag.BAD))
+
+        # the test is skipped if any pressure is missing or out of range
+        for missing in (np.nan, 7000):
+            pres_missing = pres.copy()
+            pres_missing[10] = missing
+            prof = profile(pres_missing)
+            bbpTest().run(prof, context=TestContext())
+            self.assertFalse(np.any(prof['BBP$'].qc == Flag.BAD))
+
+        # ...including when there are fewer than two valid pressures
+        pres_missing = np.full(10, np.nan)
+        pres_missing[-1] = 500
+        bbpTest().run(profile(pres_missing), context=TestContext())
+
     def test_betasw(self):
 
         ncp = read_nc_profile(
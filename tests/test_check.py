@@ -1,10 +1,11 @@
 
 import unittest
 
-from medsrtqc.core import Profile
+from medsrtqc.core import Profile, Trace
 from medsrtqc.resources import resource_path
 from medsrtqc.vms import read_vms_profiles
 from medsrtqc.qc.check import preTestCheck
+from medsrtqc.qc.bbp import bbpTest
 from medsrtqc.qc.operation import QCOperationContext
 
 # quiet context for testing
@@ -23,5 +24,10 @@ class TestPreCheckTest(unittest.TestCase):
         tests = check.run(p, context=TestContext())
         self.assertTrue(len(tests) > 0)
 
+    def test_nc_keys(self):
+        p = Profile({'PH_IN_SITU_TOTAL': Trace([8.0, 8.1]), 'BBP700': Trace([0.001, 0.002])})
+        tests = preTestCheck().run(p, context=TestContext())
+        self.assertEqual([type(test) for test in tests], [bbpTest])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,120 @@
+
+import unittest
+import os
+import tempfile
+import numpy as np
+from netCDF4 import Dataset, stringtochar
+from medsrtqc.convert import nc_to_vms, vms_to_nc, profile_to_vms, MAX_SEGMENT_LENGTH
+from medsrtqc.vms import read_vms_profiles
+from medsrtqc.nc import iter_nc_profiles, read_nc_profile
+from medsrtqc.resources import resource_path
+
+
+class TestConvert(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_vms_round_trip(self):
+        src = [resource_path('bgc_vms.dat'), resource_path('OUTPUT_RT.DAT')]
+        self.assertEqual(vms_to_nc(src, self.path('profiles.nc')), [self.path('profiles.nc')])
+
+        # profiles are written along N_PROF with one N_PROF per set of levels
+        with Dataset(self.path('profiles.nc')) as dataset:
+            self.assertFalse(dataset.groups)
+            profiles = list(iter_nc_profiles(dataset, by_cycle=True))
+            self.assertEqual(len(profiles), 6)
+            self.assertEqual(len(dataset.dimensions['N_PROF']), 4 * 4 + 2 * 1)
+            self.assertIn('BBP700', profiles[0].keys())
+            self.assertEqual(profiles[0]._variables['TEMP'][1], 0)
+            self.assertEqual(profiles[1]._variables['TEMP'][1], 4)
+            self.assertEqual(len(list(iter_nc_profiles(dataset))), 4 * 4 + 2 * 1)
+
+        nc_to_vms([self.path('profiles.nc')], self.path('profiles.dat'))
+        original = read_vms_profiles(src[0]) + read_vms_profiles(src[1])
+        converted = read_vms_profiles(self.path('profiles.dat'))
+        self.assertEqual(len(converted), len(original))
+
+        for a, b in zip(original, converted):
+            # only parameters with a NetCDF name are exported
+            self.assertNotIn('PAR$', b.keys())
+            for k in b.keys():
+                self.assertTrue(np.all(a[k].value == b[k].value))
+                self.assertTrue(np.all(a[k].pres == b[k].pres))
+                self.assertTrue(np.all(a[k].qc == b[k].qc))
+
+            self.assertEqual(a.get_surface('PFN$'), b.get_surface('PFN$'))
+            self.assertEqual(a.get_surf_code('QCP$'), b.get_surf_code('QCP$'))
+            self.assertEqual(a.get_surf_code('QCF$'), b.get_surf_code('QCF$'))
+            self.assertAlmostEqual(a._data['PR_STN']['FXD']['LONGITUDE'], b._data['PR_STN']['FXD']['LONGITUDE'], places=4)
+
+    def test_nc_to_vms(self):
+        core = resource_path('R6904117_085.nc')
+        bgc = resource_path('BD6903197_026.nc')
+        paths = nc_to_vms([bgc, (core, bgc)], self.path('profiles_{}.dat'), max_profiles=1)
+        self.assertEqual(paths, [self.path('profiles_0.dat'), self.path('profiles_1.dat')])
+
+        bgc_only = read_vms_profiles(paths[0])
+        self.assertEqual(len(bgc_only), 1)
+        self.assertNotIn('TEMP', bgc_only[0].keys())
+
+        profile = read_vms_profiles(paths[1])[0]
+        profile.prepare()
+        self.assertEqual(profile.wmo, 6904117)
+        self.assertEqual(profile.cycle_number, 85)
+        self.assertIn('BBP$', profile.keys())
+
+        # every level with a valid pressure and value is converted
+        with Dataset(core) as dataset:
+            pres = dataset['PRES'][0]
+            temp = dataset['TEMP'][0]
+        valid = ~pres.mask & ~temp.mask
+        self.assertTrue(np.all(profile['TEMP'].value == temp[valid]))
+        self.assertTrue(np.all(profile['PRES'].value == pres[valid]))
+
+        # the same as converting a single profile
+        nc = read_nc_profile(core, bgc)
+        self.assertTrue(np.all(profile_to_vms(nc)['BBP$'].value == profile['BBP$'].value))
+
+        paths = nc_to_vms([(core, bgc)], self.path('profiles_win.dat'), ver='win')
+        profile_win = read_vms_profiles(paths[0], ver='win')[0]
+        self.assertTrue(np.all(profile_win['TEMP'].value == profile['TEMP'].value))
+
+        with self.assertRaises(ValueError):
+            nc_to_vms([bgc], self.path('profiles.dat'), max_profiles=1)
+
+    def test_segments(self):
+        n = 2 * MAX_SEGMENT_LENGTH + 200
+        with Dataset(self.path('long.nc'), 'w') as dataset:
+            dataset.createDimension('N_PROF', 1)
+            dataset.createDimension('N_LEVELS', n)
+            dataset.createDimension('N_PARAM', 2)
+            dataset.createDimension('N_CALIB', 1)
+            dataset.createDimension('STRING8', 8)
+            dataset.createDimension('STRING64', 64)
+            dataset.createVariable('PLATFORM_NUMBER', 'S1', ('N_PROF', 'STRING8'))[:] = stringtochar(np.array(['4902552'], dtype='S8'))
+            dataset.createVariable('CYCLE_NUMBER', 'i4', ('N_PROF', ))[:] = 12
+            dataset.createVariable('DIRECTION', 'S1', ('N_PROF', ))[:] = np.array([b'A'])
+            parameter = np.array([[['PRES', 'TEMP']]], dtype='S64')
+            dataset.createVariable('PARAMETER', 'S1', ('N_PROF', 'N_CALIB', 'N_PARAM', 'STRING64'))[:] = stringtochar(parameter)
+            dataset.createVariable('PRES', 'f4', ('N_PROF', 'N_LEVELS'))[:] = np.arange(n, dtype=np.float32)[None, :]
+            dataset.createVariable('TEMP', 'f4', ('N_PROF', 'N_LEVELS'))[:] = np.linspace(20, 2, n, dtype=np.float32)[None, :]
+
+        nc_to_vms([self.path('long.nc')], self.path('long.dat'))
+        profile = read_vms_profiles(self.path('long.dat'))[0]
+        segments = [item['FXD'] for item in profile._data['PR_PROFILE']]
+        self.assertEqual([item['NO_DEPTHS'] for item in segments], [MAX_SEGMENT_LENGTH, MAX_SEGMENT_LENGTH, 200])
+        self.assertEqual([item['PROFILE_SEG'] for item in segments], ['01', '02', '03'])
+        self.assertEqual(profile._data['PR_STN']['PROF'][0]['NO_SEG'], 3)
+        self.assertEqual(len(profile['TEMP']), n)
+        self.assertTrue(np.all(profile['TEMP'].pres == np.arange(n)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 
 import unittest
 import numpy as np
-from medsrtqc.core import Trace, Profile
+from medsrtqc.core import Trace, Profile, align
 
 
 class TestCore(unittest.TestCase):
@@ -12,11 +12,154 @@ class TestCore(unittest.TestCase):
         with self.assertRaises(ValueError):
             Trace([1, 2, 3], [1, 2, 3, 4])
 
+    def test_trace_no_copy(self):
+        value = np.array([1, 2, 3], dtype=np.float32)
+        qc = np.array([b'1', b'2', b'3'], dtype='S1')
+        trace = Trace(value, qc=qc)
+        self.assertTrue(np.shares_memory(trace.value, value))
+        self.assertTrue(np.shares_memory(trace.qc, qc))
+
+        # other dtypes are converted
+        trace = Trace([1, 2, 3], qc=[1, 2, 3])
+        self.assertEqual(trace.value.dtype, np.float32)
+        self.assertTrue(np.all(trace.qc == np.array([b'1', b'2', b'3'])))
+
+    def test_trace_absent(self):
+        trace = Trace([1, 2, 3])
+        self.assertEqual(trace.adjusted.shape, (3, ))
+        self.assertTrue(np.all(trace.adjusted.mask))
+        self.assertIsNone(trace._adjusted)
+        with self.assertRaises(AttributeError):
+            trace.some_other_attr = None
+
+        # writes materialize the attribute
+        trace.adjusted[1] = 5
+        self.assertIsNotNone(trace._adjusted)
+        self.assertEqual(trace.adjusted[1], 5)
+        self.assertTrue(np.all(trace.adjusted.mask == [True, False, True]))
+
+        trace.adjusted_qc.mask = False
+        self.assertFalse(np.any(trace.adjusted_qc.mask))
+
+        # the placeholder of another Trace is still absent
+        other = Trace([4, 5, 6], adjusted=Trace([1, 2, 3]).adjusted)
+        self.assertIsNone(other._adjusted)
+
+        # assigning attributes checks length
+        trace.pres = [0, 1, 2]
+        self.assertEqual(trace.pres.dtype, np.float32)
+        with self.assertRaises(ValueError):
+            trace.pres = [0, 1]
+
+    def test_trace_plain(self):
+        value = np.ma.array([1, 2, 3], mask=[False, True, False])
+        trace = Trace(value, qc=[b'1', b'2', b'3'], storage='plain')
+        self.assertEqual(trace.storage, 'plain')
+        self.assertNotIsInstance(trace.value, np.ma.MaskedArray)
+        self.assertTrue(np.isnan(trace.value[1]))
+        self.assertTrue(np.all(np.isnan(trace.adjusted)))
+        self.assertTrue(np.all(trace.adjusted_qc == b''))
+
+        masked = trace.masked('value')
+        self.assertIsInstance(masked, np.ma.MaskedArray)
+        self.assertTrue(np.all(masked.mask == [False, True, False]))
+        self.assertTrue(np.shares_memory(masked, trace.value))
+        self.assertTrue(np.all(trace.masked('adjusted').mask))
+
+        trace.adjusted[0] = 4
+        self.assertEqual(trace.adjusted[0], 4)
+        self.assertTrue(np.all(trace.masked('adjusted').mask == [False, True, True]))
+
+        roundtrip = trace.with_storage('masked')
+        self.assertEqual(roundtrip.storage, 'masked')
+        self.assertTrue(np.all(roundtrip.value.mask == value.mask))
+        self.assertTrue(np.all(roundtrip.qc == trace.qc))
+        self.assertTrue(np.all(roundtrip.adjusted_error.mask))
+        self.assertIs(roundtrip.with_storage('masked'), roundtrip)
+
+        with self.assertRaises(ValueError):
+            Trace([1, 2, 3], storage='not a storage mode')
+
     def test_trace_repr(self):
         self.assertRegex(repr(Trace([])), r'^Trace\(\s*value=\[\]')
         self.assertRegex(repr(Trace([1, 2, 3])), r'^Trace\(')
         self.assertRegex(repr(Trace([1, 2, 3, 4, 5, 6, 7])), r'\[1 values\]')
 
+    def test_align(self):
+        source = Trace([10, 8, 4], qc=[b'1', b'4', b'2'], pres=[20, 0, 10])
+        target = Trace([1, 2, 3, 4, 5], pres=[4, 18, np.nan, 25, 0])
+
+        nearest = align(target, source)
+        self.assertTrue(np.all(nearest.index == [1, 0, -1, 0, 1]))
+        flags = nearest.take(source.qc)
+        self.assertTrue(np.all(flags.mask == [False, False, True, False, False]))
+        self.assertEqual(flags[0], b'4')
+
+        exact = align(target, source, method='exact')
+        self.assertTrue(np.all(exact.index == [-1, -1, -1, -1, 1]))
+
+        linear = align(target, source, method='linear')
+        self.assertTrue(np.all(linear.matched == [True, True, False, False, True]))
+        values = linear.interp(source.value)
+        self.assertTrue(np.allclose(values.compressed(), [6.4, 8.8, 8.0]))
+        with self.assertRaises(ValueError):
+            nearest.interp(source.value)
+
+        # ties go to the shallower level
+        self.assertEqual(align(Trace([1], pres=[5]), source).index[0], 1)
+
+        # nothing to match
+        self.assertTrue(np.all(align(target, Trace([1, 2])).index == -1))
+        self.assertTrue(np.all(align(target, Trace([1, 2]), method='linear').index == -1))
+        with self.assertRaises(ValueError):
+            align(target, source, method='not a method')
+
+    def test_window(self):
+        trace = Trace([1, 2, 3, 4], pres=[0, 10, 20, 30])
+        self.assertEqual(trace.window(10, 30), slice(2, 3))
+        self.assertEqual(trace.window(10, 30, inclusive=True), slice(1, 4))
+        self.assertEqual(trace.window(pmin=5), slice(1, 4))
+        self.assertEqual(trace.window(pmax=5), slice(0, 1))
+        self.assertEqual(trace.window(), slice(0, 4))
+        self.assertEqual(trace.window(40, 0), slice(4, 4))
+        self.assertEqual(trace.pres_range(), (0, 30))
+
+        # unsorted and missing pressures give indices
+        trace = Trace([1, 2, 3, 4, 5], pres=np.ma.array([30, 0, 20, 10, 5], mask=[0, 0, 0, 0, 1]))
+        self.assertTrue(np.all(trace.window(5, 25) == [2, 3]))
+        self.assertTrue(np.all(trace.window() == [0, 1, 2, 3]))
+        self.assertTrue(np.all(trace.value[trace.window(pmin=15)] == [1, 3]))
+        self.assertEqual(trace.pres_range(), (0, 30))
+
+        self.assertTrue(np.all(np.isnan(Trace([1, 2]).pres_range())))
+        self.assertEqual(len(Trace([1, 2]).window(0, 10)), 0)
+
+    def test_pres_index_cache(self):
+        trace = Trace([1, 2, 3], pres=[2, 0, 1])
+        self.assertTrue(np.all(trace._get_pres_index().order == [1, 2, 0]))
+        self.assertIs(trace._get_pres_index(), trace._get_pres_index())
+        self.assertIs(trace.readonly_view()._get_pres_index(), trace._get_pres_index())
+
+        # assigning pres resets the index
+        trace.pres = [0, 1, 2]
+        self.assertTrue(np.all(trace._get_pres_index().order == [0, 1, 2]))
+
+        # ...and so does modifying it in place
+        view = trace.readonly_view()
+        self.assertEqual(trace.window(0.5, 2.5), slice(1, 3))
+        trace.pres[:] = [20, 10, 0]
+        self.assertTrue(np.all(trace.window(5, 25) == [0, 1]))
+        self.assertTrue(np.all(view.window(5, 25) == [0, 1]))
+        self.assertEqual(trace.pres_range(), (0, 20))
+        trace.pres[2] = np.ma.masked
+        self.assertEqual(trace.pres_range(), (10, 20))
+
+        # including a pres that was absent when the index was created
+        trace = Trace([1, 2])
+        self.assertEqual(len(trace.window()), 0)
+        trace.pres[:] = [5, 6]
+        self.assertEqual(trace.window(), slice(0, 2))
+
     def test_profile(self):
         trace = Trace([1, 2, 3])
         profile = Profile({'some_param': trace}, {'some_meta': 'some_value'})
@@ -34,6 +177,33 @@ class TestCore(unittest.TestCase):
         profile.set_meta('other meta', 'other value')
         self.assertEqual(profile.meta('other meta'), 'other value')
 
+    def test_profile_views(self):
+        value = np.ma.array([1, 2, 3], mask=[False, False, True])
+        trace = Trace(value, qc=[b'0', b'0', b'0'])
+        profile = Profile({'some_param': trace})
+
+        view = profile['some_param']
+        self.assertTrue(view.readonly)
+        self.assertTrue(np.shares_memory(view.value, trace.value))
+        with self.assertRaises(ValueError):
+            view.qc[:] = b'4'
+        with self.assertRaises(ValueError):
+            view.value.mask = False
+        with self.assertRaises(ValueError):
+            view.adjusted[0] = 1
+        for key, item in profile.items():
+            self.assertTrue(item.readonly)
+
+        copy = profile.copy('some_param')
+        self.assertFalse(copy.readonly)
+        self.assertFalse(np.shares_memory(copy.value, trace.value))
+        copy.qc[:] = b'4'
+        copy.adjusted[0] = 1
+        self.assertTrue(np.all(profile['some_param'].qc == b'0'))
+        profile['some_param'] = copy
+        self.assertTrue(np.all(profile['some_param'].qc == b'4'))
+        self.assertEqual(profile['some_param'].adjusted[0], 1)
+
     def test_abstract_profile(self):
         profile = Profile()
         with self.assertRaises(NotImplementedError):
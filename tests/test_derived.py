@@ -0,0 +1,153 @@
+
+import unittest
+import numpy as np
+import gsw
+from medsrtqc.core import Profile, Trace
+from medsrtqc.derived import derived, derived_names, register, _registry, \
+    ctd_batch, mixed_layer_depth_batch, derived_table
+from medsrtqc.batch import ProfileBatch
+from medsrtqc.vms import read_vms_profiles
+from medsrtqc.resources import resource_path
+
+
+class TestDerived(unittest.TestCase):
+
+    def profile(self):
+        pres = np.array([0, 5, 10, 20, 30, 40, 50], dtype=np.float32)
+        return Profile({
+            'PRES': Trace(pres, pres=pres),
+            'TEMP': Trace([20, 20, 20, 19, 15, 10, 8], pres=pres),
+            'PSAL': Trace([35, 35, 35, 35, 35.1, 35.2, 35.3], pres=pres)
+        })
+
+    def test_mixed_layer_depth(self):
+        profile = self.profile()
+        pres, temp, psal = profile['PRES'].value, profile['TEMP'].value, profile['PSAL'].value
+        abs_salinity = gsw.SA_from_SP(psal, pres, 0, 0)
+        density = gsw.sigma0(abs_salinity, gsw.CT_from_t(abs_salinity, temp, pres))
+        self.assertTrue(np.all(profile.derived('sigma0') == density))
+        self.assertEqual(profile.derived('mixed_layer_depth'), 20)
+        self.assertEqual(profile.derived('max_pres'), 50)
+
+        # arrays are shared so they can't be modified
+        with self.assertRaises(ValueError):
+            profile.derived('sigma0')[0] = 0
+
+        profile['TEMP'] = Trace(np.full(7, 20), pres=pres)
+        profile['PSAL'] = Trace(np.full(7, 35), pres=pres)
+        with self.assertRaises(ValueError):
+            profile.derived('mixed_layer_depth')
+
+        profile['TEMP'] = Trace([20, 20, 20, 20, 20, 10, 8], pres=pres)
+        self.assertEqual(profile.derived('mixed_layer_depth'), 40)
+
+        profile['PSAL'] = Trace(psal[:6], pres=pres[:6])
+        with self.assertRaises(ValueError):
+            profile.derived('sigma0')
+
+    def test_cache(self):
+        calls = []
+
+        @register('test_mean_temp', inputs=('TEMP', ))
+        def mean_temp(profile):
+            calls.append(profile)
+            return np.mean(profile['TEMP'].value)
+
+        self.addCleanup(_registry.pop, 'test_mean_temp')
+        self.assertIn('test_mean_temp', derived_names())
+        profile = self.profile()
+        self.assertEqual(profile.version('TEMP'), 0)
+        self.assertEqual(derived(profile, 'test_mean_temp'), profile.derived('test_mean_temp'))
+        self.assertEqual(len(calls), 1)
+
+        # assigning another trace doesn't invalidate the value
+        profile['PSAL'] = profile['PSAL']
+        profile.derived('test_mean_temp')
+        self.assertEqual(len(calls), 1)
+
+        temp = profile.copy('TEMP')
+        temp.value[:] = 1
+        profile['TEMP'] = temp
+        self.assertEqual(profile.version('TEMP'), 1)
+        self.assertEqual(profile.derived('test_mean_temp'), 1)
+        self.assertEqual(len(calls), 2)
+
+        with self.assertRaises(KeyError):
+            profile.derived('not a derived quantity')
+
+    def test_subclass_versions(self):
+        profile = read_vms_profiles(resource_path('bgc_vms.dat'))[0]
+        sigma0 = profile.derived('sigma0')
+        self.assertIs(profile.derived('sigma0'), sigma0)
+
+        # VMSProfile.__setitem__ also counts versions
+        profile['TEMP'] = profile['TEMP']
+        self.assertEqual(profile.version('TEMP'), 1)
+        self.assertIsNot(profile.derived('sigma0'), sigma0)
+        self.assertTrue(np.all(profile.derived('sigma0') == sigma0))
+
+    def test_batch(self):
+        profiles = read_vms_profiles(resource_path('OUTPUT_RT.DAT')) + read_vms_profiles(resource_path('bgc_vms.dat'))
+        for profile in profiles:
+            profile.prepare()
+        self.assertIsNone(profiles[0].latitude)
+        self.assertAlmostEqual(profiles[1].longitude, -127.72, places=2)
+
+        batch = ProfileBatch.from_profiles(profiles)
+        table = derived_table(batch, longitude=0, latitude=0)
+        self.assertEqual(list(table['wmo']), [profile.wmo for profile in profiles])
+        for i, profile in enumerate(profiles):
+            self.assertEqual(table['max_pres'][i], profile.derived('max_pres'))
+            try:
+                self.assertEqual(table['mixed_layer_depth'][i], profile.derived('mixed_layer_depth'))
+            except ValueError:
+                self.assertTrue(np.isnan(table['mixed_layer_depth'][i]))
+
+        # each profile's own position is used by default
+        table = derived_table(batch)
+        self.assertTrue(np.isnan(table['latitude'][0]))
+        profile = profiles[1]
+        pres, temp, psal = profile['PRES'].value, profile['TEMP'].value, profile['PSAL'].value
+        abs_salinity = gsw.SA_from_SP(psal, pres, profile.longitude, profile.latitude)
+        density = gsw.sigma0(abs_salinity, gsw.CT_from_t(abs_salinity, temp, pres))
+        mld = mixed_layer_depth_batch(pres, density, [0, len(pres)])
+        self.assertEqual(table['mixed_layer_depth'][1], mld[0])
+
+        # profiles that aren't aligned are NaN
+        pres = np.array([0, 5, 10, 20, 30, 40, 50], dtype=np.float32)
+        misaligned = self.profile()
+        misaligned['PSAL'] = Trace([35, 35, 35, 35, 35.1, 35.2, 35.3], pres=pres + 1)
+        empty = Profile({k: Trace(np.zeros(0), pres=np.zeros(0)) for k in ('PRES', 'TEMP', 'PSAL')})
+        table = derived_table(ProfileBatch.from_profiles([self.profile(), misaligned, empty]))
+        self.assertTrue(np.all(table['max_pres'][:2] == 50))
+        self.assertEqual(table['mixed_layer_depth'][0], 20)
+        self.assertTrue(np.all(np.isnan(table['mixed_layer_depth'][1:])))
+        self.assertTrue(np.isnan(table['max_pres'][2]))
+
+        with self.assertRaises(ValueError):
+            derived_table(ProfileBatch.from_profiles([Profile({'PRES': Trace([1, 2])})]))
+
+    def test_ctd_batch(self):
+        profile = self.profile()
+        pres, temp, psal = profile['PRES'].value, profile['TEMP'].value, profile['PSAL'].value
+        result = ctd_batch(np.tile(pres, 2), np.tile(temp, 2), np.tile(psal, 2), [0, 7, 14],
+                           longitude=[0, -60], latitude=[0, 45])
+        self.assertTrue(np.all(result['sigma0'][:7] == profile.derived('sigma0')))
+        abs_salinity = gsw.SA_from_SP(psal, pres, -60, 45)
+        self.assertTrue(np.all(result['absolute_salinity'][7:] == abs_salinity))
+
+        # the first level of each profile doesn't start a mixed layer
+        mld = mixed_layer_depth_batch([0, 20, 30, 20, 30], [1, 1, 1, 2, 2], [0, 3, 5])
+        self.assertTrue(np.all(np.isnan(mld)))
+        mld = mixed_layer_depth_batch([0, 20, 30, 20, 30], [1, 1, 2, 2, 2], [0, 3, 3, 5])
+        self.assertEqual(mld[0], 30)
+        self.assertTrue(np.all(np.isnan(mld[1:])))
+
+        with self.assertRaises(ValueError):
+            ctd_batch(pres, temp, psal, [0, 8])
+        with self.assertRaises(ValueError):
+            mixed_layer_depth_batch(pres, psal[:6], [0, 7])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+
+import unittest
+import os
+import gzip
+import tempfile
+import numpy as np
+from medsrtqc.gdac import ProfileIndex, read_index, load_index
+
+
+_BIO_INDEX = b"""# Title : Bio-Profile directory file of the Argo Global Data Assembly Center
+# Date of update : 20240101000000
+file,date,latitude,longitude,ocean,profiler_type,institution,parameters,parameter_data_mode,date_update
+meds/4902480/profiles/BR4902480_001.nc,20200101120000,45.5,-60.1,A,846,ME,PRES TEMP PSAL DOXY BBP700,RRRRR,20200102000000
+meds/4902480/profiles/BD4902480_002D.nc,20200111120000,46.0,-59.0,A,846,ME,PRES TEMP PSAL DOXY,RRRR,20200112000000
+coriolis/6903197/profiles/BR6903197_026.nc,,,,,,IF,PRES CHLA,RR,
+aoml/5906000/profiles/BR5906000_110.nc,20230501000000,-10.0,179.5,P,849,AO,PRES TEMP PSAL CHLA BBP700,RRRAA,20230502000000
+"""
+
+_CORE_INDEX = b"""# Title : Profile directory file of the Argo Global Data Assembly Center
+file,date,latitude,longitude,ocean,profiler_type,institution,date_update
+aoml/13857/profiles/R13857_001.nc,19970729200300,0.267,-16.032,A,845,AO,20181011180520
+"""
+
+
+class TestGDAC(unittest.TestCase):
+
+    def test_read_index(self):
+        index = read_index(_BIO_INDEX)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.header[1], '# Date of update : 20240101000000')
+        self.assertEqual(index.parameters, ('BBP700', 'CHLA', 'DOXY', 'PRES', 'PSAL', 'TEMP'))
+        self.assertEqual(index['date'][0], np.datetime64('2020-01-01T12:00:00'))
+        self.assertTrue(np.isnat(index['date'][2]))
+        self.assertTrue(np.isnan(index['latitude'][2]))
+        self.assertEqual(list(index['wmo']), [4902480, 4902480, 6903197, 5906000])
+        self.assertEqual(list(index['cycle_number']), [1, 2, 26, 110])
+        self.assertEqual(list(index['profiler_type']), [846, 846, -1, 849])
+        self.assertEqual(index.row_parameters(1), ('DOXY', 'PRES', 'PSAL', 'TEMP'))
+
+        core = read_index(_CORE_INDEX)
+        self.assertEqual(list(core['wmo']), [13857])
+        self.assertEqual(core.parameters, ())
+        self.assertNotIn('parameters', core.columns)
+        self.assertFalse(np.any(core.has_parameter('BBP700')))
+
+        empty = read_index(_CORE_INDEX.splitlines(True)[0] + _CORE_INDEX.splitlines(True)[1])
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(empty['date'].dtype, np.dtype('datetime64[s]'))
+
+        with self.assertRaises(TypeError):
+            read_index(None)
+
+    def test_query(self):
+        index = read_index(_BIO_INDEX)
+        self.assertEqual(list(index.mask(parameters='BBP700')), [True, False, False, True])
+        self.assertEqual(list(index.mask(parameters=['BBP700', 'CHLA'])), [False, False, False, True])
+        self.assertFalse(np.any(index.mask(parameters='NITRATE')))
+        self.assertEqual(list(index.mask(wmo=4902480, date_min='2020-01-05')), [False, True, False, False])
+        self.assertEqual(list(index.mask(date_max='2020-01-05')), [True, False, False, False])
+        self.assertEqual(list(index.mask(ocean='P')), [False, False, False, True])
+        self.assertEqual(list(index.mask(institution=['ME', 'IF'])), [True, True, True, False])
+        self.assertEqual(list(index.mask(cycle_number=[26, 110])), [False, False, True, True])
+        self.assertEqual(list(index.mask(bbox=(-61, 45, -59.5, 47))), [True, False, False, False])
+
+        # crossing the antimeridian
+        self.assertEqual(list(index.mask(bbox=(170, -20, -170, 0))), [False, False, False, True])
+
+        selected = index.query(institution='ME', parameters='DOXY')
+        self.assertIsInstance(selected, ProfileIndex)
+        self.assertEqual(selected.files(), [
+            'meds/4902480/profiles/BR4902480_001.nc',
+            'meds/4902480/profiles/BD4902480_002D.nc'
+        ])
+        self.assertEqual(
+            selected.urls('https://some.server/dac')[0],
+            'https://some.server/dac/meds/4902480/profiles/BR4902480_001.nc'
+        )
+        self.assertEqual(selected.row_parameters(0), index.row_parameters(0))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            gz = os.path.join(tmp, 'argo_bio-profile_index.txt.gz')
+            with open(gz, 'wb') as f:
+                f.write(gzip.compress(_BIO_INDEX))
+            index = read_index(gz)
+
+            index.save(os.path.join(tmp, 'index'))
+            loaded = load_index(os.path.join(tmp, 'index'))
+            self.assertIsInstance(loaded['latitude'], np.memmap)
+            self.assertEqual(loaded.columns, index.columns)
+            self.assertEqual(loaded.parameters, index.parameters)
+            self.assertEqual(loaded.header, index.header)
+            for name in index.columns:
+                self.assertEqual(loaded[name].tobytes(), index[name].tobytes())
+            self.assertEqual(len(loaded.query(parameters='BBP700')), 2)
+
+            in_memory = load_index(os.path.join(tmp, 'index'), mmap=False)
+            self.assertNotIsInstance(in_memory['latitude'], np.memmap)
+            del loaded
+
+    def test_bad_index(self):
+        with self.assertRaises(ValueError):
+            ProfileIndex({'file': np.array([b'a']), 'wmo': np.array([1, 2])})
+        with self.assertRaises(ValueError):
+            read_index(b'# only comments\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
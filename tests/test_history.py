@@ -1,5 +1,6 @@
 
 import unittest
+import numpy as np
 import medsrtqc.qc.history as hist
 
 class TestHistory(unittest.TestCase):
@@ -25,5 +26,55 @@ class TestHistory(unittest.TestCase):
         self.assertEqual(qcpf[0, hist.test_index(4)], 0)
         self.assertEqual(qcpf[1, hist.test_index(4)], 1)
 
+    def test_bitmask(self):
+        hexval = hex(2**63 + 2**4)
+        self.assertEqual(hist.hex_to_bitmask(hexval), 2**63 + 2**4)
+        self.assertEqual(hist.hex_to_bitmask('  000DFFCE'), 0xDFFCE)
+        self.assertEqual(hist.hex_to_bitmask(''), 0)
+        self.assertEqual(hist.bitmask_to_hex(2**63 + 2**4), hexval)
+        self.assertEqual(hist.bitmask_to_hex(0), '0x0')
+        self.assertEqual(hist.bitmask_to_hex(0xDFFCE, width=16), '00000000000DFFCE')
+
+        with self.assertRaises(ValueError):
+            hist.hex_to_bitmask(hex(2**30))
+        with self.assertRaises(ValueError):
+            hist.hex_to_bitmask(['0xnothex'])
+
+        # many codes at once
+        codes = [hexval, '0000000000000200', '  000DFFCE', '']
+        bitmask = hist.hex_to_bitmask(codes)
+        self.assertEqual(bitmask.dtype, np.uint64)
+        self.assertEqual(list(bitmask), [hist.hex_to_bitmask(code) for code in codes])
+        self.assertEqual(list(hist.bitmask_to_hex(bitmask)), [hist.bitmask_to_hex(b) for b in bitmask])
+        self.assertEqual(list(hist.bitmask_to_hex(bitmask, width=16)), [f'{int(b):016X}' for b in bitmask])
+        self.assertTrue(np.all(hist.bitmask_to_array(bitmask)[1] == hist.qc_array(codes[1])))
+
+        qcpf = hist.QCx.qc_tests(hexval, '0x200')
+        qcp, qcf = hist.QCx.bitmask(qcpf)
+        self.assertEqual((qcp, qcf), (2**63 + 2**4, 2**9))
+        self.assertTrue(np.all(hist.QCx.from_bitmask(qcp, qcf) == qcpf))
+        self.assertEqual(hist.QCx.array_to_hex(qcpf[0]), hexval)
+
+    def test_update_bitmask(self):
+        tests = list(range(1, 26)) + list(range(57, 64))
+        rng = np.random.default_rng(5)
+        for _ in range(100):
+            qcpf = hist.QCx.qc_tests(
+                hex(sum(2**t for t in tests if rng.random() < 0.3)),
+                hex(sum(2**t for t in tests if rng.random() < 0.3))
+            )
+            qcp, qcf = hist.QCx.bitmask(qcpf)
+            for test in rng.choice(tests, 5):
+                passfail = ['pass', 'fail'][rng.integers(2)]
+                hist.QCx.update_safely(qcpf, test, passfail)
+                qcp, qcf = hist.QCx.update_bitmask(qcp, qcf, test, passfail)
+            self.assertTrue(np.all(hist.QCx.from_bitmask(qcp, qcf) == qcpf))
+
+        # one result per profile
+        qcp, qcf = hist.QCx.update_bitmask([0, 2**9, 0], [0, 0, 2**9], 9, [False, False, True])
+        self.assertEqual(list(qcp), [0, 0, 0])
+        self.assertEqual(list(qcf), [2**9, 2**9, 2**9])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,75 @@
+
+import unittest
+import warnings
+import numpy as np
+from medsrtqc.qc.kernels import running_median, running_median_ragged
+from medsrtqc.batch import ProfileBatch
+from medsrtqc.vms import read_vms_profiles
+from medsrtqc.resources import resource_path
+
+
+def _reference_running_median(x, n):
+    # the per-window implementation previously used by the CHLA, BBP, and pH tests
+    ix = np.arange(n) + np.arange(len(x)-n+1)[:,None]
+    b = [row[row > 0] for row in x[ix]]
+    k = int(n/2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        med = [np.median(c) for c in b]
+    return np.array(k*[np.nan] + med + k*[np.nan])
+
+
+class TestKernels(unittest.TestCase):
+
+    def test_running_median(self):
+        np.testing.assert_array_equal(running_median([1, 5, 2, 0, 3], 3), [np.nan, 2, 3.5, 2.5, np.nan])
+        np.testing.assert_array_equal(running_median([1, -5, 2], 3, positive=False), [np.nan, 1, np.nan])
+        np.testing.assert_array_equal(running_median([1, 2], 3), [np.nan, np.nan])
+
+        # masked values are excluded
+        x = np.ma.MaskedArray([1, 100, 2, 3], mask=[False, True, False, False])
+        np.testing.assert_array_equal(running_median(x, 3), [np.nan, 1.5, 2.5, np.nan])
+
+    def test_running_median_reference(self):
+        rng = np.random.default_rng(1234)
+        for i in range(500):
+            n = int(rng.integers(2, 9))
+            x = rng.normal(size=rng.integers(0, 40)).astype([np.float32, np.float64][i % 2])
+            x[rng.random(len(x)) < 0.1] = np.nan
+            x[rng.random(len(x)) < 0.1] = 0
+            expected = _reference_running_median(x, n)
+            result = running_median(x, n)
+            self.assertEqual(result.dtype, expected.dtype)
+            np.testing.assert_array_equal(result, expected)
+
+        for profile in read_vms_profiles(resource_path('bgc_vms.dat')):
+            for k in ('FLU1', 'BBP$', 'PHTO'):
+                if k in profile.keys():
+                    x = profile[k].value
+                    np.testing.assert_array_equal(running_median(x, 5), _reference_running_median(x, 5))
+
+    def test_running_median_ragged(self):
+        profiles = read_vms_profiles(resource_path('bgc_vms.dat'))
+        batch = ProfileBatch.from_profiles(profiles)
+        column = batch.column('BBP$')
+        offsets = batch.offsets('BBP$')
+
+        result = running_median_ragged(column.value, offsets, 5)
+        self.assertEqual(len(result), len(column))
+        for i, profile in enumerate(profiles):
+            if 'BBP$' in profile.keys() and len(profile['BBP$']) >= 5:
+                np.testing.assert_array_equal(result[offsets[i]:offsets[i + 1]], running_median(profile['BBP$'].value, 5))
+
+        # windows do not span profiles
+        x = np.arange(1, 9)
+        np.testing.assert_array_equal(
+            running_median_ragged(x, [0, 2, 5, 8], 3),
+            [np.nan, np.nan, np.nan, 4, np.nan, np.nan, 7, np.nan]
+        )
+
+        with self.assertRaises(ValueError):
+            running_median_ragged(x, [0, 5], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
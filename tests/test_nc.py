@@ -2,11 +2,15 @@
 import unittest
 import os
 import tempfile
+import warnings
 import numpy as np
 from netCDF4 import Dataset
 from medsrtqc.resources import resource_path
-from medsrtqc.nc import read_nc_profile
+from medsrtqc.nc import read_nc_profile, iter_nc_profiles, read_ncstr, read_ncstr_array, _read_raw
+from medsrtqc.nc import SyntheticProfile, load
+from medsrtqc.convert import vms_to_nc
 from medsrtqc.core import Trace
+from medsrtqc.qc.history import QCx
 
 
 class TestNetCDFProfile(unittest.TestCase):
@@ -64,6 +68,305 @@ class TestNetCDFProfile(unittest.TestCase):
         finally:
             os.close(fd)
 
+    def test_variable_cache(self):
+        profile = read_nc_profile(resource_path('BD6903197_026.nc'))
+        bbp = profile['BBP700']
+        self.assertIn((0, 'PRES'), profile._cache._values)
+
+        # each call returns a copy that does not modify the cache
+        bbp.value[:] = 1
+        self.assertFalse(np.all(profile['BBP700'].value == 1))
+        self.assertIs(
+            profile._cached_trace_attrs('BBP700', 0, 4),
+            profile._cached_trace_attrs('BBP700', 0, 4)
+        )
+
+    def test_set_value_flush(self):
+        try:
+            fd, tmp = tempfile.mkstemp()
+            nc = resource_path('BD6903197_026.nc')
+            with open(tmp, 'wb') as dst, open(nc, 'rb') as src:
+                dst.write(src.read())
+            prof = read_nc_profile(tmp, mode='r+')
+
+            bbp = prof['BBP700']
+            bbp.qc[:] = b'4'
+            prof['BBP700'] = bbp
+            self.assertTrue(np.all(prof['BBP700'].qc == b'4'))
+
+            with self.assertRaises(ValueError):
+                prof['BBP700'] = Trace([1, 2, 3])
+
+            # writes are buffered until flush()
+            with Dataset(tmp) as ds:
+                self.assertFalse(np.all(ds['BBP700_QC'][4, :len(bbp)] == b'4'))
+            prof.flush()
+            with Dataset(tmp) as ds:
+                self.assertTrue(np.all(ds['BBP700_QC'][4, :len(bbp)] == b'4'))
+            prof.close()
+
+            prof = read_nc_profile(tmp)
+            self.assertTrue(np.all(prof['BBP700'].qc == b'4'))
+            prof.close()
+        finally:
+            os.close(fd)
+            os.unlink(tmp)
+
+    def test_save(self):
+        nc = resource_path('BD6903197_026.nc')
+        with open(nc, 'rb') as f:
+            content = f.read()
+
+        for src in (nc, content):
+            with tempfile.TemporaryDirectory() as tmp:
+                prof = read_nc_profile(src)
+                bbp = prof['BBP700']
+                bbp.qc[:] = b'4'
+                prof['BBP700'] = bbp
+
+                # read-only datasets keep changes for save()
+                with self.assertWarns(UserWarning):
+                    prof.flush()
+
+                dest = os.path.join(tmp, 'out.nc')
+                prof.save(dest)
+                self.assertEqual(os.listdir(tmp), ['out.nc'])
+                with warnings.catch_warnings():
+                    warnings.simplefilter('error')
+                    prof.close()
+
+                with open(nc, 'rb') as f:
+                    self.assertEqual(f.read(), content)
+
+                saved = read_nc_profile(dest)
+                self.assertTrue(np.all(saved['BBP700'].qc == b'4'))
+                self.assertTrue(np.all(saved['BBP700'].value == bbp.value))
+
+                # everything else is unchanged
+                with Dataset(nc) as original, Dataset(dest) as copy:
+                    original.set_auto_maskandscale(False)
+                    copy.set_auto_maskandscale(False)
+                    self.assertEqual(set(copy.variables), set(original.variables))
+                    self.assertEqual(copy.ncattrs(), original.ncattrs())
+                    for var in original.variables:
+                        if var != 'BBP700_QC':
+                            self.assertTrue(np.array_equal(copy[var][:], original[var][:], equal_nan=copy[var].dtype.kind == 'f'), var)
+                    self.assertFalse(np.array_equal(copy['BBP700_QC'][:], original['BBP700_QC'][:]))
+                saved.close()
+
+        prof = read_nc_profile(nc)
+        with self.assertRaises(ValueError):
+            prof.save(nc)
+
+    def test_raw(self):
+        for srcs in (['BD6903197_026.nc'], ['R6904117_085.nc', 'BD6903197_026.nc']):
+            srcs = [resource_path(src) for src in srcs]
+            profile = read_nc_profile(*srcs)
+            raw = read_nc_profile(*srcs, raw=True)
+            self.assertEqual(raw.keys(), profile.keys())
+            for k in profile.keys():
+                expected = profile[k]
+                trace = raw[k]
+                for attr in ('value', 'qc', 'adjusted', 'adjusted_qc', 'adjusted_error', 'pres', 'mtime'):
+                    a = getattr(expected, attr)
+                    b = getattr(trace, attr)
+                    self.assertEqual(a.shape, b.shape, k)
+                    self.assertTrue(np.array_equal(np.ma.getmaskarray(a), np.ma.getmaskarray(b)), k)
+                    self.assertTrue(np.array_equal(a.compressed(), b.compressed()), k)
+
+    def test_read_raw(self):
+        with Dataset('raw.nc', mode='w', diskless=True) as ds:
+            ds.createDimension('N', 5)
+            var = ds.createVariable('with_fill', 'f4', ('N', ), fill_value=99999)
+            var.valid_min = 0
+            var.valid_max = 10
+            var[:] = [1, 99999, -1, 11, 5]
+            ds.createVariable('default_fill', 'f8', ('N', ))[:2] = [1, 2]
+            var = ds.createVariable('nan_fill', 'f4', ('N', ), fill_value=np.nan)
+            var[:] = [np.nan, 1, 2, 3, 4]
+            var = ds.createVariable('valid_range', 'i4', ('N', ), fill_value=-1)
+            var.valid_range = [0, 2]
+            var[:] = [0, 1, 2, 3, -1]
+            ds.createVariable('chars', 'S1', ('N', ), fill_value=b' ')[:] = [b'A', b' ', b'B', b'C', b'D']
+            ds.createVariable('no_mask', 'f4', ('N', ))[:] = [1, 2, 3, 4, 5]
+            ds.createVariable('scaled', 'i2', ('N', ), fill_value=-1).scale_factor = 0.5
+            ds.createVariable('bytes', 'i1', ('N', ))[:] = [1, 2, 3, 4, 5]
+
+            for name, var in ds.variables.items():
+                expected = var[:]
+                raw = _read_raw(var)
+                self.assertTrue(np.array_equal(np.ma.getmaskarray(raw), np.ma.getmaskarray(expected)), name)
+                self.assertTrue(np.array_equal(raw.compressed(), expected.compressed()), name)
+                self.assertTrue(np.array_equal(raw.fill_value, expected.fill_value, equal_nan=name == 'nan_fill'), name)
+                # auto-masking is restored
+                self.assertTrue(var.mask)
+
+    def test_history_index(self):
+        profile = read_nc_profile(resource_path('BD6903197_026.nc'))
+        history = profile._cache.history_index(0)
+        self.assertEqual(set(history.keys()), {'CF', 'CV', 'QCF$', 'QCP$'})
+        i, p = history['QCP$'][0]
+        self.assertEqual(
+            profile.read_history_qc('QCP$'),
+            read_ncstr(profile._datasets[0]['HISTORY_QCTEST'][i, p, :])
+        )
+        self.assertIsNone(profile.read_history_qc('not an action'))
+        self.assertEqual(profile.read_platform_number(), ['6903197'])
+
+    def test_update_qcx(self):
+        profile = read_nc_profile(resource_path('BD6903197_026.nc'))
+        profile.prepare(tests=['some test'])
+        QCx.update_safely(profile.qc_tests, 62, 'pass')
+        QCx.update_safely(profile.qc_tests, 9, 'fail')
+        profile.update_qcx()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            profile.save(os.path.join(tmp, 'qcx.nc'))
+            saved = read_nc_profile(os.path.join(tmp, 'qcx.nc'))
+            self.assertEqual(saved.read_history_qc('QCP$'), f'{2 ** 62:016X}')
+            self.assertEqual(saved.read_history_qc('QCF$'), f'{2 ** 9:016X}')
+            saved.prepare(tests=['some test'])
+            self.assertTrue(np.all(saved.qc_tests == profile.qc_tests))
+            saved.close()
+
+    def test_save_by_cycle(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, 'profiles.nc')
+            vms_to_nc([resource_path('bgc_vms.dat')], src)
+            with open(src, 'rb') as f:
+                content = f.read()
+
+            # a file on disk and an in-memory dataset with several N_PROF per cycle
+            for dataset in (Dataset(src), load(content)):
+                self.addCleanup(dataset.close)
+                profiles = list(iter_nc_profiles(dataset, by_cycle=True))
+                bbp = profiles[1]['BBP700']
+                bbp.qc[:] = b'3'
+                profiles[1]['BBP700'] = bbp
+
+                dest = os.path.join(tmp, 'out.nc')
+                profiles[1].save(dest)
+                with Dataset(dest) as saved:
+                    saved_profiles = list(iter_nc_profiles(saved, by_cycle=True))
+                    self.assertEqual(len(saved_profiles), len(profiles))
+                    self.assertTrue(np.all(saved_profiles[1]['BBP700'].qc == b'3'))
+                    self.assertTrue(np.all(saved_profiles[1]['BBP700'].value == bbp.value))
+                    self.assertTrue(np.all(saved_profiles[0]['BBP700'].qc == profiles[0]['BBP700'].qc))
+                    self.assertFalse(np.all(profiles[0]['BBP700'].qc == b'3'))
+
+    def test_iter_nc_profiles(self):
+        # datasets that are passed in are not closed
+        dataset = Dataset(resource_path('BD6903197_026.nc'))
+        self.addCleanup(dataset.close)
+        profiles = list(iter_nc_profiles(dataset))
+        self.assertTrue(dataset.isopen())
+        self.assertEqual(len(profiles), 6)
+        self.assertIs(profiles[0]._cache, profiles[4]._cache)
+        self.assertEqual(profiles[1].keys(), ('PRES', ))
+        self.assertIn('BBP700', profiles[4].keys())
+        self.assertNotIn('BBP700', profiles[2].keys())
+
+        # traces come from the profile's own N_PROF
+        full = read_nc_profile(resource_path('BD6903197_026.nc'))
+        self.assertEqual(len(profiles[4]['PRES']), len(full['BBP700']))
+        self.assertEqual(len(profiles[0]['PRES']), len(full['PRES']))
+
+        profiles[4].prepare(tests=['some test'])
+        self.assertEqual(profiles[4].wmo, '6903197')
+        self.assertEqual(profiles[4].read_history_qc('QCP$'), full.read_history_qc('QCP$'))
+        self.assertEqual(profiles[4]._history_locations(0, 'QCP$'), [(1, 4)])
+
+        # all N_PROF of a single-cycle file are one profile
+        cycles = list(iter_nc_profiles(dataset, by_cycle=True))
+        self.assertEqual(len(cycles), 1)
+        self.assertEqual(cycles[0].keys(), full.keys())
+        self.assertEqual(cycles[0]._history_locations(0, 'QCP$'), full._history_locations(0, 'QCP$'))
+        self.assertTrue(np.all(cycles[0]['BBP700'].value == full['BBP700'].value))
+
+    def test_iter_nc_profiles_write(self):
+        try:
+            fd, tmp = tempfile.mkstemp()
+            nc = resource_path('BD6903197_026.nc')
+            with open(tmp, 'wb') as dst, open(nc, 'rb') as src:
+                dst.write(src.read())
+
+            for profile in iter_nc_profiles(tmp, mode='r+'):
+                if 'BBP700' in profile.keys():
+                    bbp = profile['BBP700']
+                    bbp.qc[:] = b'4'
+                    profile['BBP700'] = bbp
+                    profile.close()
+                    # datasets are shared with other profiles
+                    self.assertTrue(profile._datasets[0].isopen())
+
+            self.assertFalse(profile._datasets[0].isopen())
+            prof = read_nc_profile(tmp)
+            self.assertTrue(np.all(prof['BBP700'].qc == b'4'))
+            prof.close()
+        finally:
+            os.close(fd)
+            os.unlink(tmp)
+
+    def test_synthetic_profile(self):
+        profile = read_nc_profile(resource_path('R6904117_085.nc'), resource_path('BD6903197_026.nc'))
+        synthetic = SyntheticProfile(profile)
+        self.assertEqual(synthetic.keys(), profile.keys())
+        self.assertTrue(np.all(np.diff(synthetic.pres) > 0))
+
+        for k in ('TEMP', 'CHLA', 'UV_INTENSITY_NITRATE'):
+            source = profile[k]
+            trace = synthetic[k]
+            levels = synthetic.levels(k)
+            self.assertEqual(len(levels), len(source))
+            self.assertEqual(trace.value.shape[1:], source.value.shape[1:])
+            self.assertTrue(np.all(trace.pres == synthetic.pres))
+            self.assertTrue(np.all(synthetic.pres[levels] == source.pres))
+            # the last of repeated source pressures is used
+            last = len(levels) - 1 - np.unique(levels[::-1], return_index=True)[1]
+            self.assertTrue(np.all(trace.value[levels[last]] == source.value[last]))
+
+        # the alignment maps source arrays onto the merged levels
+        alignment = synthetic.alignment('CHLA')
+        chla = synthetic['CHLA']
+        mapped = alignment.take(profile['CHLA'].value)
+        self.assertTrue(np.all(mapped.mask == chla.value.mask))
+        self.assertTrue(np.all(mapped == chla.value))
+
+        # flags are written back to the source level used for each merged
+        # level; other levels with a repeated pressure are unchanged
+        levels = synthetic.levels('CHLA')
+        used = np.zeros(len(levels), dtype=bool)
+        used[alignment.index[alignment.index >= 0]] = True
+        self.assertTrue(np.any(~used & (levels >= 0)))
+        source = profile['CHLA']
+        chla.qc[~chla.value.mask] = b'4'
+        synthetic['CHLA'] = chla
+        self.assertTrue(np.all(profile['CHLA'].qc[used] == b'4'))
+        self.assertTrue(np.all(profile['CHLA'].qc[~used] == source.qc[~used]))
+        self.assertTrue(np.all(profile['CHLA'].value == source.value))
+        self.assertTrue(np.all(profile['TEMP'].qc == synthetic['TEMP'].qc.compressed()))
+
+        # only attributes that changed are written
+        dirty = [var for dataset_id, var in profile._cache._dirty.keys() if dataset_id == 1]
+        self.assertIn('CHLA_QC', dirty)
+        self.assertNotIn('CHLA', dirty)
+
+        with self.assertRaises(ValueError):
+            synthetic['CHLA'] = profile['CHLA']
+        with self.assertRaises(KeyError):
+            synthetic['NOT_A_PARAM'] = chla
+
+        subset = SyntheticProfile(profile, keys=['PRES', 'TEMP'])
+        self.assertEqual(len(subset.pres), len(profile['PRES']))
+
+    def test_read_ncstr(self):
+        chars = np.ma.array(
+            [[b'A', b'B', b' ', b''], [b' ', b'C', b'', b'']],
+            mask=[[False, False, False, True], [False, False, True, True]]
+        )
+        self.assertEqual(read_ncstr(chars[0]), 'AB')
+        self.assertTrue(np.all(read_ncstr_array(chars) == ['AB', 'C']))
+
     def test_dataset_file(self):
         nc_abspath = read_nc_profile(resource_path('BR6904117_085.nc'))
         self.assertIsInstance(nc_abspath._datasets[0], Dataset)
@@ -0,0 +1,76 @@
+import unittest
+import os
+import tempfile
+
+from medsrtqc.parameters import parameters, read_parameter_file, ParameterCatalog, Parameter
+from medsrtqc.vms.read import check_vms, translate_vms
+
+
+class TestParameters(unittest.TestCase):
+
+    def test_catalog(self):
+        self.assertEqual(parameters.vms_to_nc['FLU3'], 'CHLA')
+        self.assertEqual(parameters.nc_to_vms['BBP700'], 'BBP$')
+        self.assertEqual(parameters['PHTO'].nc, 'PH_IN_SITU_TOTAL')
+        self.assertIs(parameters['PH_IN_SITU_TOTAL'], parameters['PHTO'])
+        self.assertEqual(parameters.valid_range('FLU1'), (-0.1, 50.0))
+        self.assertEqual(parameters.valid_range('DOXY'), (None, None))
+        self.assertIn('VREF', parameters)
+        self.assertEqual(parameters.vms_to_nc['TEMP'], 'TEMP')
+        self.assertNotIn('PRES', parameters)
+        with self.assertRaises(KeyError):
+            parameters['not a parameter']
+
+        self.assertEqual(parameters.test_keys['chla'], frozenset(['FLU1', 'CHLA']))
+        self.assertEqual(
+            [p.vms for p in parameters.for_test('radiometry')],
+            ['P380', 'P412', 'P443', 'P490', 'PAR$']
+        )
+
+        # mappings are read-only
+        with self.assertRaises(TypeError):
+            parameters.vms_to_nc['FLU3'] = 'something else'
+
+    def test_test_keys(self):
+        # the keys that selected each test before the catalog existed; the
+        # NetCDF pH key was checked as 'PH_IN_SITU', which no profile has
+        trigger_keys = {
+            'chla': ['FLU1', 'CHLA'],
+            'bbp': ['BBP$', 'BBP700'],
+            'ph': ['PHPH'],
+            'radiometry': ['P380', 'P412', 'P443', 'P490', 'PAR$']
+        }
+        for test, keys in trigger_keys.items():
+            self.assertEqual(parameters.test_keys[test], frozenset(keys))
+
+    def test_vms_translation(self):
+        self.assertTrue(check_vms('VREF'))
+        self.assertTrue(check_vms('PHPH'))
+        self.assertFalse(check_vms('PRES'))
+        # core parameters have the same VMS code and NetCDF name
+        self.assertEqual(translate_vms('TEMP'), 'TEMP')
+        self.assertEqual(translate_vms('FLU1'), 'FLUORESCENCE_CHLA')
+        with self.assertRaises(KeyError):
+            translate_vms('VREF')
+
+    def test_read_parameter_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'parameters.csv')
+            with open(path, 'w') as f:
+                f.write('vms,nc,units,valid_min,valid_max,vms_tests,nc_tests\n')
+                f.write('ABCD,SOME_PARAM,m,0,1,test1 test2,\n\n')
+
+            catalog = read_parameter_file(path)
+            self.assertEqual(len(catalog), 1)
+            self.assertEqual(catalog['SOME_PARAM'].vms_tests, ('test1', 'test2'))
+            self.assertEqual(catalog.test_keys['test2'], frozenset(['ABCD']))
+
+        with self.assertRaises(ValueError):
+            ParameterCatalog([
+                Parameter('ABCD', None, None, None, None, (), ()),
+                Parameter('ABCD', None, None, None, None, (), ())
+            ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,6 +27,75 @@ class TestFlag(unittest.TestCase):
         Flag.update_safely(qc, to=Flag.BAD, where=np.array([False, True, False]))
         self.assertTrue(np.all(qc == np.array([Flag.GOOD, Flag.BAD, Flag.MISSING])))
 
+        # masked flags are not modified
+        qc = np.ma.MaskedArray([Flag.NO_QC, Flag.NO_QC], mask=[True, False])
+        Flag.update_safely(qc, to=Flag.GOOD)
+        self.assertTrue(np.all(qc.data == np.array([Flag.NO_QC, Flag.GOOD])))
+        self.assertTrue(np.all(qc.mask == np.array([True, False])))
+
+        with self.assertRaises(KeyError):
+            Flag.update_safely(qc, to=Flag.FILL_VALUE)
+
+    def test_codes(self):
+        self.assertEqual(Flag.code(Flag.BAD), ord('4'))
+        self.assertEqual(Flag.code(Flag.FILL_VALUE), 0)
+
+        trace = Trace([1, 2, 3], qc=[Flag.NO_QC, Flag.GOOD, Flag.FILL_VALUE])
+        codes = Flag.codes(trace.qc)
+        self.assertEqual(codes.dtype, np.uint8)
+        self.assertTrue(np.all(codes == [ord('0'), ord('1'), 0]))
+        self.assertTrue(np.all(Flag.from_codes(codes) == trace.qc))
+
+        # codes are a view of the flags
+        codes[0] = Flag.code(Flag.BAD)
+        self.assertEqual(trace.qc[0], Flag.BAD)
+
+        # uint8 codes can be updated directly
+        Flag.update_safely(codes, Flag.PROBABLY_BAD)
+        self.assertTrue(np.all(trace.qc == [Flag.BAD, Flag.PROBABLY_BAD, Flag.PROBABLY_BAD]))
+
+        qc = np.ma.MaskedArray([Flag.BAD, Flag.BAD, Flag.GOOD], mask=[False, True, False])
+        self.assertTrue(np.all(Flag.isin(qc, Flag.BAD) == [True, False, False]))
+        self.assertTrue(np.all(Flag.isin(qc, [Flag.GOOD, Flag.BAD]) == [True, False, True]))
+
+    def test_update_absent(self):
+        # flags of a Trace that was created without them
+        trace = Trace([1, 2, 3])
+        Flag.update_safely(trace.adjusted_qc, Flag.GOOD)
+        self.assertTrue(np.all(trace.adjusted_qc.mask))
+        Flag.update_many(trace.qc, [(Flag.BAD, [True, False, False])])
+        self.assertTrue(np.all(trace.qc.mask))
+
+        trace = Trace([1, 2, 3], storage='plain')
+        Flag.update_safely(trace.qc, Flag.GOOD, where=[True, True, False])
+        self.assertTrue(np.all(trace.qc == [Flag.GOOD, Flag.GOOD, Flag.FILL_VALUE]))
+        Flag.update_many(trace.adjusted_qc, [(Flag.BAD, None)])
+        self.assertTrue(np.all(trace.adjusted_qc == Flag.BAD))
+
+        # read-only views are still read-only
+        prof = Profile({'TEMP': Trace([1, 2, 3])})
+        with self.assertRaises(ValueError):
+            Flag.update_safely(prof['TEMP'].qc, Flag.GOOD)
+
+    def test_update_many(self):
+        rng = np.random.default_rng(2)
+        flags = list(Flag._names.keys())
+        targets = list(Flag._precedence.keys())
+        for _ in range(200):
+            qc = np.array([flags[i] for i in rng.integers(0, len(flags), 20)], dtype='S1')
+            updates = [(targets[i], rng.random(20) < 0.5) for i in rng.integers(0, len(targets), 4)]
+            updates.append((Flag.PROBABLY_BAD, None))
+
+            expected = qc.copy()
+            for to, where in updates:
+                Flag.update_safely(expected, to, where)
+            Flag.update_many(qc, updates)
+            self.assertTrue(np.all(qc == expected))
+
+        qc = np.array([Flag.NO_QC, Flag.NO_QC, Flag.GOOD])
+        Flag.update_many(qc, [])
+        self.assertTrue(np.all(qc == np.array([Flag.NO_QC, Flag.NO_QC, Flag.GOOD])))
+
 
 class TestUtil(unittest.TestCase):
 
@@ -103,6 +172,12 @@ class TestPressureIncreasingTest(unittest.TestCase):
         self.assertTrue(np.all(prof['TEMP'].qc == qc_expected))
         self.assertTrue(np.all(prof['PSAL'].qc == qc_expected))
 
+    def test_no_qc(self):
+        pres = [0, 50, 0, 50, 100]
+        prof = Profile({k: Trace([10, 5, 7, 7, 7], pres=pres) for k in ('PRES', 'TEMP', 'PSAL')})
+        prof['PRES'] = Trace(pres, pres=pres)
+        self.assertFalse(tests.PressureIncreasingTest().run(prof))
+
     def test_running_maximum(self):
         qc5 = np.repeat([Flag.NO_QC], 5)
         pres =  Trace([0, 50, 0, 50, 100], qc=qc5)
@@ -0,0 +1,242 @@
+
+import unittest
+import os
+import tempfile
+import threading
+import urllib.error
+from unittest import mock
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from medsrtqc import remote
+from medsrtqc.remote import ConnectionPool, URLCache, fetch, prefetch
+from medsrtqc.nc import read_nc_profile
+from medsrtqc.resources import resource_path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    def do_GET(self, send_body=True):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address, dict(self.headers), self.command))
+
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', '/files/a.nc')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        name = self.path.split('/')[-1]
+        if name not in server.files:
+            self.send_error(404)
+            return
+
+        content, etag = server.files[name]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        range_header = self.headers.get('Range')
+        if range_header:
+            start, end = range_header[len('bytes='):].split('-')
+            start = int(start)
+            end = int(end) if end else len(content) - 1
+            body = content[start:(end + 1)]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(content)))
+        else:
+            body = content
+            self.send_response(200)
+
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+            with server.lock:
+                server.bytes_sent += len(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRemote(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.files = {}
+        self.server.requests = []
+        self.server.bytes_sent = 0
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base = 'http://127.0.0.1:{}/files/'.format(self.server.server_address[1])
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        remote._default_pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_pool(self):
+        self.server.files['a.nc'] = (b'abc', '"1"')
+        self.assertEqual(self.pool.request(self.base + 'a.nc').body, b'abc')
+        self.assertEqual(self.pool.request(self.base + 'a.nc').body, b'abc')
+
+        # the second request reuses the connection
+        clients = [item[1] for item in self.server.requests]
+        self.assertEqual(clients[0], clients[1])
+
+        response = self.pool.request(self.base.replace('files/', 'redirect'))
+        self.assertEqual(response.url, self.base + 'a.nc')
+        self.assertEqual(response.body, b'abc')
+
+        with self.assertRaises(urllib.error.HTTPError):
+            self.pool.request(self.base + 'not_a_file.nc')
+        with self.assertRaises(ValueError):
+            self.pool.request('file:///not/a/server')
+
+    def test_proxy(self):
+        self.server.files['a.nc'] = (b'abc', '"1"')
+        proxy = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        env = {k: v for k, v in os.environ.items() if k.lower() not in ('http_proxy', 'no_proxy')}
+        env['http_proxy'] = proxy
+
+        with mock.patch.dict(os.environ, env, clear=True):
+            # the test server also answers requests sent to it as a proxy
+            url = 'http://medsrtqc.invalid/files/a.nc'
+            response = self.pool.request(url)
+            self.assertEqual(response.body, b'abc')
+            self.assertEqual(self.server.requests[-1][0], url)
+
+            cache = URLCache(self.tmp.name, pool=self.pool)
+            cache.fetch(url)
+            self.assertEqual(cache.fetch(url), cache.cached_path(url))
+            self.assertEqual(self.server.requests[-1][2].get('If-None-Match'), '"1"')
+
+            with self.assertRaises(urllib.error.HTTPError):
+                self.pool.request('http://medsrtqc.invalid/files/not_a_file.nc')
+
+            # hosts listed in no_proxy are requested directly
+            os.environ['no_proxy'] = '127.0.0.1'
+            self.pool.request(self.base + 'a.nc')
+            self.assertEqual(self.server.requests[-1][0], '/files/a.nc')
+
+    def test_cache_revalidation(self):
+        self.server.files['a.nc'] = (b'abc', '"1"')
+        cache = URLCache(self.tmp.name, pool=self.pool)
+
+        path = cache.fetch(self.base + 'a.nc')
+        self.assertEqual(cache.cached_path(self.base + 'a.nc'), path)
+        self.assertEqual(cache.fetch(self.base + 'a.nc'), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'abc')
+        self.assertEqual(self.server.requests[-1][2].get('If-None-Match'), '"1"')
+        self.assertEqual(len(self.server.requests), 2)
+
+        # changed on the server
+        self.server.files['a.nc'] = (b'abcd', '"2"')
+        self.assertEqual(fetch(self.base + 'a.nc', cache=cache), b'abcd')
+
+        # no revalidation within max_age
+        cache.max_age = 60
+        self.assertEqual(fetch(self.base + 'a.nc', cache=cache), b'abcd')
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.assertEqual(fetch(self.base + 'a.nc'), b'abcd')
+        self.assertIsNone(cache.cached_path(self.base + 'b.nc'))
+
+    def test_cache_eviction(self):
+        for name in ('a.nc', 'b.nc', 'c.nc'):
+            self.server.files[name] = (b'0123456789', '"' + name + '"')
+        cache = URLCache(self.tmp.name, max_size=25, pool=self.pool)
+
+        cache.fetch(self.base + 'a.nc')
+        cache.fetch(self.base + 'b.nc')
+        a_path = cache.cached_path(self.base + 'a.nc')
+        os.utime(a_path, (0, 0))
+        cache.fetch(self.base + 'c.nc')
+
+        # a.nc is the least-recently used
+        self.assertIsNone(cache.cached_path(self.base + 'a.nc'))
+        self.assertIsNotNone(cache.cached_path(self.base + 'b.nc'))
+        self.assertEqual(cache.size(), 20)
+        self.assertFalse([f for f in os.listdir(self.tmp.name) if f.endswith('.tmp')])
+
+        cache.clear()
+        self.assertEqual(cache.size(), 0)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+        # files that were just downloaded are kept even if they don't fit
+        cache.max_size = 5
+        path = cache.fetch(self.base + 'a.nc')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(fetch(self.base + 'b.nc', cache=cache), b'0123456789')
+
+        cache.max_size = 15
+        paths = prefetch([self.base + name for name in ('a.nc', 'b.nc', 'c.nc')], cache=cache)
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        cache.evict()
+        self.assertEqual(cache.size(), 10)
+
+    def test_prefetch(self):
+        urls = [self.base + '{}.nc'.format(i) for i in range(10)]
+        for i in range(10):
+            self.server.files['{}.nc'.format(i)] = (str(i).encode(), '"{}"'.format(i))
+        cache = URLCache(self.tmp.name, pool=self.pool)
+
+        paths = prefetch(urls, workers=4, cache=cache)
+        self.assertEqual(paths, [cache.cached_path(url) for url in urls])
+        with open(paths[3], 'rb') as f:
+            self.assertEqual(f.read(), b'3')
+
+        with self.assertRaises(ValueError):
+            prefetch(urls, cache=None)
+
+    def test_read_nc_profile(self):
+        with open(resource_path('BD6903197_026.nc'), 'rb') as f:
+            self.server.files['BD6903197_026.nc'] = (f.read(), '"1"')
+        url = self.base + 'BD6903197_026.nc'
+
+        profile = read_nc_profile(url, cache=self.tmp.name)
+        self.assertIn('BBP700', profile.keys())
+        self.assertIsNotNone(URLCache(self.tmp.name).cached_path(url))
+        self.assertEqual(len(read_nc_profile(url)['BBP700']), len(profile['BBP700']))
+
+    def test_read_nc_profile_byte_range(self):
+        nc = resource_path('BD6903197_026.nc')
+        with open(nc, 'rb') as f:
+            content = f.read()
+        self.server.files['BD6903197_026.nc'] = (content, '"1"')
+        url = self.base + 'BD6903197_026.nc'
+
+        profile = read_nc_profile(url, byte_range=True)
+        bbp = profile['BBP700']
+        expected = read_nc_profile(nc)['BBP700']
+        self.assertTrue(np.all(bbp.value == expected.value))
+        self.assertTrue(np.all(bbp.qc == expected.qc))
+        profile.close()
+
+        # only some of the file was requested
+        self.assertTrue(all('Range' in item[2] for item in self.server.requests if item[3] == 'GET'))
+        self.assertLess(self.server.bytes_sent, len(content))
+
+        with self.assertRaises(ValueError):
+            read_nc_profile(url, mode='r+', byte_range=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import pickle
+import numpy as np
+
+from medsrtqc.core import Trace, Profile
+from medsrtqc.serialize import dumps, loads, to_buffers, from_buffers, Packed, SerializationError
+from medsrtqc.resources import resource_path
+from medsrtqc.vms import read_vms_profiles
+from medsrtqc.nc import read_nc_profile
+from medsrtqc.qc.bbp import bbpTest
+
+
+class TestSerialize(unittest.TestCase):
+
+    def assertTracesEqual(self, a, b):
+        self.assertEqual(a.storage, b.storage)
+        for attr in ('value', 'qc', 'adjusted', 'adjusted_error', 'adjusted_qc', 'pres', 'mtime'):
+            x, y = getattr(a, attr), getattr(b, attr)
+            self.assertEqual(x.dtype, y.dtype)
+            self.assertTrue(np.all(np.ma.getmaskarray(x) == np.ma.getmaskarray(y)))
+            self.assertTrue(np.array_equal(np.ma.getdata(x), np.ma.getdata(y), equal_nan=x.dtype.kind == 'f'))
+            self.assertEqual(getattr(a, '_' + attr) is None, getattr(b, '_' + attr) is None)
+
+    def test_trace(self):
+        trace = Trace(
+            np.ma.array([1, 2, 3], mask=[False, True, False]),
+            qc=[b'1', b'4', b'1'],
+            pres=[0, 1, 2]
+        )
+        self.assertTracesEqual(loads(dumps(trace)), trace)
+        self.assertTracesEqual(loads(dumps(trace, pack_masks=False)), trace)
+        self.assertTracesEqual(loads(dumps(Trace([]))), Trace([]))
+
+        plain = trace.with_storage('plain')
+        self.assertTracesEqual(loads(dumps(plain)), plain)
+
+        # arrays are views of the serialized data
+        data = bytearray(dumps(trace))
+        roundtrip = loads(data)
+        roundtrip.qc[0] = b'3'
+        self.assertEqual(loads(data).qc[0], b'3')
+        with self.assertRaises(ValueError):
+            loads(bytes(data)).qc[0] = b'3'
+
+    def test_profile(self):
+        profile = read_vms_profiles(resource_path('bgc_vms.dat'))[0]
+        profile.prepare(tests=[bbpTest()])
+
+        roundtrip = loads(dumps(profile))
+        self.assertIsInstance(roundtrip, Profile)
+        self.assertEqual(roundtrip.keys(), profile.keys())
+        for k in profile.keys():
+            self.assertTracesEqual(roundtrip[k], profile[k])
+
+        for attr in ('wmo', 'cycle_number', 'direction', 'parking_pres', 'latitude', 'longitude'):
+            self.assertEqual(getattr(roundtrip, attr), getattr(profile, attr))
+        self.assertTrue(np.all(roundtrip.qc_tests == profile.qc_tests))
+        roundtrip.qc_tests[0, 0] = 1
+
+        profile = Profile({'TEMP': Trace([1, 2])}, {'some_meta': np.int32(5)})
+        self.assertEqual(loads(dumps(profile)).meta('some_meta'), 5)
+
+        header, buffers = to_buffers(profile)
+        self.assertTracesEqual(from_buffers(header, buffers)['TEMP'], profile['TEMP'])
+
+    def test_nc_profile(self):
+        profile = read_nc_profile(resource_path('R6904117_085.nc'), resource_path('BD6903197_026.nc'))
+        profile.prepare()
+        self.addCleanup(profile.close)
+
+        # attributes have one value per file
+        roundtrip = loads(dumps(profile))
+        self.assertEqual(roundtrip.cycle_number, [85, 26])
+        self.assertEqual(roundtrip.wmo, ['6904117', '6903197'])
+        for k in profile.keys():
+            self.assertTracesEqual(roundtrip[k], profile[k])
+
+        profile.cycle_number = [np.int32(85), np.ma.masked]
+        profile.parking_pres = (np.float32(1000), b'1000')
+        roundtrip = loads(dumps(profile))
+        self.assertEqual(roundtrip.cycle_number, [85, None])
+        self.assertEqual(roundtrip.parking_pres, [1000.0, '1000'])
+
+    def test_pickle(self):
+        trace = Trace([1, 2, 3], adjusted=[4, 5, 6])
+        buffers = []
+        data = pickle.dumps(Packed(trace), protocol=5, buffer_callback=buffers.append)
+        self.assertEqual(len(buffers), 2)
+        self.assertTracesEqual(pickle.loads(data, buffers=buffers).unpack(), trace)
+        self.assertTracesEqual(pickle.loads(pickle.dumps(Packed(trace), protocol=4)).unpack(), trace)
+
+    def test_errors(self):
+        data = dumps(Trace([1, 2, 3]))
+        with self.assertRaises(SerializationError):
+            loads(b'not serialized data')
+        with self.assertRaises(SerializationError):
+            loads(b'x' * len(data))
+        with self.assertRaises(SerializationError):
+            loads(data[:-4])
+        with self.assertRaises(SerializationError):
+            from_buffers(b'{"version": 1000}', [])
+        with self.assertRaises(TypeError):
+            dumps('not a trace')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import sys
+import subprocess
+import multiprocessing
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import medsrtqc
+from medsrtqc.core import Trace, Profile
+from medsrtqc.batch import ProfileBatch
+from medsrtqc.shm import SharedObject, SharedProfile, QCStatus, attach, run_qc
+from medsrtqc.resources import resource_path
+from medsrtqc.vms import read_vms_profiles
+from medsrtqc.qc.bbp import bbpTest
+from medsrtqc.qc.operation import QCOperationContext
+
+
+# quiet context for testing
+class TestContext(QCOperationContext):
+    def log(self, *args, **kwargs):
+        pass
+
+
+class TestShm(unittest.TestCase):
+
+    def test_attach(self):
+        profile = Profile({'TEMP': Trace([1, 2, 3], qc=[b'1', b'1', b'1'], pres=[0, 1, 2])})
+        with SharedObject(profile) as shared:
+            with attach(shared.handle) as attached:
+                self.assertIsInstance(attached, SharedProfile)
+                trace = attached.copy('TEMP')
+                trace.qc[1] = b'4'
+                trace.adjusted[2] = 5
+                attached['TEMP'] = trace
+
+                with self.assertRaises(KeyError):
+                    attached['PSAL'] = trace
+                with self.assertRaises(ValueError):
+                    attached['TEMP'] = Trace([1, 2])
+                del attached, trace
+
+            # modifications are visible to the owner
+            self.assertTrue(np.all(shared.value['TEMP'].qc == [b'1', b'4', b'1']))
+            self.assertTrue(np.all(shared.value['TEMP'].adjusted.mask == [True, True, False]))
+
+            shared.write_back(profile)
+            self.assertEqual(profile['TEMP'].qc[1], b'4')
+            self.assertEqual(profile['TEMP'].adjusted[2], 5)
+
+        with self.assertRaises(ValueError):
+            shared.value
+        with self.assertRaises(FileNotFoundError):
+            with attach(shared.handle):
+                pass
+
+    def test_run_qc(self):
+        profile = read_vms_profiles(resource_path('bgc_vms.dat'))[0]
+        tests = profile.prepare(tests=[bbpTest()])
+
+        expected = read_vms_profiles(resource_path('bgc_vms.dat'))[0]
+        expected.prepare(tests=[bbpTest()])
+        bbpTest().run(expected, context=TestContext())
+
+        with SharedObject(profile) as shared, ProcessPoolExecutor(1) as pool:
+            status = pool.submit(run_qc, shared.handle, tests).result()
+            self.assertIsInstance(status, QCStatus)
+            self.assertEqual(status.modified, ['BBP$'])
+            self.assertTrue(len(status.logs) > 0)
+            shared.write_back(profile, status)
+
+        self.assertTrue(np.all(profile['BBP$'].qc == expected['BBP$'].qc))
+        self.assertTrue(np.all(profile.qc_tests == expected.qc_tests))
+
+    def test_run_qc_spawn(self):
+        profile = read_vms_profiles(resource_path('bgc_vms.dat'))[0]
+        tests = profile.prepare(tests=[bbpTest()])
+
+        context = multiprocessing.get_context('spawn')
+        with SharedObject(profile) as shared:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                status = pool.submit(run_qc, shared.handle, tests).result()
+
+            # the segment outlives the worker
+            with attach(shared.handle) as attached:
+                self.assertTrue(np.all(attached['BBP$'].qc != b'0'))
+                del attached
+            shared.write_back(profile, status)
+
+        with self.assertRaises(FileNotFoundError):
+            with attach(shared.handle):
+                pass
+
+    def test_attach_other_process(self):
+        profile = Profile({'TEMP': Trace([1, 2, 3], pres=[0, 1, 2])})
+        code = '\n'.join([
+            'import sys',
+            'from multiprocessing import shared_memory',
+            'from medsrtqc.shm import SharedHandle, attach',
+            'if sys.argv[4] == "1":',
+            '    # start this process\'s resource tracker before attaching',
+            '    own = shared_memory.SharedMemory(create=True, size=1)',
+            '    own.close()',
+            '    own.unlink()',
+            'with attach(SharedHandle(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))) as attached:',
+            '    print(len(attached["TEMP"]))',
+            '    del attached',
+        ])
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(medsrtqc.__file__)), env.get('PYTHONPATH', '')])
+
+        with SharedObject(profile) as shared:
+            for tracker_running in ('0', '1'):
+                result = subprocess.run(
+                    [sys.executable, '-c', code, shared.handle.name, str(shared.handle.size),
+                     str(shared.handle.owner), tracker_running],
+                    env=env, capture_output=True, text=True, check=True
+                )
+                self.assertEqual(result.stdout.strip(), '3')
+                self.assertNotIn('leaked', result.stderr)
+
+                # an unrelated process doesn't unlink the segment when it exits
+                with attach(shared.handle) as attached:
+                    self.assertEqual(len(attached['TEMP']), 3)
+                    del attached
+
+    def test_run_qc_batch(self):
+        profiles = read_vms_profiles(resource_path('bgc_vms.dat'))[:2]
+        for profile in profiles:
+            profile.prepare(tests=[bbpTest()])
+            reset = profile.copy('BBP$')
+            reset.qc[:] = b'0'
+            profile['BBP$'] = reset
+
+        batch = ProfileBatch.from_profiles(profiles)
+        with SharedObject(batch) as shared:
+            status = run_qc(shared.handle, [bbpTest()])
+            self.assertEqual(status.modified, [(0, 'BBP$'), (1, 'BBP$')])
+            self.assertEqual(status.qc_tests.shape, (2, 2, 32))
+            shared.write_back(profiles, status)
+
+        for profile in profiles:
+            self.assertFalse(np.any(profile['BBP$'].qc == b'0'))
+
+        with SharedObject(Trace([1, 2, 3])) as shared:
+            with self.assertRaises(TypeError):
+                run_qc(shared.handle, [])
+
+
+if __name__ == '__main__':
+    unittest.main()